@@ -0,0 +1,82 @@
+from collections import deque
+from twisted.internet import reactor
+
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class AckBatcher(object):
+    """
+    Collects completed delivery tags and acknowledges them with a single
+    basic_ack(multiple=True) once max_pending of them have accumulated or
+    max_delay seconds have passed.  A tag is only covered by a multiple ack
+    after every tag delivered before it has been settled, so completions that
+    arrive out of order are held back until the lowest outstanding tag
+    finishes.
+
+    With max_pending <= 1 every tag is acknowledged individually as soon as
+    it completes.
+    """
+    def __init__(self, ack, max_pending, max_delay, clock=reactor):
+        self.ack = ack
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.clock = clock
+
+        self._delivered = deque()
+        self._settled = {}
+        self._ack_tag = None
+        self._pending = 0
+        self._delayed_call = None
+
+    @property
+    def enabled(self):
+        return self.max_pending > 1
+
+    def delivered(self, tag):
+        if self.enabled:
+            self._delivered.append(tag)
+
+    def acknowledge(self, tag):
+        if self.enabled:
+            self._settle(tag, True)
+        else:
+            self.ack(tag, multiple=False)
+
+    def rejected(self, tag):
+        # The caller has already sent basic_reject for this tag; it only
+        # needs to stop holding back later acks.
+        if self.enabled:
+            self._settle(tag, False)
+
+    def flush(self):
+        if self._delayed_call is not None:
+            if self._delayed_call.active():
+                self._delayed_call.cancel()
+            self._delayed_call = None
+
+        if self._pending:
+            LOG.debug('Acking %d messages up to (%s)',
+                    self._pending, self._ack_tag)
+            tag = self._ack_tag
+            self._ack_tag = None
+            self._pending = 0
+            self.ack(tag, multiple=True)
+
+    def _settle(self, tag, acked):
+        self._settled[tag] = acked
+        while self._delivered and self._delivered[0] in self._settled:
+            head = self._delivered.popleft()
+            if self._settled.pop(head):
+                # Only ever ack up to a tag we acked ourselves; rejected tags
+                # are already gone from the broker.
+                self._ack_tag = head
+                self._pending += 1
+
+        if self._pending >= self.max_pending:
+            self.flush()
+        elif self._pending and self._delayed_call is None:
+            self._delayed_call = self.clock.callLater(self.max_delay,
+                    self.flush)
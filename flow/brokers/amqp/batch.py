@@ -0,0 +1,44 @@
+from flow.protocol.exceptions import InvalidMessageException
+
+import struct
+
+
+# AMQP message type used to mark a body as a batch envelope
+BATCH_MESSAGE_TYPE = 'flow.batch'
+
+_LENGTH = struct.Struct('>I')
+
+
+def encode_batch(encoded_messages):
+    """
+    Pack already encoded messages into a single body.  Each message is
+    prefixed with its length as a 4 byte unsigned big-endian integer.
+    """
+    parts = []
+    for encoded_message in encoded_messages:
+        parts.append(_LENGTH.pack(len(encoded_message)))
+        parts.append(encoded_message)
+    return ''.join(parts)
+
+
+def decode_batch(body):
+    """
+    Inverse of encode_batch.  Raises InvalidMessageException if the body is
+    truncated.
+    """
+    encoded_messages = []
+    offset = 0
+    while offset < len(body):
+        if offset + _LENGTH.size > len(body):
+            raise InvalidMessageException('Truncated batch length prefix '
+                    'at offset %d' % offset)
+        (length,) = _LENGTH.unpack_from(body, offset)
+        offset += _LENGTH.size
+
+        if offset + length > len(body):
+            raise InvalidMessageException('Truncated batch entry at offset '
+                    '%d (expected %d bytes)' % (offset, length))
+        encoded_messages.append(body[offset:offset + length])
+        offset += length
+
+    return encoded_messages
@@ -14,7 +14,7 @@ LOG = logging.getLogger(__name__)
 @inject(connection_manager=ConnectionManager)
 class ChannelFacade(object):
     def __init__(self):
-        self._publish_properties = pika.BasicProperties(delivery_mode=2)
+        self._publish_properties = {}
 
         self._pika_channel = None
         self._publisher_confirm_manager = None
@@ -47,29 +47,45 @@ class ChannelFacade(object):
                 durable=durable, exchange_type=exchange_type,
                 **other_properties)
 
-    def basic_publish(self, exchange_name, routing_key, encoded_message):
+    def basic_publish(self, exchange_name, routing_key, encoded_message,
+            message_type=None, content_type=None):
         connect_deferred = self.connect()
         confirm_deferred = defer.Deferred()
         connect_deferred.addCallback(self._basic_publish,
                 confirm_deferred=confirm_deferred, exchange_name=exchange_name,
-                routing_key=routing_key, encoded_message=encoded_message)
+                routing_key=routing_key, encoded_message=encoded_message,
+                message_type=message_type, content_type=content_type)
         return confirm_deferred
 
     def _basic_publish(self, _, confirm_deferred, exchange_name, routing_key,
-            encoded_message):
+            encoded_message, message_type=None, content_type=None):
+        properties = self._get_publish_properties(message_type, content_type)
+
         self._last_publish_tag += 1
         self._pika_channel.basic_publish(exchange=exchange_name,
                 routing_key=routing_key,
                 body=encoded_message,
-                properties=self._publish_properties)
+                properties=properties)
         self._publisher_confirm_manager.add_confirm_deferred(self._last_publish_tag,
                 confirm_deferred)
 
+    def _get_publish_properties(self, message_type, content_type):
+        key = (message_type, content_type)
+        if key not in self._publish_properties:
+            self._publish_properties[key] = pika.BasicProperties(
+                    delivery_mode=2, type=message_type,
+                    content_type=content_type)
+        return self._publish_properties[key]
+
     def basic_consume(self, *args, **kwargs):
         return self._pika_channel.basic_consume(*args, **kwargs)
 
-    def basic_ack(self, recieve_tag):
-        return self._pika_channel.basic_ack(recieve_tag)
+    def basic_qos(self, prefetch_count, all_channels=False):
+        return self._pika_channel.basic_qos(prefetch_count=prefetch_count,
+                all_channels=all_channels)
+
+    def basic_ack(self, recieve_tag, multiple=False):
+        return self._pika_channel.basic_ack(recieve_tag, multiple=multiple)
 
     def basic_reject(self, recieve_tag, requeue=False):
         return self._pika_channel.basic_reject(recieve_tag, requeue=requeue)
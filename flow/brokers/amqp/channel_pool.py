@@ -0,0 +1,68 @@
+from flow.brokers.amqp.channel_facade import ChannelFacade
+from flow.brokers.amqp.connection_manager import ConnectionManager
+from flow.configuration.settings.injector import setting
+from injector import inject
+
+import itertools
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+@inject(connection_manager=ConnectionManager,
+        publish_channel_count=setting('amqp.publish_channels', 0),
+        dedicated_consume_channels=setting(
+            'amqp.dedicated_consume_channels', False))
+class ChannelPool(object):
+    """
+    Hands out ChannelFacades for the broker.  The primary channel is used
+    for declarations and, by default, for everything else as well.
+
+    With amqp.publish_channels > 0, publishes are spread round-robin over
+    that many extra channels, each with its own publisher confirm manager.
+    With amqp.dedicated_consume_channels, every handler queue is consumed
+    (and acked) on a channel of its own.
+    """
+    def __init__(self):
+        self.primary = ChannelFacade(connection_manager=self.connection_manager)
+
+        if self.publish_channel_count > 0:
+            self.publish_channels = [self._new_channel()
+                    for i in xrange(self.publish_channel_count)]
+        else:
+            self.publish_channels = [self.primary]
+        self._publish_cycle = itertools.cycle(self.publish_channels)
+
+        self.consume_channels = {}
+
+    def publish_channel(self):
+        return next(self._publish_cycle)
+
+    def consume_channel(self, queue_name):
+        if not self.dedicated_consume_channels:
+            return self.primary
+
+        if queue_name not in self.consume_channels:
+            LOG.debug('Opening dedicated channel for queue (%s)', queue_name)
+            self.consume_channels[queue_name] = self._new_channel()
+        return self.consume_channels[queue_name]
+
+    def _new_channel(self):
+        return ChannelFacade(connection_manager=_ChannelOpener(
+            self.connection_manager))
+
+
+class _ChannelOpener(object):
+    """
+    Stands in for the ConnectionManager of a ChannelFacade that should get
+    its own channel on the shared connection.
+    """
+    def __init__(self, connection_manager):
+        self.connection_manager = connection_manager
+        self._connect_deferred = None
+
+    def connect(self):
+        if self._connect_deferred is None:
+            self._connect_deferred = self.connection_manager.open_channel()
+        return self._connect_deferred
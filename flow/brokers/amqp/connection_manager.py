@@ -63,6 +63,33 @@ class ConnectionManager(object):
                 LOG.debug('Connection to AMQP is already in progress')
         return self._connect_deferred
 
+    def open_channel(self):
+        """
+        Returns a deferred that will callback with a new pika channel on the
+        same connection as the one returned by connect, with the same qos
+        settings applied.
+        """
+        deferred = defer.Deferred()
+        add_callback_and_default_errback(self.connect(), self._open_channel,
+                deferred=deferred)
+        return deferred
+
+    def _open_channel(self, first_channel, deferred):
+        channel_deferred = self._connection.channel()
+        channel_deferred.addCallback(self._set_qos)
+        channel_deferred.chainDeferred(deferred)
+        # connect() hands the same deferred to every caller
+        return first_channel
+
+    def _set_qos(self, channel):
+        if self.connection_params.prefetch_count:
+            qos_deferred = channel.basic_qos(
+                    prefetch_count=self.connection_params.prefetch_count)
+            qos_deferred.addCallback(lambda _: channel)
+            return qos_deferred
+        else:
+            return channel
+
     def _attempt_to_connect(self):
         self.state = CONNECTING
         self._connection_attempts += 1
@@ -0,0 +1,110 @@
+from flow.configuration.settings.injector import setting
+from injector import inject
+from twisted.internet import reactor
+
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+@inject(
+    prefetch_count=setting('amqp.prefetch_count'),
+    minimum=setting('amqp.adaptive_prefetch.min', 1),
+    maximum=setting('amqp.adaptive_prefetch.max', 0),
+    interval=setting('amqp.adaptive_prefetch.interval', 5),
+    latency_target=setting('amqp.adaptive_prefetch.latency_target', 1.0),
+)
+class AdaptivePrefetchParams(object):
+    @property
+    def enabled(self):
+        return self.maximum > 0
+
+
+class PrefetchController(object):
+    """
+    Adjusts basic_qos on a consume channel at runtime.  The per-consumer
+    limit of a running consumer cannot be changed, so the controller lifts
+    it for the consumers started after it is created and adjusts the limit
+    shared by every consumer on the channel instead.  Every `interval`
+    seconds (measured when handlers finish) it looks at the mean handler
+    latency and the peak number of outstanding deliveries since the last
+    decision:
+
+      - mean latency above latency_target halves the prefetch count,
+      - a peak at the current prefetch count (the consumer is starved by
+        it) doubles it,
+      - a peak under half of it shrinks it to twice the peak.
+
+    The result is always kept within [minimum, maximum].
+    """
+    def __init__(self, channel, params, name='', clock=reactor):
+        self.channel = channel
+        self.params = params
+        self.name = name
+        self.clock = clock
+
+        self.prefetch_count = min(params.maximum,
+                max(params.minimum, params.prefetch_count))
+        self.outstanding = 0
+        qos_deferred = self.channel.basic_qos(prefetch_count=0)
+        qos_deferred.addErrback(self._qos_failed, 0)
+        self._set_prefetch_count(self.prefetch_count)
+
+        self._reset_window(self.clock.seconds())
+
+    def started(self):
+        self.outstanding += 1
+        self._peak_outstanding = max(self._peak_outstanding, self.outstanding)
+        return self.clock.seconds()
+
+    def finished(self, start_time):
+        now = self.clock.seconds()
+        self.outstanding -= 1
+        self._completed += 1
+        self._total_latency += now - start_time
+
+        if now - self._window_start >= self.params.interval:
+            self._adjust()
+            self._reset_window(now)
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._completed = 0
+        self._total_latency = 0.0
+        self._peak_outstanding = self.outstanding
+
+    def _adjust(self):
+        params = self.params
+        current = self.prefetch_count
+        mean_latency = self._total_latency / self._completed
+        peak = self._peak_outstanding
+
+        if mean_latency > params.latency_target:
+            new = current // 2
+            reason = 'mean latency %.3fs is above target %.3fs' % (
+                    mean_latency, params.latency_target)
+        elif peak >= current:
+            new = current * 2
+            reason = 'peak outstanding deliveries reached the limit'
+        elif peak * 2 < current:
+            new = peak * 2
+            reason = 'peak outstanding deliveries was only %d' % peak
+        else:
+            return
+
+        new = min(params.maximum, max(params.minimum, new))
+        if new != current:
+            LOG.info('Changing prefetch count on channel (%s) from %d to %d: '
+                    '%s', self.name, current, new, reason)
+            self.prefetch_count = new
+            self._set_prefetch_count(new)
+
+    def _set_prefetch_count(self, prefetch_count):
+        qos_deferred = self.channel.basic_qos(prefetch_count=prefetch_count,
+                all_channels=True)
+        qos_deferred.addErrback(self._qos_failed, prefetch_count)
+
+    def _qos_failed(self, error, prefetch_count):
+        LOG.error('Failed to set prefetch count on channel (%s) to %d: %s',
+                self.name, prefetch_count, error.getTraceback())
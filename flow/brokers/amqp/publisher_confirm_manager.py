@@ -1,20 +1,33 @@
+from collections import deque
 from flow import exit_codes
 from flow.util.exit import exit_process
 from pika.spec import Basic
 
-import blist
+import flow.util.stats
 import logging
-import os
+import time
 
 
 LOG = logging.getLogger(__name__)
 
 
 class PublisherConfirmManager(object):
+    """
+    Tracks the deferreds for published messages until the broker confirms
+    them.  Publish tags increase monotonically, so outstanding tags are kept
+    in a deque (with their publish times alongside) and confirms pop from
+    the left.
+    """
     def __init__(self, channel):
-        self._confirm_tags = blist.sortedlist()
+        self._confirm_tags = deque()
+        self._publish_times = deque()
         self._confirm_deferreds = {}
 
+        self.confirmed_count = 0
+        self.total_confirm_latency = 0.0
+        self.max_confirm_latency = 0.0
+        self._frame_confirm_latency = 0.0
+
         LOG.debug('Enabling publisher confirms.')
         channel.confirm_delivery()
         channel.callbacks.add(channel.channel_number, Basic.Ack,
@@ -22,6 +35,10 @@ class PublisherConfirmManager(object):
         channel.callbacks.add(channel.channel_number, Basic.Nack,
                 self._on_publisher_confirm_nack, one_shot=False)
 
+    @property
+    def outstanding_count(self):
+        return len(self._confirm_deferreds)
+
     def _on_publisher_confirm_ack(self, method_frame):
         publish_tag = method_frame.method.delivery_tag
         multiple = method_frame.method.multiple
@@ -43,15 +60,24 @@ class PublisherConfirmManager(object):
     def _fire_confirm_deferreds(self, publish_tag, multiple):
         confirm_deferreds = self.get_confirm_deferreds(publish_tag=publish_tag,
                 multiple=multiple)
+        self._frame_confirm_latency = 0.0
         for deferred, tag in confirm_deferreds:
             deferred.callback(tag)
             self.remove_confirm_deferred(tag)
 
+        flow.util.stats.gauge('amqp.publisher_confirms.outstanding',
+                self.outstanding_count)
+        if confirm_deferreds:
+            flow.util.stats.timing('amqp.publisher_confirms.latency',
+                    int(self._frame_confirm_latency * 1000))
+
     def get_confirm_deferreds(self, publish_tag, multiple):
         if multiple:
-            index = self._confirm_tags.bisect(publish_tag)
-            tags = self._confirm_tags[:index]
-            deferreds = [(self._confirm_deferreds[tag], tag) for tag in tags]
+            deferreds = []
+            for tag in self._confirm_tags:
+                if tag > publish_tag:
+                    break
+                deferreds.append((self._confirm_deferreds[tag], tag))
             return deferreds
         else:
             if publish_tag in self._confirm_deferreds:
@@ -61,11 +87,24 @@ class PublisherConfirmManager(object):
 
     def add_confirm_deferred(self, publish_tag, deferred):
         if publish_tag not in self._confirm_deferreds:
-            self._confirm_tags.add(publish_tag)
+            self._confirm_tags.append(publish_tag)
+            self._publish_times.append(time.time())
             self._confirm_deferreds[publish_tag] = deferred
 
     def remove_confirm_deferred(self, publish_tag):
-        self._confirm_tags.remove(publish_tag)
+        if self._confirm_tags and self._confirm_tags[0] == publish_tag:
+            self._confirm_tags.popleft()
+            publish_time = self._publish_times.popleft()
+        else:
+            # only single confirms can arrive for a tag that isn't the oldest
+            index = list(self._confirm_tags).index(publish_tag)
+            del self._confirm_tags[index]
+            publish_time = self._publish_times[index]
+            del self._publish_times[index]
         del self._confirm_deferreds[publish_tag]
 
-
+        latency = time.time() - publish_time
+        self.confirmed_count += 1
+        self.total_confirm_latency += latency
+        self.max_confirm_latency = max(self.max_confirm_latency, latency)
+        self._frame_confirm_latency = max(self._frame_confirm_latency, latency)
@@ -1,93 +1,232 @@
-from flow.brokers.amqp.channel_facade import ChannelFacade
+from flow.brokers.amqp.ack_batcher import AckBatcher
+from flow.brokers.amqp.batch import BATCH_MESSAGE_TYPE
+from flow.brokers.amqp.batch import decode_batch, encode_batch
+from flow.brokers.amqp.channel_pool import ChannelPool
+from flow.brokers.amqp.prefetch_controller import AdaptivePrefetchParams
+from flow.brokers.amqp.prefetch_controller import PrefetchController
+from flow.configuration.settings.injector import setting
+from flow.protocol.codec import JSON_CONTENT_TYPE, content_type_for
 from flow.protocol.exceptions import InvalidMessageException
 from flow import interfaces
 from injector import inject
 from twisted.internet import defer
+from flow.util.defer import gather
 from flow.util.exit import exit_process
 from flow.exit_codes import EXECUTE_SYSTEM_FAILURE
 
 
+import functools
 import logging
 
 
 LOG = logging.getLogger(__name__)
 
+# every queue dead-letters into this exchange, see configurerabbitmq
+DEAD_LETTER_EXCHANGE = 'dead'
 
-@inject(channel=ChannelFacade)
+
+@inject(channel_pool=ChannelPool,
+        prefetch_params=AdaptivePrefetchParams,
+        ack_batch_size=setting('amqp.ack_batch_size', 1),
+        ack_batch_delay=setting('amqp.ack_batch_delay', 0.05),
+        content_type=setting('amqp.content_type', JSON_CONTENT_TYPE))
 class AmqpBroker(interfaces.IBroker):
+    def __init__(self):
+        self.channel = self.channel_pool.primary
+        # delivery tags are per channel, so each consume channel gets its own
+        self.acks = {}
+        self.prefetch_controllers = {}
+
     def publish(self, exchange_name, routing_key, message):
         LOG.debug("Publishing to exchange (%s) with routing_key (%s) "
                 "the message (%s)", exchange_name, routing_key, message)
 
-        encoded_message = message.encode()
+        content_type = content_type_for([message.__class__],
+                self.content_type)
+        encoded_message = message.encode(content_type)
 
-        return self.channel.basic_publish(
+        return self.channel_pool.publish_channel().basic_publish(
+                exchange_name=exchange_name,
+                routing_key=routing_key,
+                encoded_message=encoded_message,
+                content_type=content_type)
+
+    def publish_many(self, exchange_name, routing_key, messages):
+        """
+        Publishes messages as a single batch envelope that consumers unpack
+        in _message_recieved.  Returns one confirm deferred for the batch.
+        """
+        if len(messages) == 1:
+            return self.publish(exchange_name, routing_key, messages[0])
+        elif not messages:
+            return defer.succeed(None)
+
+        LOG.debug("Publishing batch of %d messages to exchange (%s) with "
+                "routing_key (%s)", len(messages), exchange_name, routing_key)
+
+        # every message in the batch shares the envelope's content type
+        content_type = content_type_for(set(m.__class__ for m in messages),
+                self.content_type)
+        encoded_batch = encode_batch([m.encode(content_type)
+            for m in messages])
+
+        return self.channel_pool.publish_channel().basic_publish(
                 exchange_name=exchange_name,
                 routing_key=routing_key,
-                encoded_message=encoded_message)
+                encoded_message=encoded_batch,
+                message_type=BATCH_MESSAGE_TYPE,
+                content_type=content_type)
 
     def declare_queue(self, *args, **kwargs):
         return self.channel.declare_queue(*args, **kwargs)
 
     def register_handler(self, handler):
         LOG.debug("Registering handler on queue '%s'.", handler.queue_name)
-        connect_deferred = self.channel.connect()
-        connect_deferred.addCallback(self._start_handler, handler=handler)
+        channel = self.channel_pool.consume_channel(handler.queue_name)
+        connect_deferred = channel.connect()
+        connect_deferred.addCallback(self._start_handler, handler=handler,
+                channel=channel)
         connect_deferred.addErrback(self._exit, handler=handler)
         return connect_deferred
 
-    def _start_handler(self, _callback_arg, handler):
+    def _start_handler(self, _callback_arg, handler, channel):
         queue_name = handler.queue_name
-        consume_deferred = self.channel.basic_consume(queue=queue_name)
-        consume_deferred.addCallback(self._begin_get_loop, handler=handler)
+        # before consuming, so that the consumer gets no limit of its own
+        self._add_prefetch_controller(channel, queue_name)
+        consume_deferred = channel.basic_consume(queue=queue_name)
+        consume_deferred.addCallback(self._begin_get_loop, handler=handler,
+                channel=channel)
         consume_deferred.addErrback(self._exit, handler=handler)
         return _callback_arg
 
-    def _begin_get_loop(self, _callback_arg, handler):
+    def _begin_get_loop(self, _callback_arg, handler, channel):
         queue, consumer_tag = _callback_arg
         queue_name = handler.queue_name
         LOG.debug('Beginning consumption on queue (%s)', queue_name)
 
-        self._get_message_from_queue(queue=queue, handler=handler)
+        self._get_message_from_queue(queue=queue, handler=handler,
+                channel=channel)
         return _callback_arg
 
-    def _get_message_from_queue(self, queue, handler):
+    def _get_message_from_queue(self, queue, handler, channel):
         deferred = queue.get()
-        deferred.addCallback(self._message_recieved, queue=queue, handler=handler)
+        deferred.addCallback(self._message_recieved, queue=queue,
+                handler=handler, channel=channel)
         deferred.addErrback(self._exit, handler=handler)
 
-    def _message_recieved(self, _callback_arg, queue, handler):
-        (channel, basic_deliver, properties, encoded_message) = _callback_arg
+    def _message_recieved(self, _callback_arg, queue, handler, channel):
+        (_pika_channel, basic_deliver, properties,
+                encoded_message) = _callback_arg
+
+        prefetch_controller = self.prefetch_controllers.get(channel)
+        if prefetch_controller is not None:
+            start_time = prefetch_controller.started()
 
-        message_class = handler.message_class
+        content_type = getattr(properties, 'content_type', None)
         try:
-            message = message_class.decode(encoded_message)
-            deferred = handler(message)
+            if getattr(properties, 'type', None) == BATCH_MESSAGE_TYPE:
+                deferred = self._handle_batch(encoded_message, handler,
+                        content_type, basic_deliver.routing_key)
+            else:
+                message = handler.message_class.decode(encoded_message,
+                        content_type=content_type)
+                deferred = handler(message)
         except InvalidMessageException as e:
             LOG.exception('Invalid message.  message = %s', encoded_message)
             deferred = defer.fail(e)
 
+        if prefetch_controller is not None:
+            deferred.addBoth(_finished, prefetch_controller, start_time)
+
         receive_tag = basic_deliver.delivery_tag
+        self._acks_for(channel).delivered(receive_tag)
         deferred.addCallbacks(self._ack, self._reject,
-                callbackArgs=(receive_tag,),
-                errbackArgs=(receive_tag,))
+                callbackArgs=(receive_tag, channel),
+                errbackArgs=(receive_tag, channel))
         deferred.addErrback(self._exit)
 
-        self._get_message_from_queue(queue, handler)
+        self._get_message_from_queue(queue, handler, channel)
         return _callback_arg
 
+    def _handle_batch(self, encoded_batch, handler, content_type,
+            routing_key):
+        # Each message of a batch fails on its own: a failed message is
+        # dead-lettered by itself, and the batch is acked once that is
+        # confirmed.  Only failing to dead-letter rejects the whole batch.
+        encoded_messages = decode_batch(encoded_batch)
+        LOG.debug('Handling batch of %d messages', len(encoded_messages))
+
+        deferreds = []
+        for encoded_message in encoded_messages:
+            try:
+                message = handler.message_class.decode(encoded_message,
+                        content_type=content_type)
+                deferred = handler(message)
+            except InvalidMessageException as e:
+                LOG.exception('Invalid message in batch.  message = %s',
+                        encoded_message)
+                deferred = defer.fail(e)
+
+            deferred.addErrback(self._dead_letter, encoded_message,
+                    routing_key, content_type)
+            deferreds.append(deferred)
+
+        return gather(deferreds)
+
+    def _dead_letter(self, error, encoded_message, routing_key, content_type):
+        LOG.error('Dead-lettering message from batch due to error: %s',
+                error.getTraceback())
+        return self.channel_pool.publish_channel().basic_publish(
+                exchange_name=DEAD_LETTER_EXCHANGE,
+                routing_key=routing_key,
+                encoded_message=encoded_message,
+                content_type=content_type)
+
     def _exit(self, error, **kwargs):
         LOG.critical("Unexpected error with kwargs: %s\n%s", kwargs,
                 error.getTraceback())
         exit_process(EXECUTE_SYSTEM_FAILURE)
 
-    def _ack(self, _callback_arg, receive_tag):
+    def _acks_for(self, channel):
+        if channel not in self.acks:
+            self.acks[channel] = AckBatcher(
+                    functools.partial(self._basic_ack, channel),
+                    max_pending=self.ack_batch_size,
+                    max_delay=self.ack_batch_delay)
+        return self.acks[channel]
+
+    def _add_prefetch_controller(self, channel, queue_name):
+        if not self.prefetch_params.enabled:
+            return
+
+        # queues consumed on a shared channel share its prefetch count
+        controller = self.prefetch_controllers.get(channel)
+        if controller is None:
+            self.prefetch_controllers[channel] = PrefetchController(channel,
+                    self.prefetch_params, name=queue_name)
+        else:
+            controller.name = '%s, %s' % (controller.name, queue_name)
+
+    def _ack(self, _callback_arg, receive_tag, channel):
         LOG.debug('Acking message (%s)', receive_tag)
-        self.channel.basic_ack(receive_tag)
+        self._acks_for(channel).acknowledge(receive_tag)
         return _callback_arg
 
-    def _reject(self, error, receive_tag):
+    @staticmethod
+    def _basic_ack(channel, receive_tag, multiple):
+        if multiple:
+            channel.basic_ack(receive_tag, multiple=True)
+        else:
+            channel.basic_ack(receive_tag)
+
+    def _reject(self, error, receive_tag, channel):
         LOG.error('Rejecting message (%s) due to error: %s', receive_tag,
                 error.getTraceback())
-        self.channel.basic_reject(receive_tag)
+        channel.basic_reject(receive_tag)
+        self._acks_for(channel).rejected(receive_tag)
         return None # we don't want to engage additional errbacks
+
+
+def _finished(result, prefetch_controller, start_time):
+    prefetch_controller.finished(start_time)
+    return result
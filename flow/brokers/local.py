@@ -10,13 +10,25 @@ import logging
 LOG = logging.getLogger(__name__)
 
 
-@inject(bindings=setting('bindings'))
+@inject(bindings=setting('bindings'),
+        concurrency=setting('local_broker.concurrency', 1))
 class LocalBroker(flow.interfaces.IBroker):
+    """
+    In-process broker.  Messages are delivered in the order they were
+    published, with at most `concurrency` of them being handled at once.
+    Once the queue is empty and no handlers are outstanding, the deferred
+    returned by listen fires and the reactor is stopped.
+    """
     def __init__(self):
         self.bindings = _transform_bindings(self.bindings)
         self.queue = deque()
         self.handlers = {}
 
+        self.in_flight = 0
+        self._dispatching = False
+        self._listen_deferred = None
+        self._first_failure = None
+
     def publish(self, exchange_name, routing_key, message):
         encoded_message = message.encode()
         return self.raw_publish(exchange_name, routing_key, encoded_message)
@@ -30,6 +42,7 @@ class LocalBroker(flow.interfaces.IBroker):
                   'routing_key (%s) in queue: %s',
                   exchange, routing_key, encoded_message)
         self.queue.append((exchange, routing_key, encoded_message))
+        self._dispatch()
         return defer.succeed(None)
 
     def declare_queue(self, queue_name, **kwargs):
@@ -39,21 +52,68 @@ class LocalBroker(flow.interfaces.IBroker):
     def connect_and_listen(self):
         return self.listen()
 
-    @defer.inlineCallbacks
     def listen(self):
-        while self.queue:
-            exchange, routing_key, encoded_message = self.queue.popleft()
-            LOG.debug('got message on exchange %s via routing_key %s: %s',
-                    exchange, routing_key, encoded_message)
-            queues = self.bindings[exchange][routing_key]
-            for q in queues:
-                h = self.handlers[q]
-                message_class = h.message_class
-                message = message_class.decode(encoded_message)
-                yield h(message)
-        else:
+        deferred = defer.Deferred()
+        deferred.addBoth(self._stop_reactor)
+        self._listen_deferred = deferred
+        self._dispatch()
+        return deferred
+
+    def _dispatch(self):
+        # Handlers publish new messages synchronously, so guard against
+        # re-entering from raw_publish; the outer loop picks them up.
+        if self._listen_deferred is None or self._dispatching:
+            return
+
+        self._dispatching = True
+        try:
+            while self.queue and self.in_flight < self.concurrency:
+                self.in_flight += 1
+                deferred = self._deliver(*self.queue.popleft())
+                deferred.addBoth(self._delivered)
+        finally:
+            self._dispatching = False
+
+        if not self.queue and not self.in_flight:
+            self._finish()
+
+    def _deliver(self, exchange, routing_key, encoded_message):
+        LOG.debug('got message on exchange %s via routing_key %s: %s',
+                exchange, routing_key, encoded_message)
+        deferreds = []
+        for q in self.bindings[exchange][routing_key]:
+            h = self.handlers[q]
+            deferreds.append(defer.maybeDeferred(
+                self._handle, h, encoded_message))
+
+        return defer.DeferredList(deferreds, consumeErrors=True)
+
+    @staticmethod
+    def _handle(handler, encoded_message):
+        message = handler.message_class.decode(encoded_message)
+        return handler(message)
+
+    def _delivered(self, results):
+        self.in_flight -= 1
+        for success, result in results:
+            if not success:
+                LOG.error('Handler failed: %s', result.getTraceback())
+                if self._first_failure is None:
+                    self._first_failure = result
+        self._dispatch()
+
+    def _finish(self):
+        deferred, self._listen_deferred = self._listen_deferred, None
+        if self._first_failure is None:
             LOG.info('No messages found in queue, stoping reactor.')
-            reactor.stop()
+            deferred.callback(None)
+        else:
+            failure, self._first_failure = self._first_failure, None
+            deferred.errback(failure)
+
+    def _stop_reactor(self, result):
+        reactor.callWhenRunning(reactor.stop)
+        return result
 
 
 def _transform_bindings(source_bindings):
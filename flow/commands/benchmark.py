@@ -5,7 +5,7 @@ from flow.configuration.inject.service_locator import ServiceLocatorConfiguratio
 from flow.petri_net import future
 from flow.petri_net.actions.base import BasicActionBase, BarrierActionBase
 from flow.petri_net.actions.time import RecordTimeAction
-from flow.petri_net.builder import Builder
+from flow.petri_net.builder import Builder, CompactBuilder
 from twisted.internet import defer
 from flow.service_locator import ServiceLocator
 
@@ -23,10 +23,7 @@ class SplitTransition(BasicActionBase):
                 parent_color=color_descriptor.color,
                 parent_color_group_idx=color_descriptor.group.idx)
 
-        begin = new_color_group.begin
-        idx = new_color_group.idx
-        tokens = [net.create_token(color=(begin + i), color_group_idx=idx)
-                  for i in xrange(new_color_group.size)]
+        tokens = net.create_tokens(new_color_group)
 
         return tokens, defer.succeed(None)
 
@@ -52,10 +49,12 @@ class BenchmarkCommand(CommandBase):
     def annotate_parser(parser):
         parser.add_argument('--groups', type=int, default=1)
         parser.add_argument('--size', type=int, default=50)
+        parser.add_argument('--compact', action='store_true', default=False,
+                help='store the net in the compact single-hash format')
 
     def _execute(self, parsed_arguments):
         net, start_place = self.construct_net(parsed_arguments.groups,
-                parsed_arguments.size)
+                parsed_arguments.size, compact=parsed_arguments.compact)
         completion_deferred = self.listen_for_completion(net)
 
         completion_deferred.addCallback(self.print_runtime, net=net)
@@ -93,10 +92,13 @@ class BenchmarkCommand(CommandBase):
         return result
 
 
-    def construct_net(self, groups, size):
+    def construct_net(self, groups, size, compact=False):
         future_net, start_place = self.future_net(groups, size)
 
-        builder = Builder(self.storage)
+        if compact:
+            builder = CompactBuilder(self.storage)
+        else:
+            builder = Builder(self.storage)
         stored_net = builder.store(future_net, {}, {})
         start_place_index = builder.future_places[start_place]
         return stored_net, start_place_index
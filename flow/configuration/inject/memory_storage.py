@@ -0,0 +1,16 @@
+from flow.memory_storage import MemoryStorage
+
+import flow.interfaces
+import flow.petri_net.memory_scripts
+import injector
+
+
+class MemoryStorageConfiguration(injector.Module):
+    """
+    Provides a MemoryStorage in place of redis.  With the local broker a
+    workflow runs entirely within one process.
+    """
+    @injector.singleton
+    @injector.provides(flow.interfaces.IStorage)
+    def provide_storage(self):
+        return MemoryStorage()
@@ -1,6 +1,7 @@
 from flow.configuration.settings.injector import setting
 
 import flow.interfaces
+import flow.redisom as rom
 import injector
 import os
 import redis
@@ -15,15 +16,44 @@ class RedisConfiguration(injector.Module):
     @injector.provides(flow.interfaces.IStorage)
     @injector.inject(host=setting('redis.host', None),
             port=setting('redis.port', 6379),
-            path=setting('redis.unix_socket_path', None))
-    def provide_redis(self, host, port,  path):
+            path=setting('redis.unix_socket_path', None),
+            shards=setting('redis.shards', []),
+            max_connections=setting('redis.max_connections', None),
+            socket_timeout=setting('redis.socket_timeout', None),
+            socket_connect_timeout=setting('redis.socket_connect_timeout',
+                None),
+            socket_keepalive=setting('redis.socket_keepalive', False),
+            hash_tags=setting('redis.hash_tags', False))
+    def provide_redis(self, host, port,  path, shards, hash_tags,
+            **pool_options):
+        rom.use_hash_tags(hash_tags)
+
         if 'FLOW_REDIS_SOCKET' in os.environ:
-            path = os.environ['FLOW_REDIS_SOCKET']
+            return connect(unix_socket_path=os.environ['FLOW_REDIS_SOCKET'],
+                    **pool_options)
 
-        if path:
-            return redis.Redis(unix_socket_path=path)
+        if shards:
+            return rom.ShardedConnection([connect(**dict(pool_options,
+                **shard)) for shard in shards])
         else:
-            return redis.Redis(host=host, port=port)
+            return connect(host=host, port=port, unix_socket_path=path,
+                    **pool_options)
+
+
+def connect(host=None, port=6379, unix_socket_path=None, max_connections=None,
+        socket_timeout=None, socket_connect_timeout=None,
+        socket_keepalive=False):
+    """
+    Returns a client with its own connection pool.  Shards in the
+    redis.shards setting take the same keys as this function's arguments.
+    The connect timeout and keepalive only apply to TCP connections.
+    """
+    return redis.Redis(host=host, port=port,
+            unix_socket_path=unix_socket_path or None,
+            max_connections=max_connections, socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            socket_keepalive=socket_keepalive)
+
 
 class LocalRedisConfiguration(injector.Module):
     @injector.singleton
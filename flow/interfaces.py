@@ -1,4 +1,6 @@
 from abc import ABCMeta, abstractmethod, abstractproperty
+from flow.util.defer import gather
+from twisted.internet import defer
 
 
 class IBroker(object):
@@ -12,6 +14,15 @@ class IBroker(object):
         will not callback (nor errback) and the program will exit.
         """
 
+    def publish_many(self, exchange_name, routing_key, messages):
+        """
+        Publish a list of messages to the same exchange and routing key.
+        Returns a deferred that will callback once all of them have been
+        confirmed.  Brokers may override this to send them together.
+        """
+        return defer.DeferredList([self.publish(exchange_name, routing_key, m)
+            for m in messages])
+
     @abstractmethod
     def register_handler(self, handler):
         """
@@ -49,6 +60,14 @@ class IOrchestrator(object):
     def notify_place(self, net_key, place_idx, color):
         pass
 
+    def notify_places(self, net_key, place_colors):
+        """
+        Calls notify_place for every (place_idx, color) pair in place_colors.
+        The returned deferred fails as soon as one of them does.
+        """
+        return gather([self.notify_place(net_key, place_idx, color)
+            for place_idx, color in place_colors])
+
     @abstractmethod
     def notify_transition(self, net_key, transition_idx, place_idx, token_idx):
         pass
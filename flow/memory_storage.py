@@ -0,0 +1,611 @@
+from redis.exceptions import NoScriptError, ResponseError
+
+import copy
+import fnmatch
+import flow.interfaces
+import flow.redisom as rom
+import hashlib
+import logging
+import threading
+import time
+import zlib
+
+
+LOG = logging.getLogger(__name__)
+
+# Python implementations of redisom Scripts by script hash, see python_script
+_PYTHON_SCRIPTS = {}
+
+_WRONGTYPE = ('WRONGTYPE Operation against a key holding the wrong kind '
+        'of value')
+
+
+def python_script(script):
+    """
+    Registers the decorated function as the implementation of script (a
+    redisom Script) in MemoryStorage.  It is called as function(storage,
+    keys, args) with the storage locked, and must make the same changes
+    and return the same reply as the Lua script does.  keys and args are
+    encoded the way the redis client would send them, so a missing KEYS[i]
+    or ARGV[i] reads as None.
+    """
+    def register(function):
+        _PYTHON_SCRIPTS[script.script_hash] = function
+        return function
+    return register
+
+
+class MemoryStorage(flow.interfaces.IStorage):
+    """
+    A single-process stand-in for a redis connection.  It implements the
+    commands used by redisom, the petri nets and the orchestrator with the
+    replies of the redis client, and runs registered Python versions of
+    their Lua scripts (see python_script) for EVAL and EVALSHA.
+
+    Data is kept in a dict of plain Python values and expires lazily.  Every
+    command, pipeline and script runs under a single lock, so scripts and
+    MULTI/EXEC pipelines are atomic, also for the orchestrator's storage
+    threads.  Nothing is persisted or shared with other processes.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._data = {}
+        self._expires = {}
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return MemoryPipeline(self)
+
+    def execute_command(self, *args, **options):
+        command = getattr(self, _command_method(args[0]), None)
+        if command is None:
+            raise ResponseError("unknown command '%s'" % args[0])
+        return command(*args[1:])
+
+
+    # Server
+    def ping(self):
+        return True
+
+    def time(self):
+        now = time.time()
+        sec = int(now)
+        return sec, int((now - sec) * 1e6)
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+        return True
+
+    flushdb = flushall
+
+    def dbsize(self):
+        with self._lock:
+            return len(self._live_keys())
+
+
+    # Keys
+    def delete(self, *names):
+        with self._lock:
+            count = 0
+            for name in names:
+                name = _encode(name)
+                if self._lookup(name) is not None:
+                    self._remove(name)
+                    count += 1
+            return count
+
+    unlink = delete
+
+    def exists(self, name):
+        with self._lock:
+            return self._lookup(_encode(name)) is not None
+
+    def type(self, name):
+        with self._lock:
+            value = self._lookup(_encode(name))
+            return _TYPE_NAMES.get(type(value), 'none')
+
+    def keys(self, pattern='*'):
+        with self._lock:
+            return [key for key in self._live_keys()
+                    if _matches(key, pattern)]
+
+    def expire(self, name, time):
+        with self._lock:
+            name = _encode(name)
+            if self._lookup(name) is None:
+                return False
+            self._expires[name] = _now() + int(time)
+            return True
+
+    def ttl(self, name):
+        with self._lock:
+            name = _encode(name)
+            if self._lookup(name) is None:
+                return -2
+            if name not in self._expires:
+                return -1
+            return int(round(self._expires[name] - _now()))
+
+    def rename(self, src, dst):
+        with self._lock:
+            src = _encode(src)
+            dst = _encode(dst)
+            value = self._lookup(src)
+            if value is None:
+                raise ResponseError('no such key')
+            deadline = self._expires.get(src)
+            self._remove(src)
+            self._remove(dst)
+            self._data[dst] = value
+            if deadline is not None:
+                self._expires[dst] = deadline
+            return True
+
+
+    # Strings
+    def get(self, name):
+        with self._lock:
+            return self._read(name, str)
+
+    def mget(self, keys, *args):
+        with self._lock:
+            if isinstance(keys, basestring):
+                keys = [keys]
+            return [self._lookup_typed(_encode(key), str)
+                    for key in list(keys) + list(args)]
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        with self._lock:
+            name = _encode(name)
+            exists = self._lookup(name) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            self._remove(name)
+            self._data[name] = _encode(value)
+            if ex is not None:
+                self._expires[name] = _now() + int(ex)
+            elif px is not None:
+                self._expires[name] = _now() + int(px) / 1000.0
+            return True
+
+    def setnx(self, name, value):
+        return bool(self.set(name, value, nx=True))
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            name = _encode(name)
+            value = _to_int(self._read(name, str, 0)) + int(amount)
+            self._data[name] = str(value)
+            return value
+
+    incrby = incr
+
+    def decr(self, name, amount=1):
+        return self.incr(name, -int(amount))
+
+
+    # Hashes
+    def hget(self, name, key):
+        with self._lock:
+            return self._read(name, dict, {}).get(_encode(key))
+
+    def hmget(self, name, keys, *args):
+        with self._lock:
+            if isinstance(keys, basestring):
+                keys = [keys]
+            hash_value = self._read(name, dict, {})
+            return [hash_value.get(_encode(key))
+                    for key in list(keys) + list(args)]
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._read(name, dict, {}))
+
+    def hkeys(self, name):
+        with self._lock:
+            return self._read(name, dict, {}).keys()
+
+    def hvals(self, name):
+        with self._lock:
+            return self._read(name, dict, {}).values()
+
+    def hlen(self, name):
+        with self._lock:
+            return len(self._read(name, dict, {}))
+
+    def hexists(self, name, key):
+        with self._lock:
+            return _encode(key) in self._read(name, dict, {})
+
+    def hset(self, name, key, value):
+        with self._lock:
+            hash_value = self._write(name, dict)
+            key = _encode(key)
+            added = key not in hash_value
+            hash_value[key] = _encode(value)
+            return int(added)
+
+    def hsetnx(self, name, key, value):
+        with self._lock:
+            hash_value = self._write(name, dict)
+            key = _encode(key)
+            if key in hash_value:
+                return 0
+            hash_value[key] = _encode(value)
+            return 1
+
+    def hmset(self, name, mapping):
+        if not mapping:
+            raise ResponseError("wrong number of arguments for 'hmset' "
+                    "command")
+        with self._lock:
+            hash_value = self._write(name, dict)
+            for key, value in mapping.iteritems():
+                hash_value[_encode(key)] = _encode(value)
+            return True
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            hash_value = self._read(name, dict, {})
+            count = 0
+            for key in keys:
+                if hash_value.pop(_encode(key), None) is not None:
+                    count += 1
+            self._drop_if_empty(name)
+            return count
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            hash_value = self._write(name, dict)
+            key = _encode(key)
+            value = _to_int(hash_value.get(key, 0)) + int(amount)
+            hash_value[key] = str(value)
+            return value
+
+    def hscan(self, name, cursor=0, match=None, count=None):
+        """
+        Fields are visited in order of a hash of their name and the cursor
+        is the next hash to visit, so, as with redis, every field present
+        for a whole scan is returned at least once.
+        """
+        with self._lock:
+            hash_value = self._read(name, dict, {})
+            cursor = int(cursor)
+            fields = sorted((_field_slot(field), field)
+                    for field in hash_value if _field_slot(field) >= cursor)
+            count = int(count or 10)
+
+            page = fields[:count]
+            # a slot is never split between two pages
+            while len(page) < len(fields) and (
+                    fields[len(page)][0] == page[-1][0]):
+                page.append(fields[len(page)])
+
+            next_cursor = 0
+            if len(page) < len(fields):
+                next_cursor = page[-1][0] + 1
+
+            return next_cursor, dict((field, hash_value[field])
+                    for slot, field in page
+                    if match is None or _matches(field, match))
+
+
+    # Lists
+    def rpush(self, name, *values):
+        with self._lock:
+            list_value = self._write(name, list)
+            list_value.extend(_encode(value) for value in values)
+            return len(list_value)
+
+    def lrange(self, name, start, end):
+        with self._lock:
+            list_value = self._read(name, list, [])
+            start, end = int(start), int(end)
+            if end == -1:
+                return list_value[start:]
+            if end < 0:
+                end += len(list_value)
+            return list_value[start:end + 1]
+
+    def llen(self, name):
+        with self._lock:
+            return len(self._read(name, list, []))
+
+    def lindex(self, name, index):
+        with self._lock:
+            try:
+                return self._read(name, list, [])[int(index)]
+            except IndexError:
+                return None
+
+    def lset(self, name, index, value):
+        with self._lock:
+            list_value = self._read(name, list)
+            if list_value is None:
+                raise ResponseError('no such key')
+            try:
+                list_value[int(index)] = _encode(value)
+            except IndexError:
+                raise ResponseError('index out of range')
+            return True
+
+
+    # Sets
+    def sadd(self, name, *values):
+        with self._lock:
+            set_value = self._write(name, set)
+            before = len(set_value)
+            set_value.update(_encode(value) for value in values)
+            return len(set_value) - before
+
+    def srem(self, name, *values):
+        with self._lock:
+            set_value = self._read(name, set, set())
+            before = len(set_value)
+            set_value.difference_update(_encode(value) for value in values)
+            self._drop_if_empty(name)
+            return before - len(set_value)
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._read(name, set, set()))
+
+    def scard(self, name):
+        with self._lock:
+            return len(self._read(name, set, set()))
+
+    def sismember(self, name, value):
+        with self._lock:
+            return _encode(value) in self._read(name, set, set())
+
+    def sunionstore(self, dest, keys, *args):
+        with self._lock:
+            if isinstance(keys, basestring):
+                keys = [keys]
+            union = set()
+            for key in list(keys) + list(args):
+                union.update(self._read(key, set, set()))
+            dest = _encode(dest)
+            self._remove(dest)
+            if union:
+                self._data[dest] = union
+            return len(union)
+
+
+    # Sorted sets
+    def zadd(self, name, *args, **kwargs):
+        """
+        Members are given as redis.Redis takes them: alternating members
+        and scores, or scores keyed by member.
+        """
+        with self._lock:
+            zset_value = self._write(name, _SortedSet)
+            before = len(zset_value)
+            for member, score in zip(args[::2], args[1::2]) + kwargs.items():
+                zset_value[_encode(member)] = float(score)
+            return len(zset_value) - before
+
+    def zrevrangebyscore(self, name, max, min, start=None, num=None,
+            withscores=False, score_cast_func=float):
+        with self._lock:
+            zset_value = self._read(name, _SortedSet, _SortedSet())
+            members = sorted(((score, member)
+                for member, score in zset_value.iteritems()
+                if float(min) <= score <= float(max)), reverse=True)
+            if start is not None:
+                members = members[int(start):]
+                if int(num) >= 0:
+                    members = members[:int(num)]
+
+            if withscores:
+                return [(member, score_cast_func(score))
+                        for score, member in members]
+            return [member for score, member in members]
+
+
+    # Scripts
+    def script_load(self, script):
+        sha = hashlib.sha1(script).hexdigest()
+        if sha not in _PYTHON_SCRIPTS:
+            raise rom.ScriptUnavailableError(
+                    'No Python implementation of script %s' % sha)
+        return sha
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        function = _PYTHON_SCRIPTS.get(sha)
+        if function is None:
+            raise NoScriptError('No matching script. Please use EVAL.')
+        return self._run_script(function, numkeys, keys_and_args)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        sha = hashlib.sha1(script).hexdigest()
+        function = _PYTHON_SCRIPTS.get(sha)
+        if function is None:
+            raise ResponseError('No Python implementation of script %s'
+                    % sha)
+        return self._run_script(function, numkeys, keys_and_args)
+
+    def _run_script(self, function, numkeys, keys_and_args):
+        numkeys = int(numkeys)
+        encoded = [_encode(x) for x in keys_and_args]
+        with self._lock:
+            return _script_reply(function(self, _ScriptArgs(encoded[:numkeys]),
+                _ScriptArgs(encoded[numkeys:])))
+
+
+    def _lookup(self, name):
+        deadline = self._expires.get(name)
+        if deadline is not None and deadline <= _now():
+            self._remove(name)
+        return self._data.get(name)
+
+    def _lookup_typed(self, name, value_type):
+        value = self._lookup(name)
+        if value is not None and type(value) is not value_type:
+            return None
+        return value
+
+    def _read(self, name, value_type, default=None):
+        value = self._lookup(_encode(name))
+        if value is None:
+            return default
+        if type(value) is not value_type:
+            raise ResponseError(_WRONGTYPE)
+        return value
+
+    def _write(self, name, value_type):
+        name = _encode(name)
+        value = self._read(name, value_type)
+        if value is None:
+            value = self._data[name] = value_type()
+        return value
+
+    def _drop_if_empty(self, name):
+        name = _encode(name)
+        if name in self._data and not self._data[name]:
+            self._remove(name)
+
+    def _remove(self, name):
+        self._data.pop(name, None)
+        self._expires.pop(name, None)
+
+    def _live_keys(self):
+        return [key for key in self._data.keys()
+                if self._lookup(key) is not None]
+
+
+class MemoryPipeline(object):
+    """
+    Queues commands for MemoryStorage and runs them together, holding its
+    lock, when execute is called.  As with a redis MULTI/EXEC, a failed
+    command does not stop the ones after it.  Errors a redis server would
+    not reply with (anything but a ResponseError) are raised once every
+    command has run, whatever raise_on_error is.
+    """
+    def __init__(self, storage):
+        self.storage = storage
+        self.command_stack = []
+
+    def __getattr__(self, name):
+        command = getattr(self.storage, name)
+        def queue(*args, **kwargs):
+            self.command_stack.append((command, args, kwargs))
+            return self
+        return queue
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute(self, raise_on_error=True):
+        stack, self.command_stack = self.command_stack, []
+
+        results = []
+        with self.storage._lock:
+            for command, args, kwargs in stack:
+                try:
+                    results.append(command(*args, **kwargs))
+                except Exception as e:
+                    results.append(e)
+
+        for result in results:
+            if isinstance(result, Exception) and (raise_on_error or
+                    not isinstance(result, ResponseError)):
+                raise result
+        return results
+
+
+class _ScriptArgs(list):
+    # Lua's KEYS and ARGV: indexed (and sliced) from 1, and nil past the end
+    def __getitem__(self, idx):
+        if 1 <= idx <= len(self):
+            return list.__getitem__(self, idx - 1)
+        return None
+
+    def __getslice__(self, begin, end):
+        return list.__getslice__(self, max(begin - 1, 0), max(end - 1, 0))
+
+
+class _SortedSet(dict):
+    # scores by member, a type of its own so it is not taken for a hash
+    pass
+
+
+_TYPE_NAMES = {str: 'string', dict: 'hash', list: 'list', set: 'set',
+        _SortedSet: 'zset'}
+
+
+def _command_method(command_name):
+    return command_name.lower().replace(' ', '_')
+
+
+def _encode(value):
+    # the same conversion the redis client makes for keys and arguments
+    if isinstance(value, str):
+        return value
+    elif isinstance(value, (int, long)):
+        return str(value)
+    elif isinstance(value, float):
+        return repr(value)
+    elif not isinstance(value, basestring):
+        value = unicode(value)
+    return value.encode('utf-8')
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ResponseError('value is not an integer or out of range')
+
+
+def _matches(name, pattern):
+    return fnmatch.fnmatchcase(name, _encode(pattern))
+
+
+def _field_slot(field):
+    return zlib.crc32(field) & 0xffffffff
+
+
+def _now():
+    return time.time()
+
+
+def _script_reply(value):
+    # Lua values are converted to redis replies the same way
+    if value is None or value is False:
+        return None
+    elif value is True:
+        return 1
+    elif isinstance(value, float):
+        return int(value)
+    elif isinstance(value, (list, tuple)):
+        return [_script_reply(v) for v in value]
+    else:
+        return value
+
+
+@python_script(rom._COPY_KEY_SCRIPT)
+def _copy_key(storage, keys, args):
+    src = storage._lookup(keys[1])
+    if src is not None:
+        storage.delete(keys[2])
+        storage._data[keys[2]] = copy.deepcopy(src)
+    return "OK"
+
+
+@python_script(rom._EXPIRE_KEY_SCRIPT)
+def _expire_keys(storage, keys, args):
+    for key in keys:
+        storage.expire(key, args[1])
+    return [0, "Success"]
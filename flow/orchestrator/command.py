@@ -5,7 +5,10 @@ from flow.configuration.inject.service_locator import ServiceLocatorConfiguratio
 from flow.orchestrator.handlers import PetriCreateTokenHandler
 from flow.orchestrator.handlers import PetriNotifyPlaceHandler
 from flow.orchestrator.handlers import PetriNotifyTransitionHandler
+from twisted.internet import reactor
 
+import flow.petri_net.scripts
+import flow.redisom as rom
 import logging
 
 
@@ -26,4 +29,16 @@ class OrchestratorCommand(ServiceCommand):
                 self.injector.get(PetriNotifyTransitionHandler)
         ]
 
+        num_scripts = flow.petri_net.scripts.load_scripts(self.storage)
+        LOG.info('Loaded %d redis scripts', num_scripts)
+        reactor.addSystemEventTrigger('before', 'shutdown', _log_script_stats)
+
         return ServiceCommand._setup(self, *args, **kwargs)
+
+
+def _log_script_stats():
+    for name, stats in sorted(rom.script_stats().iteritems()):
+        LOG.info('Script %s: %d calls, %d errors, %d reloads, '
+                '%.3fs total, %.3fs max', name, stats['calls'],
+                stats['errors'], stats['reloads'], stats['seconds'],
+                stats['max_seconds'])
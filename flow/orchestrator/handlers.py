@@ -1,8 +1,11 @@
+from abc import abstractmethod
 from flow.configuration.settings.injector import setting
 from flow.handler import Handler
 from flow.orchestrator.messages import CreateTokenMessage, NotifyPlaceMessage
 from flow.orchestrator.messages import NotifyTransitionMessage
-from flow.redisom import get_object
+from flow.orchestrator.short_circuit import ShortCircuitOrchestrator
+from flow.orchestrator.storage_threads import StorageThreads
+from flow.orchestrator.topology_cache import TopologyCache
 from injector import inject
 
 import flow.interfaces
@@ -11,44 +14,81 @@ import logging
 
 LOG = logging.getLogger(__name__)
 
+
+class PetriHandlerBase(Handler):
+    def _handle_message(self, message):
+        return self.storage_threads.run(self._update_net,
+                self.service_interfaces, message)
+
+    @abstractmethod
+    def _update_net(self, service_interfaces, message):
+        """
+        Applies message to its net.  Called through storage_threads, so
+        service_interfaces is not always self.service_interfaces.
+        """
+
+    def _message_service_interfaces(self, service_interfaces):
+        return ShortCircuitOrchestrator.wrap(self.topology_cache,
+                service_interfaces,
+                max_depth=self.short_circuit_depth,
+                budget=self.short_circuit_budget)
+
+
 @inject(redis=flow.interfaces.IStorage,
         service_interfaces=flow.interfaces.IServiceLocator,
-        queue_name=setting('orchestrator.create_token_queue'))
-class PetriCreateTokenHandler(Handler):
+        queue_name=setting('orchestrator.create_token_queue'),
+        short_circuit_depth=setting('orchestrator.short_circuit_depth', 0),
+        short_circuit_budget=setting('orchestrator.short_circuit_budget', 0),
+        topology_cache=TopologyCache,
+        storage_threads=StorageThreads)
+class PetriCreateTokenHandler(PetriHandlerBase):
     message_class = CreateTokenMessage
 
-    def _handle_message(self, message):
-        net = get_object(self.redis, message.net_key)
+    def _update_net(self, service_interfaces, message):
+        net, topology = self.topology_cache.lookup(message.net_key)
 
         create_token_kwargs = getattr(message, 'create_token_kwargs', {})
 
         return net.create_put_notify(message.place_idx,
-                self.service_interfaces,
+                self._message_service_interfaces(service_interfaces),
                 color=message.color,
                 color_group_idx=message.color_group_idx,
-                data=getattr(message, 'data', {}))
+                data=getattr(message, 'data', {}),
+                topology=topology)
 
 
 @inject(redis=flow.interfaces.IStorage,
         service_interfaces=flow.interfaces.IServiceLocator,
-        queue_name=setting('orchestrator.notify_place_queue'))
-class PetriNotifyPlaceHandler(Handler):
+        queue_name=setting('orchestrator.notify_place_queue'),
+        short_circuit_depth=setting('orchestrator.short_circuit_depth', 0),
+        short_circuit_budget=setting('orchestrator.short_circuit_budget', 0),
+        topology_cache=TopologyCache,
+        storage_threads=StorageThreads)
+class PetriNotifyPlaceHandler(PetriHandlerBase):
     message_class = NotifyPlaceMessage
 
-    def _handle_message(self, message):
-        net = get_object(self.redis, message.net_key)
+    def _update_net(self, service_interfaces, message):
+        net, topology = self.topology_cache.lookup(message.net_key)
+        service_interfaces = self._message_service_interfaces(
+                service_interfaces)
         return net.notify_place(message.place_idx, color=message.color,
-                service_interfaces=self.service_interfaces)
+                service_interfaces=service_interfaces, topology=topology)
 
 
 @inject(redis=flow.interfaces.IStorage,
         service_interfaces=flow.interfaces.IServiceLocator,
-        queue_name=setting('orchestrator.notify_transition_queue'))
-class PetriNotifyTransitionHandler(Handler):
+        queue_name=setting('orchestrator.notify_transition_queue'),
+        short_circuit_depth=setting('orchestrator.short_circuit_depth', 0),
+        short_circuit_budget=setting('orchestrator.short_circuit_budget', 0),
+        topology_cache=TopologyCache,
+        storage_threads=StorageThreads)
+class PetriNotifyTransitionHandler(PetriHandlerBase):
     message_class = NotifyTransitionMessage
 
-    def _handle_message(self, message):
-        net = get_object(self.redis, message.net_key)
+    def _update_net(self, service_interfaces, message):
+        net, topology = self.topology_cache.lookup(message.net_key)
+        service_interfaces = self._message_service_interfaces(
+                service_interfaces)
         return net.notify_transition(message.transition_idx,
                 message.place_idx, token_idx=message.token_idx,
-                service_interfaces=self.service_interfaces)
+                service_interfaces=service_interfaces, topology=topology)
@@ -13,6 +13,14 @@ class CreateTokenMessage(Message):
             "data": object,
     }
 
+    binary_fields = (
+            ("place_idx", "i"),
+            ("color", "q"),
+            ("color_group_idx", "q"),
+            ("net_key", "s"),
+            ("data", "j"),
+    )
+
 
 class NotifyPlaceMessage(Message):
     required_fields = {
@@ -21,6 +29,12 @@ class NotifyPlaceMessage(Message):
             "color": (int, long),
     }
 
+    binary_fields = (
+            ("place_idx", "i"),
+            ("color", "q"),
+            ("net_key", "s"),
+    )
+
 
 class NotifyTransitionMessage(Message):
     required_fields = {
@@ -29,3 +43,10 @@ class NotifyTransitionMessage(Message):
             "transition_idx": int,
             "token_idx": (int, long),
     }
+
+    binary_fields = (
+            ("place_idx", "i"),
+            ("transition_idx", "i"),
+            ("token_idx", "q"),
+            ("net_key", "s"),
+    )
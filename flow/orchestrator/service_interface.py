@@ -37,6 +37,12 @@ class OrchestratorServiceInterface(flow.interfaces.IOrchestrator):
         return self.broker.publish(self.notify_place_exchange,
                 self.notify_place_routing_key, message)
 
+    def notify_places(self, net_key, place_colors):
+        messages = [NotifyPlaceMessage(net_key=net_key, place_idx=place_idx,
+                color=color) for place_idx, color in place_colors]
+        return self.broker.publish_many(self.notify_place_exchange,
+                self.notify_place_routing_key, messages)
+
     def notify_transition(self, net_key, transition_idx, place_idx, token_idx):
         message = NotifyTransitionMessage(
                 net_key=net_key,
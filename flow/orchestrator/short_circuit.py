@@ -0,0 +1,123 @@
+from twisted.internet import defer
+
+import flow.interfaces
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class ShortCircuitOrchestrator(flow.interfaces.IOrchestrator):
+    """
+    Handles notify_place and notify_transition requests in the current
+    process instead of publishing them.  At most max_depth nested hops are
+    made, and at most budget hops are shared by everything that follows from
+    one incoming message.  Requests past either limit, and all create_token
+    requests, are passed to the wrapped orchestrator service.
+    """
+    def __init__(self, topology_cache, service_interfaces, max_depth, budget,
+            depth=0):
+        self.topology_cache = topology_cache
+        self.service_interfaces = service_interfaces
+        self.orchestrator = service_interfaces['orchestrator']
+
+        self.max_depth = max_depth
+        self.depth = depth
+
+        if isinstance(budget, _Budget):
+            self.budget = budget
+        else:
+            self.budget = _Budget(budget)
+
+    @classmethod
+    def wrap(cls, topology_cache, service_interfaces, max_depth, budget):
+        """
+        Returns service_interfaces with its orchestrator replaced by a new
+        ShortCircuitOrchestrator, or service_interfaces itself when
+        short-circuiting is disabled.
+        """
+        if max_depth > 0 and budget > 0:
+            orchestrator = cls(topology_cache, service_interfaces, max_depth,
+                    budget)
+            return _ShortCircuitServiceLocator(service_interfaces,
+                    orchestrator)
+        else:
+            return service_interfaces
+
+    def create_token(self, net_key, place_idx,
+            color, color_group_idx, data=None):
+        return self.orchestrator.create_token(net_key, place_idx,
+                color, color_group_idx, data=data)
+
+    def notify_place(self, net_key, place_idx, color):
+        if self._take_hop():
+            LOG.debug('Short-circuiting notify_place for net (%s) '
+                    'place (%s) color (%s) at depth %d',
+                    net_key, place_idx, color, self.depth)
+            return defer.maybeDeferred(self._notify_place, net_key,
+                    place_idx, color)
+        else:
+            return self.orchestrator.notify_place(net_key, place_idx, color)
+
+    def notify_transition(self, net_key, transition_idx, place_idx, token_idx):
+        if self._take_hop():
+            LOG.debug('Short-circuiting notify_transition for net (%s) '
+                    'transition (%s) at depth %d',
+                    net_key, transition_idx, self.depth)
+            return defer.maybeDeferred(self._notify_transition, net_key,
+                    transition_idx, place_idx, token_idx)
+        else:
+            return self.orchestrator.notify_transition(net_key,
+                    transition_idx, place_idx, token_idx)
+
+    def _notify_place(self, net_key, place_idx, color):
+        net, topology = self.topology_cache.lookup(net_key)
+        return net.notify_place(place_idx, color=color,
+                service_interfaces=self._next_hop(), topology=topology)
+
+    def _notify_transition(self, net_key, transition_idx, place_idx,
+            token_idx):
+        net, topology = self.topology_cache.lookup(net_key)
+        return net.notify_transition(transition_idx, place_idx,
+                token_idx=token_idx, service_interfaces=self._next_hop(),
+                topology=topology)
+
+    def _take_hop(self):
+        return self.depth < self.max_depth and self.budget.take()
+
+    def _next_hop(self):
+        orchestrator = self.__class__(self.topology_cache,
+                self.service_interfaces,
+                self.max_depth, self.budget, depth=self.depth + 1)
+        return _ShortCircuitServiceLocator(self.service_interfaces,
+                orchestrator)
+
+
+class _Budget(object):
+    def __init__(self, remaining):
+        self.remaining = remaining
+
+    def take(self):
+        if self.remaining > 0:
+            self.remaining -= 1
+            return True
+        else:
+            return False
+
+
+class _ShortCircuitServiceLocator(flow.interfaces.IServiceLocator):
+    def __init__(self, service_interfaces, orchestrator):
+        self.service_interfaces = service_interfaces
+        self.orchestrator = orchestrator
+
+    def __getitem__(self, name):
+        if name == 'orchestrator':
+            return self.orchestrator
+        else:
+            return self.service_interfaces[name]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
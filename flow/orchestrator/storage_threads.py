@@ -0,0 +1,115 @@
+from flow.configuration.settings.injector import setting
+from flow.util.defer import gather
+from injector import inject, singleton
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+
+import flow.interfaces
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+@singleton
+@inject(size=setting('orchestrator.storage_threads', 0))
+class StorageThreads(object):
+    """
+    Runs the redis work of the orchestrator handlers on a dedicated pool of
+    size threads, so that a slow script or a large expire in one net does
+    not block the reactor for every other message.  With size 0 the work
+    runs in the reactor thread.  Each thread takes its own connection from
+    the redis client's pool, so redis.max_connections should be at least
+    size.
+
+    Service interfaces publish through the broker and may only be used from
+    the reactor thread.  Work running in the pool is given a service locator
+    that records each call and returns an already fired deferred; the calls
+    are made, in order, from the reactor once the work is done.  The
+    deferred returned by run waits for them.
+    """
+    def __init__(self):
+        self._thread_pool = None
+
+    def run(self, function, service_interfaces, *args, **kwargs):
+        """
+        Calls function(service_interfaces, *args, **kwargs) and returns a
+        deferred.
+        """
+        if self.size <= 0:
+            return function(service_interfaces, *args, **kwargs)
+
+        recorder = RecordingServiceLocator(service_interfaces)
+        deferred = threads.deferToThreadPool(reactor, self.thread_pool,
+                _call_in_thread, function, recorder, args, kwargs)
+        deferred.addCallback(_replay, recorder)
+        return deferred
+
+    @property
+    def thread_pool(self):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPool(minthreads=self.size,
+                    maxthreads=self.size, name='flow-storage')
+            self._thread_pool.start()
+            reactor.addSystemEventTrigger('during', 'shutdown',
+                    self._thread_pool.stop)
+            LOG.debug('Started %d storage threads', self.size)
+        return self._thread_pool
+
+
+def _call_in_thread(function, service_interfaces, args, kwargs):
+    # deferToThreadPool cannot pass a Deferred back as the result
+    return [function(service_interfaces, *args, **kwargs)]
+
+
+def _replay(wrapped_result, recorder):
+    deferreds = recorder.replay()
+    result = wrapped_result[0]
+    if isinstance(result, defer.Deferred):
+        deferreds.insert(0, result)
+
+    if deferreds:
+        return gather(deferreds)
+    else:
+        return result
+
+
+class RecordingServiceLocator(flow.interfaces.IServiceLocator):
+    """
+    Stands in for service_interfaces in a storage thread.  Services are
+    only looked up when the recorded calls are replayed, so get never
+    returns its default.
+    """
+    def __init__(self, service_interfaces):
+        self.service_interfaces = service_interfaces
+        self.calls = []
+
+    def __getitem__(self, name):
+        return _RecordingService(self.calls, name)
+
+    def get(self, name, default=None):
+        return self[name]
+
+    def replay(self):
+        """
+        Makes the recorded calls and returns their deferreds.
+        """
+        deferreds = []
+        for name, method_name, args, kwargs in self.calls:
+            method = getattr(self.service_interfaces[name], method_name)
+            deferreds.append(defer.maybeDeferred(method, *args, **kwargs))
+
+        self.calls = []
+        return deferreds
+
+
+class _RecordingService(object):
+    def __init__(self, calls, name):
+        self._calls = calls
+        self._name = name
+
+    def __getattr__(self, method_name):
+        def record(*args, **kwargs):
+            self._calls.append((self._name, method_name, args, kwargs))
+            return defer.succeed(None)
+        return record
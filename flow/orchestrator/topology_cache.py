@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from flow.configuration.settings.injector import setting
+from flow.redisom import get_object
+from injector import inject, singleton
+
+import flow.interfaces
+import logging
+import threading
+
+
+LOG = logging.getLogger(__name__)
+
+
+@singleton
+@inject(storage=flow.interfaces.IStorage,
+        max_size=setting('orchestrator.topology_cache_size', 0))
+class TopologyCache(object):
+    """
+    Keeps the NetTopology of up to max_size recently used nets.  A stored
+    net's topology never changes after Builder.store, so entries are only
+    ever evicted, never refreshed.  An entry whose net has expired or been
+    deleted is evicted when it is next looked up.  With max_size 0 nothing
+    is cached.  Lookups may be made from storage threads.
+    """
+    def __init__(self):
+        self._topologies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, net_key):
+        """
+        Returns (net, topology) for net_key.  net is a new object on every
+        call.  topology is None when caching is disabled.
+        """
+        if self.max_size <= 0:
+            return get_object(self.storage, net_key), None
+
+        with self._lock:
+            topology = self._topologies.get(net_key)
+
+        if topology is not None:
+            # a net of its own for every lookup, since redisom objects keep
+            # loaded values and must not be shared between storage threads
+            net = topology.new_net()
+            # serving a deleted net would recreate its keys without a TTL
+            if net.connection.exists(net_key):
+                with self._lock:
+                    self._topologies.pop(net_key, None)
+                    self._topologies[net_key] = topology
+                return net, topology
+
+            with self._lock:
+                self._topologies.pop(net_key, None)
+            LOG.debug('Evicted topology of missing net (%s)', net_key)
+
+        # two threads may both load a missing net; the results are the same
+        net = get_object(self.storage, net_key)
+        topology = net.load_topology()
+
+        with self._lock:
+            self._topologies.pop(net_key, None)
+            if len(self._topologies) >= self.max_size:
+                evicted_key, _ = self._topologies.popitem(last=False)
+                LOG.debug('Evicted topology of net (%s)', evicted_key)
+            self._topologies[net_key] = topology
+
+        return net, topology
@@ -11,11 +11,19 @@ class ActionBase(rom.Object):
     def name(self):
         return '%s (%s)' % (self.__class__, self.key)
 
-    def _on_create(self):
-        for argname in self.required_arguments:
-            if not argname in self.args:
+    @classmethod
+    def create(cls, connection=None, key=None, args=None):
+        # checked before anything is written, so that creation does not
+        # need to read the arguments back (see rom.DeferredWriteSession)
+        cls.check_arguments(args or {})
+        return rom.create_object(cls, connection, key, args=args)
+
+    @classmethod
+    def check_arguments(cls, args):
+        for argname in cls.required_arguments:
+            if not argname in args:
                 raise TypeError("In class %s: required argument %s missing" %
-                        (self.__class__.__name__, argname))
+                        (cls.__name__, argname))
 
 
     def execute(self, net, color_descriptor, active_tokens, service_interfaces):
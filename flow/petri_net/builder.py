@@ -1,3 +1,4 @@
+from flow.petri_net.compact_net import CompactNet
 from flow.petri_net.future import FutureBarrierTransition
 from flow.petri_net.future import FutureBasicTransition
 from flow.petri_net.net import Net
@@ -5,6 +6,7 @@ from flow.petri_net.place import Place
 from flow.petri_net.transitions.barrier import BarrierTransition
 from flow.petri_net.transitions.basic import BasicTransition
 
+import flow.redisom as rom
 import logging
 
 
@@ -16,9 +18,17 @@ class Builder(object):
         self.connection = connection
 
     def store(self, future_net, variables, constants):
+        """
+        Stores future_net with every write buffered in a deferred write
+        session, so the whole net is sent as one MULTI/EXEC pipeline.
+        """
         future_places, future_transitions = gather_nodes(future_net)
 
-        stored_net = self.create_stored_net(future_net, variables, constants)
+        key = Net.make_default_key()
+        session = rom.DeferredWriteSession(
+                rom.connection_for(self.connection, key))
+        stored_net = self.create_stored_net(future_net, variables, constants,
+                connection=session, key=key)
 
         for place, index in future_places.iteritems():
             self.store_place(stored_net, place, index, future_transitions)
@@ -29,14 +39,31 @@ class Builder(object):
         stored_net.num_places = len(future_places)
         stored_net.num_transitions = len(future_transitions)
 
+        gather_places = gather_place_indices(future_places)
+        if gather_places:
+            stored_net.gather_places.update(gather_places)
+
+        basic_arcs_out = basic_arcs_out_by_place(future_places,
+                future_transitions)
+        if basic_arcs_out:
+            stored_net.basic_arcs_out.update(basic_arcs_out)
+
+        LOG.debug('Storing net (%s) with %d commands', stored_net.key,
+                len(session))
+        session.flush()
+
         self.future_places = future_places
         self.future_transitions = future_transitions
 
-        return stored_net
+        return Net(self.connection, key)
+
 
+    def create_stored_net(self, future_net, variables, constants,
+            connection=None, key=None):
+        if connection is None:
+            connection = self.connection
 
-    def create_stored_net(self, future_net, variables, constants):
-        stored_net = Net.create(self.connection)
+        stored_net = Net.create(connection, key)
         stored_net.name = future_net.name
 
         stored_net.variables = variables
@@ -49,7 +76,7 @@ class Builder(object):
 
     def store_place(self, stored_net, future_place, index, future_transitions):
         key = stored_net.place_key(index)
-        stored_place = Place.create(self.connection, key,
+        stored_place = Place.create(stored_net.connection, key,
                 name=future_place.name, index=index)
 
         for arc in future_place.arcs_in:
@@ -62,15 +89,10 @@ class Builder(object):
 
     def store_transition(self, stored_net, future_transition,
             index, future_places):
-        if isinstance(future_transition, FutureBasicTransition):
-            cls = BasicTransition
-        elif isinstance(future_transition, FutureBarrierTransition):
-            cls = BarrierTransition
-        else:
-            raise RuntimeError('Unknown FutureTransition')
+        cls = transition_class(future_transition)
 
         key = stored_net.transition_key(index)
-        stored_transition = cls.create(self.connection, key,
+        stored_transition = cls.create(stored_net.connection, key,
                 name=future_transition.name, index=index)
 
         if future_transition.action is not None:
@@ -88,6 +110,83 @@ class Builder(object):
         return stored_transition
 
 
+class CompactBuilder(Builder):
+    """
+    Stores nets as CompactNets, writing the whole net in one transaction.
+    """
+    def store(self, future_net, variables, constants):
+        future_places, future_transitions = gather_nodes(future_net)
+
+        places = [None] * len(future_places)
+        for place, index in future_places.iteritems():
+            places[index] = (place.name,
+                    _arc_indices(place.arcs_in, future_transitions),
+                    _arc_indices(place.arcs_out, future_transitions))
+
+        transitions = [None] * len(future_transitions)
+        for transition, index in future_transitions.iteritems():
+            if transition.action is None:
+                action_cls, action_args = None, None
+            else:
+                action_cls = transition.action.cls
+                action_args = convert_action_args(transition.action.args,
+                        future_places)
+
+            transitions[index] = (transition_class(transition),
+                    transition.name,
+                    _arc_indices(transition.arcs_in, future_places),
+                    _arc_indices(transition.arcs_out, future_places),
+                    action_cls, action_args)
+
+        stored_net = CompactNet.store(self.connection, future_net.name,
+                variables, constants, places, transitions,
+                gather_places=gather_place_indices(future_places),
+                basic_arcs_out=basic_arcs_out_by_place(future_places,
+                    future_transitions))
+
+        self.future_places = future_places
+        self.future_transitions = future_transitions
+
+        return stored_net
+
+
+def _arc_indices(arcs, indices):
+    return [indices[arc] for arc in arcs]
+
+
+def gather_place_indices(future_places):
+    """
+    Returns the indices of the places whose arcs out all lead to barrier
+    transitions (see Net.gather_places).
+    """
+    return sorted(index for place, index in future_places.iteritems()
+            if place.arcs_out and all(isinstance(t, FutureBarrierTransition)
+                for t in place.arcs_out))
+
+
+def basic_arcs_out_by_place(future_places, future_transitions):
+    """
+    Returns the indices of the basic transitions each place feeds, for the
+    places that feed any (see Net.basic_arcs_out).
+    """
+    result = {}
+    for place, index in future_places.iteritems():
+        basic = sorted(future_transitions[t] for t in place.arcs_out
+                if isinstance(t, FutureBasicTransition))
+        if basic:
+            result[index] = basic
+    return result
+
+
+def transition_class(future_transition):
+    if isinstance(future_transition, FutureBasicTransition):
+        return BasicTransition
+    elif isinstance(future_transition, FutureBarrierTransition):
+        return BarrierTransition
+    else:
+        raise RuntimeError('Unknown FutureTransition')
+
+
 def gather_nodes(future_net):
     future_places = {}
     future_transitions = {}
@@ -0,0 +1,194 @@
+from flow.petri_net.net import Net
+from flow.petri_net.token import CompactToken
+from flow.petri_net.topology import NetTopology
+
+import flow.redisom as rom
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class CompactNet(Net):
+    """
+    A net whose static topology is kept in the single structure hash instead
+    of in separate keys for every place and transition.  Each node is one
+    JSON record: places hold their name and arcs, transitions also hold
+    their class_info and the class_info of their stored action (if any).
+    The arcs of every transition are also kept in the arcs hash, one JSON
+    list per field, so that scripts only decode the arcs they need.
+
+    Runtime state -- markings, transition state and stored actions -- uses
+    the same keys as it does for Net.  Tokens are CompactTokens.  Nodes
+    cannot be added after the net has been stored.
+    """
+    structure = rom.Property(rom.Hash, value_encoder=rom.json_enc,
+            value_decoder=rom.json_dec)
+    arcs = rom.Property(rom.Hash, value_encoder=rom.json_enc,
+            value_decoder=rom.json_dec)
+
+    token_class = CompactToken
+
+    @classmethod
+    def store(cls, connection, name, variables, constants, places,
+            transitions, gather_places=(), basic_arcs_out=None):
+        """
+        Writes a new net with a single MULTI/EXEC pipeline.
+
+        places is a list of (name, arcs_in, arcs_out) tuples and transitions
+        a list of (transition_class, name, arcs_in, arcs_out, action_class,
+        action_args) tuples, both in index order.  action_class is None for
+        transitions with no stored action.  gather_places and
+        basic_arcs_out are stored as the Net properties of the same name.
+        """
+        net = cls(connection=connection, key=cls.make_default_key())
+
+        structure = {}
+        for idx, (place_name, arcs_in, arcs_out) in enumerate(places):
+            structure[net.place_field(idx)] = {'name': place_name,
+                    'arcs_in': arcs_in, 'arcs_out': arcs_out}
+
+        actions = []
+        arcs = {}
+        for idx, (trans_cls, trans_name, arcs_in, arcs_out, action_cls,
+                action_args) in enumerate(transitions):
+            record = {'class': trans_cls._info, 'name': trans_name,
+                    'arcs_in': arcs_in, 'arcs_out': arcs_out, 'action': None}
+            arcs[net.arcs_field(idx, 'arcs_in')] = arcs_in
+            arcs[net.arcs_field(idx, 'arcs_out')] = arcs_out
+
+            if action_cls is not None:
+                action_cls.check_arguments(action_args or {})
+                record['action'] = action_cls._info
+                action = action_cls(connection=net.connection,
+                        key=net.transition_action_key(idx))
+                actions.append((action, action_args))
+
+            structure[net.transition_field(idx)] = record
+
+        pipe = net.connection.pipeline()
+        pipe.set(net.key, cls._info)
+        pipe.set(net.name.key, name)
+        if variables:
+            pipe.hmset(net.variables.key, net.variables._encode(variables))
+        if constants:
+            pipe.hmset(net._constants.key, net._constants._encode(constants))
+        pipe.hmset(net.counters.key, net.initial_counters(len(places),
+            len(transitions)))
+        if structure:
+            pipe.hmset(net.structure.key, net.structure._encode(structure))
+        if arcs:
+            pipe.hmset(net.arcs.key, net.arcs._encode(arcs))
+        if gather_places:
+            pipe.sadd(net.gather_places.key, *gather_places)
+        if basic_arcs_out:
+            pipe.hmset(net.basic_arcs_out.key,
+                    net.basic_arcs_out._encode(basic_arcs_out))
+
+        for action, action_args in actions:
+            pipe.set(action.key, action._info)
+            if action_args:
+                pipe.hmset(action.args.key, action.args._encode(action_args))
+
+        pipe.execute()
+
+        LOG.debug('Stored compact net (%s): %d places, %d transitions',
+                net.key, len(places), len(transitions))
+        return net
+
+    @staticmethod
+    def place_field(idx):
+        return 'P%s' % idx
+
+    @staticmethod
+    def transition_field(idx):
+        return 'T%s' % idx
+
+    @staticmethod
+    def arcs_field(idx, name):
+        return 'T%s.%s' % (idx, name)
+
+
+    def add_place(self, name):
+        raise TypeError('Cannot add a place to compact net (%s)' % self.key)
+
+    def add_transition(self, cls, *args, **kwargs):
+        raise TypeError('Cannot add a transition to compact net (%s)'
+                % self.key)
+
+    def transition(self, idx):
+        trans, action, arcs_out = self.load_transition(idx)
+        return trans
+
+    def load_transition(self, idx):
+        field = self.transition_field(idx)
+        record = self.structure.get(field)
+        if record is None:
+            raise rom.NotInRedisError("No transition %s in net (%s)"
+                    % (idx, self.key))
+        trans, action = self._transition_from_record(idx, record)
+        return trans, action, record['arcs_out']
+
+    def transitions_and_actions(self, idxs):
+        idxs = list(idxs)
+        if not idxs:
+            return []
+
+        records = self.structure.values(
+                [self.transition_field(idx) for idx in idxs])
+        return [(None, None) if record is None
+                else self._transition_from_record(idx, record)
+                for idx, record in zip(idxs, records)]
+
+    def place_arcs_out(self, idx):
+        record = self.structure.get(self.place_field(idx))
+        if record is None:
+            raise rom.NotInRedisError("No place %s in net (%s)"
+                    % (idx, self.key))
+        return record['arcs_out']
+
+    def place_names(self, place_idxs):
+        place_idxs = list(place_idxs)
+        if not place_idxs:
+            return {}
+
+        records = self.structure.values(
+                [self.place_field(idx) for idx in place_idxs])
+        return dict((idx, record['name'])
+                for idx, record in zip(place_idxs, records))
+
+    def load_topology(self):
+        """
+        Reads the whole topology with a single HGETALL.
+        """
+        structure = self.structure.value
+        num_places = len([f for f in structure if f.startswith('P')])
+        num_transitions = len(structure) - num_places
+
+        place_arcs_out = [tuple(structure[self.place_field(idx)]['arcs_out'])
+                for idx in xrange(num_places)]
+
+        transition_classes = []
+        transition_arcs_out = []
+        for idx in xrange(num_transitions):
+            record = structure[self.transition_field(idx)]
+            transition_classes.append((record['class'], record['action']))
+            transition_arcs_out.append(tuple(record['arcs_out']))
+
+        LOG.debug('Loaded topology of compact net (%s): %d places, '
+                '%d transitions', self.key, num_places, num_transitions)
+
+        return NetTopology(self, place_arcs_out=tuple(place_arcs_out),
+                transition_classes=tuple(transition_classes),
+                transition_arcs_out=tuple(transition_arcs_out))
+
+    def transition_from_classes(self, idx, transition_info, action_info):
+        trans, action = Net.transition_from_classes(self, idx,
+                transition_info, action_info)
+        trans.arcs_hash_key = self.arcs.key
+        trans.arcs_field_format = self.arcs_field(idx, '%s')
+        return trans, action
+
+    def _transition_from_record(self, idx, record):
+        return self.transition_from_classes(idx, record['class'],
+                record['action'])
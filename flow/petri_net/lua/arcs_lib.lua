@@ -0,0 +1,20 @@
+-- Arcs are either stored as a list at key (when field is empty) or, for
+-- compact nets, as a JSON list in field of the arcs hash at key.
+local read_arcs = function(key, field)
+    if field == '' then
+        return redis.call('LRANGE', key, 0, -1)
+    end
+
+    local arcs = redis.call('HGET', key, field)
+    if arcs == false then
+        return {}
+    end
+    return cjson.decode(arcs)
+end
+
+local count_arcs = function(key, field)
+    if field == '' then
+        return redis.call('LLEN', key)
+    end
+    return #read_arcs(key, field)
+end
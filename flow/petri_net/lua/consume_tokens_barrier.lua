@@ -1,19 +1,21 @@
 local state_set_key = KEYS[1]
 local active_tokens_key = KEYS[2]
 local arcs_in_key = KEYS[3]
-local color_marking_key = KEYS[4]
-local group_marking_key = KEYS[5]
-local enablers_key = KEYS[6]
-local transient_keys_key = KEYS[7]
+local enablers_key = KEYS[4]
+local transient_keys_key = KEYS[5]
+-- with only the color and group markings, every place is treated as a
+-- plain place
+local marking = read_marking(6, 6)
+local color_marking_key = marking[1]
+local group_marking_key = marking[2]
+local gather_places_key = marking[3]
+local group_tokens_prefix = marking[6]
 
 local place_key = ARGV[1]
 local cg_id = ARGV[2]
 local cg_first = ARGV[3]
 local cg_end = ARGV[4]
-
-local marking_key = function(color_tag, place_id)
-    return string.format("%s:%s", color_tag, place_id)
-end
+local arcs_in_field = ARGV[5]
 
 local cg_last = cg_end - 1
 local expected_count = cg_end - cg_first
@@ -44,7 +46,7 @@ if n_active_tok > 0 then
     return {0, "Transition already has tokens"}
 end
 
-local arcs_in = redis.call('LRANGE', arcs_in_key, 0, -1)
+local arcs_in = read_arcs(arcs_in_key, arcs_in_field)
 
 local token_counts = {}
 remaining_places = 0
@@ -64,8 +66,28 @@ end
 
 redis.call('HSET', enablers_key, cg_id, place_key)
 
-local token_keys = {}
+-- Gather places keep a set and a hash of the tokens of each color group,
+-- so their tokens are moved and unmarked without a command per color.
+local gather_places = {}
+local plain_places = {}
 for i, place_id in pairs(arcs_in) do
+    if group_tokens_prefix and
+            redis.call('SISMEMBER', gather_places_key, place_id) == 1 then
+        local group_tokens_key = group_tokens_prefix ..
+            marking_key(cg_id, place_id)
+        if redis.call('SCARD', group_tokens_key) ~= expected_count then
+            return {-1, string.format(
+                "Mismatch between group marking and group tokens at " ..
+                "place %s", place_id)}
+        end
+        table.insert(gather_places, place_id)
+    else
+        table.insert(plain_places, place_id)
+    end
+end
+
+local token_keys = {}
+for i, place_id in pairs(plain_places) do
     for color = cg_first, cg_last do
         local key = marking_key(color, place_id)
         local token_key = redis.call('HGET', color_marking_key, key)
@@ -78,19 +100,31 @@ for i, place_id in pairs(arcs_in) do
     end
 end
 
+for i, place_id in pairs(gather_places) do
+    local group_key = marking_key(cg_id, place_id)
+    local group_tokens_key = group_tokens_prefix .. group_key
+    if expected_count == 0 then
+        -- an empty color group has no set to move
+    elseif i == 1 then
+        redis.call('RENAME', group_tokens_key, active_tokens_key)
+        redis.call('DEL', group_colors_key(marking, group_key))
+    else
+        redis.call('SUNIONSTORE', active_tokens_key, active_tokens_key,
+            group_tokens_key)
+        redis.call('DEL', group_tokens_key,
+            group_colors_key(marking, group_key))
+    end
+    redis.call('HDEL', group_marking_key, group_key)
+    count_place_tokens(marking, place_id, -expected_count)
+end
+
 for i, token_info in pairs(token_keys) do
     local token_key = token_info[1]
     local color = token_info[2]
     local place_id = token_info[3]
-    local cp_key = marking_key(color, place_id)
-    local gp_key = marking_key(cg_id, place_id)
 
     redis.call('SADD', active_tokens_key, token_key)
-    redis.call('HDEL', color_marking_key, cp_key)
-    local res = redis.call('HINCRBY', group_marking_key, gp_key, -1)
-    if res == 0 then
-        redis.call("HDEL", group_marking_key, gp_key)
-    end
+    unmark_token(marking, place_id, color, cg_id)
 end
 
 redis.call('SADD', transient_keys_key, active_tokens_key)
@@ -0,0 +1,70 @@
+-- When the net has a basic_arcs_out hash (marking[4]), enablement is
+-- checked with the satisfied_places counter of this transition.  Older nets
+-- track the places still missing a token in the state set instead.
+local consume_tokens_basic = function(state_set_key, active_tokens_key,
+        arcs_in_key, arcs_in_field, marking, satisfied_places_key,
+        enablers_key, transient_keys_key, place_key, cg_id, color)
+
+    local counted = marking[4] and redis.call('EXISTS', marking[4]) == 1
+
+    if counted then
+        local satisfied = tonumber(
+            redis.call('HGET', satisfied_places_key, color)) or 0
+        local remaining_places = count_arcs(arcs_in_key,
+            arcs_in_field) - satisfied
+        if remaining_places > 0 then
+            return {remaining_places, "Waiting for places"}
+        end
+    else
+        redis.call('SREM', state_set_key, place_key)
+        local remaining_places = redis.call('SCARD', state_set_key)
+        if remaining_places > 0 then
+            return {remaining_places, "Waiting for places"}
+        end
+
+        redis.call('SREM', transient_keys_key, state_set_key)
+    end
+
+    local enabler_value = redis.call('HGET', enablers_key, color)
+    if enabler_value and enabler_value ~= place_key then
+        return {-1, "Transition enabled by a different place: " .. enabler_value}
+    end
+
+    local n_active_tok = redis.call('SCARD', active_tokens_key)
+    if n_active_tok > 0 then
+        return {0, "Transition already has tokens"}
+    end
+
+    local arcs_in = read_arcs(arcs_in_key, arcs_in_field)
+
+    local token_keys = {}
+    local remaining_places = 0
+    for i, place_id in pairs(arcs_in) do
+        local key = marking_key(color, place_id)
+        token_keys[place_id] = redis.call('HGET', marking[1], key)
+        if token_keys[place_id] == false then
+            if counted then
+                return {-1, string.format("Mismatch between satisfied " ..
+                    "places and color marking at place %s", place_id)}
+            end
+            redis.call('SADD', state_set_key, place_id)
+            remaining_places = remaining_places + 1
+        end
+    end
+
+    if remaining_places > 0 then
+        redis.call('SADD', transient_keys_key, state_set_key)
+        return {remaining_places, "Waiting for places (after full check)"}
+    end
+
+    redis.call('HSET', enablers_key, color, place_key)
+
+    for place_id, token_key in pairs(token_keys) do
+        redis.call('SADD', active_tokens_key, token_key)
+        unmark_token(marking, place_id, color, cg_id)
+    end
+
+    redis.call('SADD', transient_keys_key, active_tokens_key)
+
+    return {0, "Transition enabled"}
+end
@@ -0,0 +1,12 @@
+local counters_key = KEYS[1]
+
+local layout = {ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5], ARGV[6]}
+local color = ARGV[7]
+local cg_id = ARGV[8]
+
+local data = {}
+for i = 9, #ARGV do
+    data[#data + 1] = ARGV[i]
+end
+
+return create_token(counters_key, layout, color, cg_id, data)
@@ -0,0 +1,24 @@
+local counters_key = KEYS[1]
+
+local layout = {ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5], ARGV[6]}
+local cg_id = ARGV[7]
+local first_color = tonumber(ARGV[8])
+local count = tonumber(ARGV[9])
+
+-- ARGV continues with, for each token, its number of data keys followed by
+-- alternating data keys and encoded values.
+local first_idx = reserve_tokens(counters_key, layout, count)
+
+local arg = 10
+for i = 0, count - 1 do
+    local num_data = tonumber(ARGV[arg]) * 2
+    local data = {}
+    for j = 1, num_data do
+        data[j] = ARGV[arg + j]
+    end
+    arg = arg + num_data + 1
+
+    write_token(layout, first_idx + i, first_color + i, cg_id, data)
+end
+
+return first_idx
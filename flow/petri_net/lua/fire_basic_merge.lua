@@ -0,0 +1,72 @@
+local state_set_key = KEYS[1]
+local active_tokens_key = KEYS[2]
+local arcs_in_key = KEYS[3]
+local arcs_out_key = KEYS[4]
+local enablers_key = KEYS[5]
+local transient_keys_key = KEYS[6]
+local counters_key = KEYS[7]
+local satisfied_places_key = KEYS[8]
+local marking = read_marking(9, 12)
+
+local place_key = ARGV[1]
+local cg_id = ARGV[2]
+local color = ARGV[3]
+local token_layout = {ARGV[4], ARGV[5], ARGV[6], ARGV[7], ARGV[8], ARGV[9]}
+local arcs_in_field = ARGV[10]
+local arcs_out_field = ARGV[11]
+
+local token_key_prefix = token_layout[2]
+local key_delim = token_layout[5]
+
+local FIRE_ERROR = -2
+local DATA_CONFLICT = -3
+
+local token_data_key = function(token_idx)
+    return token_key_prefix .. token_idx .. key_delim .. 'data'
+end
+
+local rv = consume_tokens_basic(state_set_key, active_tokens_key, arcs_in_key,
+    arcs_in_field, marking, satisfied_places_key, enablers_key,
+    transient_keys_key, place_key, cg_id, color)
+if rv[1] ~= 0 then
+    return rv
+end
+
+local active_tokens = redis.call('SMEMBERS', active_tokens_key)
+
+local new_token_idx
+if #active_tokens == 1 then
+    new_token_idx = active_tokens[1]
+else
+    local data = {}
+    for i, token_idx in ipairs(active_tokens) do
+        local src = redis.call('HGETALL', token_data_key(token_idx))
+        for j = 1, #src, 2 do
+            local hkey = src[j]
+            local value = src[j + 1]
+            if data[hkey] == nil then
+                data[hkey] = value
+            elseif data[hkey] ~= value then
+                return {DATA_CONFLICT, string.format(
+                    "Conflicting data in key (%s)", hkey)}
+            end
+        end
+    end
+
+    local data_list = {}
+    for hkey, value in pairs(data) do
+        data_list[#data_list + 1] = hkey
+        data_list[#data_list + 1] = value
+    end
+
+    new_token_idx = create_token(counters_key, token_layout, color, cg_id,
+        data_list)
+end
+
+rv = push_tokens(active_tokens_key, arcs_out_key, arcs_out_field,
+    marking, transient_keys_key, {{cg_id, color, new_token_idx}})
+if rv[1] ~= 0 then
+    return {FIRE_ERROR, rv[2]}
+end
+
+return {0, "Transition fired", tonumber(new_token_idx), rv[2]}
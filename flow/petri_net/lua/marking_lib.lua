@@ -0,0 +1,120 @@
+-- marking is {color_marking_key, group_marking_key, gather_places_key,
+-- basic_arcs_out_key, place_token_counts_key, group_tokens_prefix,
+-- satisfied_places_format, color_places_prefix}, see read_marking.
+--
+-- A token put into a gather place is kept out of the color marking: its
+-- color group has a set of its tokens there, which BarrierTransition moves
+-- as a whole, and a hash of them by color (see group_colors_key), which it
+-- deletes as a whole.  For each basic transition fed by a place, the
+-- number of its input places holding a token of each color is kept in its
+-- satisfied_places hash.  The number of tokens in each place and the
+-- places other than gather places holding each color are kept as indexes
+-- for queries (see Net.marking_page).
+--
+-- Scripts that only remove tokens may be given just the first two keys, in
+-- which case nothing but the markings is updated.
+
+local marking_key = function(tag, place_id)
+    return string.format("%s:%s", tag, place_id)
+end
+
+-- Reads the keys of Net.marking_keys starting at KEYS[key_idx] and the
+-- arguments of Net.marking_args starting at ARGV[arg_idx].
+local read_marking = function(key_idx, arg_idx)
+    local marking = {}
+    for i = 0, 4 do
+        marking[i + 1] = KEYS[key_idx + i]
+    end
+    for i = 0, 2 do
+        marking[i + 6] = ARGV[arg_idx + i]
+    end
+    return marking
+end
+
+local count_satisfied = function(marking, place_id, color, delta)
+    if not marking[4] then
+        return
+    end
+
+    local record = redis.call('HGET', marking[4], place_id)
+    if record == false then
+        return
+    end
+
+    for i, trans_id in ipairs(cjson.decode(record)) do
+        local key = string.format(marking[7], trans_id)
+        if redis.call('HINCRBY', key, color, delta) == 0 then
+            redis.call('HDEL', key, color)
+        end
+    end
+end
+
+-- Markings made before the counts were kept have no count to decrement,
+-- so counts are clamped at zero.
+local count_place_tokens = function(marking, place_id, delta)
+    if redis.call('HINCRBY', marking[5], place_id, delta) <= 0 then
+        redis.call('HDEL', marking[5], place_id)
+    end
+end
+
+local group_colors_key = function(marking, group_key)
+    return marking[6] .. group_key .. ":colors"
+end
+
+-- Returns the index of the token of color at place_id, or false.
+local marked_token = function(marking, place_id, color, cg_id)
+    if redis.call('SISMEMBER', marking[3], place_id) == 1 then
+        return redis.call('HGET', group_colors_key(marking,
+            marking_key(cg_id, place_id)), color)
+    end
+    return redis.call('HGET', marking[1], marking_key(color, place_id))
+end
+
+-- Returns false if the color already has a token at place_id.
+local mark_token = function(marking, place_id, color, cg_id, token_idx)
+    local group_key = marking_key(cg_id, place_id)
+    local gather = redis.call('SISMEMBER', marking[3], place_id) == 1
+
+    local set
+    if gather then
+        set = redis.call('HSETNX', group_colors_key(marking, group_key),
+            color, token_idx)
+    else
+        set = redis.call('HSETNX', marking[1], marking_key(color, place_id),
+            token_idx)
+    end
+    if set == 0 then
+        return false
+    end
+
+    redis.call('HINCRBY', marking[2], group_key, 1)
+    if gather then
+        redis.call('SADD', marking[6] .. group_key, token_idx)
+    end
+    count_satisfied(marking, place_id, color, 1)
+
+    count_place_tokens(marking, place_id, 1)
+    if not gather then
+        redis.call('SADD', marking[8] .. color, place_id)
+    end
+
+    return true
+end
+
+-- Tokens in gather places are only removed by consume_tokens_barrier, a
+-- color group at a time.
+
+local unmark_token = function(marking, place_id, color, cg_id)
+    redis.call('HDEL', marking[1], marking_key(color, place_id))
+
+    local group_key = marking_key(cg_id, place_id)
+    if redis.call('HINCRBY', marking[2], group_key, -1) == 0 then
+        redis.call('HDEL', marking[2], group_key)
+    end
+    count_satisfied(marking, place_id, color, -1)
+
+    if marking[5] then
+        count_place_tokens(marking, place_id, -1)
+        redis.call('SREM', marking[8] .. color, place_id)
+    end
+end
@@ -0,0 +1,29 @@
+-- tokens is a list of {color_group, color, token_key} triples, marking is
+-- described in marking_lib.lua
+local push_tokens = function(active_tokens_key, arcs_out_key, arcs_out_field,
+        marking, transient_keys_key, tokens)
+
+    local n_active_tok = redis.call('SCARD', active_tokens_key)
+    if n_active_tok == 0 then
+        return {-1, "No active tokens"}
+    end
+
+    local arcs_out = read_arcs(arcs_out_key, arcs_out_field)
+
+    for i, place_id in pairs(arcs_out) do
+        for j, token in ipairs(tokens) do
+            local color_group = token[1]
+            local color = token[2]
+            local token_key = token[3]
+            if not mark_token(marking, place_id, color, color_group,
+                    token_key) then
+                return {-1, "Place " .. place_id .. "is full"}
+            end
+        end
+    end
+
+    redis.call('DEL', active_tokens_key)
+    redis.call('SREM', transient_keys_key, active_tokens_key)
+
+    return {0, arcs_out}
+end
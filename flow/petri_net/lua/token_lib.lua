@@ -0,0 +1,42 @@
+-- layout is {net_key, token_key_prefix, class_info, class_info_field,
+-- key_delim, token_counter} (see Net.token_creation_args).  With an empty
+-- class_info_field each scalar of the token is a key of its own, otherwise
+-- they share one hash at the token key.  data is a list of alternating data
+-- keys and encoded values.
+
+-- Reserves count token indices and returns the first one.
+local reserve_tokens = function(counters_key, layout, count)
+    return redis.call('HINCRBY', counters_key, layout[6], count) - count
+end
+
+local write_token = function(layout, idx, color, cg_id, data)
+    local net_key = layout[1]
+    local key = layout[2] .. idx
+    local class_info = layout[3]
+    local class_info_field = layout[4]
+    local key_delim = layout[5]
+
+    if class_info_field == '' then
+        redis.call('SET', key, class_info)
+        redis.call('SET', key .. key_delim .. 'net_key', net_key)
+        redis.call('SET', key .. key_delim .. 'index', idx)
+        redis.call('SET', key .. key_delim .. 'color', color)
+        redis.call('SET', key .. key_delim .. 'color_group_idx', cg_id)
+    else
+        redis.call('HMSET', key, class_info_field, class_info,
+            'net_key', net_key, 'index', idx, 'color', color,
+            'color_group_idx', cg_id)
+    end
+
+    local data_key = key .. key_delim .. 'data'
+    for i = 1, #data, 2 do
+        redis.call('HSET', data_key, data[i], data[i + 1])
+    end
+end
+
+-- Returns the index of the new token.
+local create_token = function(counters_key, layout, color, cg_id, data)
+    local idx = reserve_tokens(counters_key, layout, 1)
+    write_token(layout, idx, color, cg_id, data)
+    return idx
+end
@@ -0,0 +1,449 @@
+"""
+Python versions of the petri net Lua scripts, run by MemoryStorage.  Each
+function follows the Lua file of the same name in flow/petri_net/lua
+statement for statement, so a change to a script has to be made here too.
+"""
+from flow.memory_storage import python_script
+from flow.petri_net.actions.merge import BasicMergeAction
+from flow.petri_net.net import Net
+from flow.petri_net.transitions.barrier import BarrierTransition
+from flow.petri_net.transitions.base import TransitionBase
+from flow.petri_net.transitions.basic import BasicTransition
+
+import json
+
+
+_FIRE_ERROR = -2
+_DATA_CONFLICT = -3
+
+
+# arcs_lib.lua
+def read_arcs(storage, key, field):
+    if field == '':
+        return storage.lrange(key, 0, -1)
+
+    arcs = storage.hget(key, field)
+    if arcs is None:
+        return []
+    return json.loads(arcs)
+
+
+def count_arcs(storage, key, field):
+    if field == '':
+        return storage.llen(key)
+    return len(read_arcs(storage, key, field))
+
+
+# marking_lib.lua
+def marking_key(tag, place_id):
+    return "%s:%s" % (tag, place_id)
+
+
+def read_marking(keys, args, key_idx, arg_idx):
+    return ([keys[key_idx + i] for i in xrange(5)] +
+            [args[arg_idx + i] for i in xrange(3)])
+
+
+def count_satisfied(storage, marking, place_id, color, delta):
+    if not marking[3]:
+        return
+
+    record = storage.hget(marking[3], place_id)
+    if record is None:
+        return
+
+    for trans_id in json.loads(record):
+        key = marking[6] % trans_id
+        if storage.hincrby(key, color, delta) == 0:
+            storage.hdel(key, color)
+
+
+def count_place_tokens(storage, marking, place_id, delta):
+    if storage.hincrby(marking[4], place_id, delta) <= 0:
+        storage.hdel(marking[4], place_id)
+
+
+def group_colors_key(marking, group_key):
+    return marking[5] + group_key + ':colors'
+
+
+def marked_token(storage, marking, place_id, color, cg_id):
+    if storage.sismember(marking[2], place_id):
+        return storage.hget(group_colors_key(marking,
+            marking_key(cg_id, place_id)), color)
+    return storage.hget(marking[0], marking_key(color, place_id))
+
+
+def mark_token(storage, marking, place_id, color, cg_id, token_idx):
+    group_key = marking_key(cg_id, place_id)
+    gather = storage.sismember(marking[2], place_id)
+
+    if gather:
+        added = storage.hsetnx(group_colors_key(marking, group_key), color,
+                token_idx)
+    else:
+        added = storage.hsetnx(marking[0], marking_key(color, place_id),
+                token_idx)
+    if not added:
+        return False
+
+    storage.hincrby(marking[1], group_key, 1)
+    if gather:
+        storage.sadd(marking[5] + group_key, token_idx)
+    count_satisfied(storage, marking, place_id, color, 1)
+
+    count_place_tokens(storage, marking, place_id, 1)
+    if not gather:
+        storage.sadd(marking[7] + str(color), place_id)
+
+    return True
+
+
+def unmark_token(storage, marking, place_id, color, cg_id):
+    storage.hdel(marking[0], marking_key(color, place_id))
+
+    group_key = marking_key(cg_id, place_id)
+    if storage.hincrby(marking[1], group_key, -1) == 0:
+        storage.hdel(marking[1], group_key)
+    count_satisfied(storage, marking, place_id, color, -1)
+
+    if marking[4]:
+        count_place_tokens(storage, marking, place_id, -1)
+        storage.srem(marking[7] + str(color), place_id)
+
+
+# token_lib.lua
+def reserve_tokens(storage, counters_key, layout, count):
+    return storage.hincrby(counters_key, layout[5], count) - count
+
+
+def write_token(storage, layout, idx, color, cg_id, data):
+    net_key, token_key_prefix, class_info, class_info_field, key_delim = (
+            layout[:5])
+    key = token_key_prefix + str(idx)
+
+    if class_info_field == '':
+        storage.set(key, class_info)
+        storage.set(key + key_delim + 'net_key', net_key)
+        storage.set(key + key_delim + 'index', idx)
+        storage.set(key + key_delim + 'color', color)
+        storage.set(key + key_delim + 'color_group_idx', cg_id)
+    else:
+        storage.hmset(key, {class_info_field: class_info,
+            'net_key': net_key, 'index': idx, 'color': color,
+            'color_group_idx': cg_id})
+
+    data_key = key + key_delim + 'data'
+    for i in xrange(0, len(data), 2):
+        storage.hset(data_key, data[i], data[i + 1])
+
+
+def create_token(storage, counters_key, layout, color, cg_id, data):
+    idx = reserve_tokens(storage, counters_key, layout, 1)
+    write_token(storage, layout, idx, color, cg_id, data)
+    return idx
+
+
+# push_tokens_lib.lua
+def push_tokens(storage, active_tokens_key, arcs_out_key, arcs_out_field,
+        marking, transient_keys_key, tokens):
+    if storage.scard(active_tokens_key) == 0:
+        return [-1, "No active tokens"]
+
+    arcs_out = read_arcs(storage, arcs_out_key, arcs_out_field)
+
+    for place_id in arcs_out:
+        for color_group, color, token_key in tokens:
+            if not mark_token(storage, marking, place_id, color, color_group,
+                    token_key):
+                return [-1, "Place %s is full" % place_id]
+
+    storage.delete(active_tokens_key)
+    storage.srem(transient_keys_key, active_tokens_key)
+
+    return [0, arcs_out]
+
+
+# consume_tokens_basic_lib.lua
+def consume_tokens_basic(storage, state_set_key, active_tokens_key,
+        arcs_in_key, arcs_in_field, marking, satisfied_places_key,
+        enablers_key, transient_keys_key, place_key, cg_id, color):
+
+    counted = bool(marking[3]) and storage.exists(marking[3])
+
+    if counted:
+        satisfied = int(storage.hget(satisfied_places_key, color) or 0)
+        remaining_places = count_arcs(storage, arcs_in_key,
+                arcs_in_field) - satisfied
+        if remaining_places > 0:
+            return [remaining_places, "Waiting for places"]
+    else:
+        storage.srem(state_set_key, place_key)
+        remaining_places = storage.scard(state_set_key)
+        if remaining_places > 0:
+            return [remaining_places, "Waiting for places"]
+
+        storage.srem(transient_keys_key, state_set_key)
+
+    enabler_value = storage.hget(enablers_key, color)
+    if enabler_value is not None and enabler_value != place_key:
+        return [-1, "Transition enabled by a different place: %s"
+                % enabler_value]
+
+    if storage.scard(active_tokens_key) > 0:
+        return [0, "Transition already has tokens"]
+
+    arcs_in = read_arcs(storage, arcs_in_key, arcs_in_field)
+
+    token_keys = {}
+    remaining_places = 0
+    for place_id in arcs_in:
+        token_keys[place_id] = storage.hget(marking[0],
+                marking_key(color, place_id))
+        if token_keys[place_id] is None:
+            if counted:
+                return [-1, "Mismatch between satisfied places and color "
+                        "marking at place %s" % place_id]
+            storage.sadd(state_set_key, place_id)
+            remaining_places += 1
+
+    if remaining_places > 0:
+        storage.sadd(transient_keys_key, state_set_key)
+        return [remaining_places, "Waiting for places (after full check)"]
+
+    storage.hset(enablers_key, color, place_key)
+
+    for place_id, token_key in token_keys.iteritems():
+        storage.sadd(active_tokens_key, token_key)
+        unmark_token(storage, marking, place_id, color, cg_id)
+
+    storage.sadd(transient_keys_key, active_tokens_key)
+
+    return [0, "Transition enabled"]
+
+
+@python_script(BasicTransition._rom_scripts['_consume_tokens'])
+def consume_tokens_basic_script(storage, keys, args):
+    marking = read_marking(keys, args, 7, 5)
+    return consume_tokens_basic(storage, keys[1], keys[2], keys[3], args[4],
+            marking, keys[6], keys[4], keys[5], args[1], args[2], args[3])
+
+
+@python_script(BasicTransition._rom_scripts['_fire_basic_merge'])
+def fire_basic_merge(storage, keys, args):
+    (state_set_key, active_tokens_key, arcs_in_key, arcs_out_key,
+            enablers_key, transient_keys_key, counters_key,
+            satisfied_places_key) = keys[1:9]
+    marking = read_marking(keys, args, 9, 12)
+
+    place_key, cg_id, color = args[1:4]
+    token_layout = args[4:10]
+    arcs_in_field, arcs_out_field = args[10:12]
+
+    token_key_prefix = token_layout[1]
+    key_delim = token_layout[4]
+
+    rv = consume_tokens_basic(storage, state_set_key, active_tokens_key,
+            arcs_in_key, arcs_in_field, marking, satisfied_places_key,
+            enablers_key, transient_keys_key, place_key, cg_id, color)
+    if rv[0] != 0:
+        return rv
+
+    active_tokens = list(storage.smembers(active_tokens_key))
+
+    if len(active_tokens) == 1:
+        new_token_idx = active_tokens[0]
+    else:
+        data = {}
+        for token_idx in active_tokens:
+            src = storage.hgetall(token_key_prefix + token_idx + key_delim +
+                    'data')
+            for hkey, value in src.iteritems():
+                if hkey not in data:
+                    data[hkey] = value
+                elif data[hkey] != value:
+                    return [_DATA_CONFLICT,
+                            "Conflicting data in key (%s)" % hkey]
+
+        data_list = []
+        for hkey, value in data.iteritems():
+            data_list.extend([hkey, value])
+
+        new_token_idx = create_token(storage, counters_key, token_layout,
+                color, cg_id, data_list)
+
+    rv = push_tokens(storage, active_tokens_key, arcs_out_key,
+            arcs_out_field, marking, transient_keys_key,
+            [(cg_id, color, new_token_idx)])
+    if rv[0] != 0:
+        return [_FIRE_ERROR, rv[1]]
+
+    return [0, "Transition fired", int(new_token_idx), rv[1]]
+
+
+@python_script(BarrierTransition._rom_scripts['_consume_tokens'])
+def consume_tokens_barrier(storage, keys, args):
+    (state_set_key, active_tokens_key, arcs_in_key, enablers_key,
+            transient_keys_key) = keys[1:6]
+    marking = read_marking(keys, args, 6, 6)
+    color_marking_key, group_marking_key, gather_places_key = marking[:3]
+    group_tokens_prefix = marking[5]
+
+    place_key, cg_id = args[1:3]
+    cg_first, cg_end = int(args[3]), int(args[4])
+    arcs_in_field = args[5]
+
+    expected_count = cg_end - cg_first
+
+    count = int(storage.hget(group_marking_key,
+        marking_key(cg_id, place_key)) or 0)
+
+    remaining_tokens = expected_count - count
+    if remaining_tokens > 0:
+        return [remaining_tokens,
+                "Incoming tokens remaining at place: %s" % place_key]
+
+    storage.srem(state_set_key, place_key)
+    remaining_places = storage.scard(state_set_key)
+    if remaining_places > 0:
+        return [remaining_places, "Waiting for places"]
+
+    storage.srem(transient_keys_key, state_set_key)
+
+    enabler_value = storage.hget(enablers_key, cg_id)
+    if enabler_value is not None and enabler_value != place_key:
+        return [-1, "Transition enabled by a different place: %s"
+                % enabler_value]
+
+    if storage.scard(active_tokens_key) > 0:
+        return [0, "Transition already has tokens"]
+
+    arcs_in = read_arcs(storage, arcs_in_key, arcs_in_field)
+
+    remaining_places = 0
+    for place_id in arcs_in:
+        token_count = storage.hget(group_marking_key,
+                marking_key(cg_id, place_id))
+        if token_count is None or int(token_count) != expected_count:
+            storage.sadd(state_set_key, place_id)
+            remaining_places += 1
+
+    if remaining_places > 0:
+        storage.sadd(transient_keys_key, state_set_key)
+        return [remaining_places, "Waiting for places (after full check)"]
+
+    storage.hset(enablers_key, cg_id, place_key)
+
+    gather_places = []
+    plain_places = []
+    for place_id in arcs_in:
+        if group_tokens_prefix and storage.sismember(gather_places_key,
+                place_id):
+            group_tokens_key = group_tokens_prefix + marking_key(cg_id,
+                    place_id)
+            if storage.scard(group_tokens_key) != expected_count:
+                return [-1, "Mismatch between group marking and group "
+                        "tokens at place %s" % place_id]
+            gather_places.append(place_id)
+        else:
+            plain_places.append(place_id)
+
+    token_keys = []
+    for place_id in plain_places:
+        for color in xrange(cg_first, cg_end):
+            token_key = storage.hget(color_marking_key,
+                    marking_key(color, place_id))
+            if token_key is None:
+                return [-1, "Mismatch between group and color markings at "
+                        "place %s, color %s" % (place_id, color)]
+            token_keys.append((token_key, color, place_id))
+
+    for i, place_id in enumerate(gather_places):
+        group_key = marking_key(cg_id, place_id)
+        group_tokens_key = group_tokens_prefix + group_key
+        if expected_count == 0:
+            pass
+        elif i == 0:
+            storage.rename(group_tokens_key, active_tokens_key)
+            storage.delete(group_colors_key(marking, group_key))
+        else:
+            storage.sunionstore(active_tokens_key, active_tokens_key,
+                    group_tokens_key)
+            storage.delete(group_tokens_key,
+                    group_colors_key(marking, group_key))
+        storage.hdel(group_marking_key, group_key)
+        count_place_tokens(storage, marking, place_id, -expected_count)
+
+    for token_key, color, place_id in token_keys:
+        storage.sadd(active_tokens_key, token_key)
+        unmark_token(storage, marking, place_id, color, cg_id)
+
+    storage.sadd(transient_keys_key, active_tokens_key)
+
+    return [0, "Transition enabled"]
+
+
+@python_script(TransitionBase._rom_scripts['_push_tokens_script'])
+def push_tokens_script(storage, keys, args):
+    marking = read_marking(keys, args, 4, 2)
+    num_tokens = int(args[5])
+    tokens = [tuple(args[6 + i * 3:9 + i * 3]) for i in xrange(num_tokens)]
+
+    return push_tokens(storage, keys[1], keys[2], args[1], marking, keys[3],
+            tokens)
+
+
+@python_script(Net._rom_scripts['_put_token_script'])
+def put_token(storage, keys, args):
+    marking = read_marking(keys, args, 1, 5)
+    place_id, token_idx, color, color_group_idx = args[1:5]
+
+    if not mark_token(storage, marking, place_id, color, color_group_idx,
+            token_idx):
+        existing_idx = marked_token(storage, marking, place_id, color,
+                color_group_idx)
+        if existing_idx != token_idx:
+            return -1
+
+    return 0
+
+
+@python_script(Net._rom_scripts['_create_token_script'])
+def create_token_script(storage, keys, args):
+    return create_token(storage, keys[1], args[1:7], args[7], args[8],
+            args[9:])
+
+
+@python_script(Net._rom_scripts['_create_tokens_script'])
+def create_tokens(storage, keys, args):
+    layout = args[1:7]
+    cg_id = args[7]
+    first_color = int(args[8])
+    count = int(args[9])
+
+    first_idx = reserve_tokens(storage, keys[1], layout, count)
+
+    arg = 10
+    for i in xrange(count):
+        num_data = int(args[arg]) * 2
+        data = args[arg + 1:arg + 1 + num_data]
+        arg += num_data + 1
+
+        write_token(storage, layout, first_idx + i, first_color + i, cg_id,
+                data)
+
+    return first_idx
+
+
+@python_script(BasicMergeAction._rom_scripts['_merge_hashes_script'])
+def merge_hashes(storage, keys, args):
+    dest_hash_key = keys[1]
+
+    for src_hash_key in keys[2:]:
+        for hkey in storage.hkeys(src_hash_key):
+            src_value = storage.hget(src_hash_key, hkey)
+            if not storage.hsetnx(dest_hash_key, hkey, src_value):
+                if src_value != storage.hget(dest_hash_key, hkey):
+                    return [-1, "Conflicting data in key (%s)" % hkey]
+
+    return [0, "Success"]
@@ -1,9 +1,11 @@
 from flow.petri_net import lua
-from flow.petri_net.color import ColorGroup
+from flow.petri_net.color import ColorDescriptor, ColorGroup
 from flow.petri_net.color import color_group_enc, color_group_dec
 from flow.petri_net.exceptions import ForeignTokenError, PlaceNotFoundError
 from flow.petri_net.place import Place
 from flow.petri_net.token import Token
+from flow.petri_net.topology import NetTopology
+from flow.util.defer import gather
 from twisted.internet import defer
 from uuid import uuid4
 
@@ -31,6 +33,24 @@ class Net(rom.Object):
     color_marking = rom.Property(rom.Hash, value_encoder=int, value_decoder=int)
     group_marking = rom.Property(rom.Hash, value_encoder=int, value_decoder=int)
 
+    # Places whose arcs out all lead to barrier transitions.  Tokens put
+    # there are kept out of the color marking, in a set and a hash per color
+    # group (see group_tokens_key and group_colors_key), so a barrier can
+    # consume a whole color group at once.
+    gather_places = rom.Property(rom.Set)
+
+    # For each place feeding basic transitions, the indices of those
+    # transitions.  Scripts that put or remove tokens use it to keep the
+    # satisfied_places counters of BasicTransitions up to date.
+    basic_arcs_out = rom.Property(rom.Hash, value_encoder=rom.json_enc,
+            value_decoder=rom.json_dec)
+
+    # Indexes of the color marking kept by the same scripts: the number of
+    # tokens in each place, and for each color a set of the places other
+    # than gather places holding it (see color_places_key).
+    place_token_counts = rom.Property(rom.Hash, value_encoder=int,
+            value_decoder=int)
+
     counters = rom.Property(rom.Hash, value_encoder=int, value_decoder=int)
 
     variables = rom.Property(rom.Hash, value_encoder=rom.json_enc,
@@ -38,23 +58,78 @@ class Net(rom.Object):
     _constants = rom.Property(rom.Hash, value_encoder=rom.json_enc,
             value_decoder=rom.json_dec)
 
-    _put_token_script = rom.Script(lua.load('put_token'))
+    _put_token_script = rom.Script(lua.load('marking_lib', 'put_token'))
+    _create_token_script = rom.Script(lua.load('token_lib', 'create_token'))
+    _create_tokens_script = rom.Script(lua.load('token_lib', 'create_tokens'))
+
+    # tokens written per script call by create_tokens
+    _TOKEN_BATCH_SIZE = 5000
+
+    # Nets keep the token layout they were created with, see token_class
+    token_class = Token
+
+    # transitions read per round trip by additional_associated_iterkeys
+    _TRANSITION_BATCH_SIZE = 1000
 
     def additional_associated_iterkeys(self):
-        return itertools.chain(*map(self.associated_iterkeys_for_attribute,
-            ['place', 'token', 'transition']))
+        """
+        Places and tokens have no subobjects, so their keys are generated
+        without reading them.  Transitions, their actions and their
+        transient keys are read in pipelined batches.
+        """
+        counters = self.counters.value
+        return itertools.chain(
+                self._node_iterkeys(Place, self.place_key,
+                    counters.get(_PLACE_KEY, 0)),
+                self._node_iterkeys(self.token_class, self.token_key,
+                    counters.get(_TOKEN_KEY, 0)),
+                self._group_tokens_iterkeys(counters.get(_COLOR_GROUP_KEY, 0)),
+                [self.color_group_begins_key],
+                itertools.imap(self.color_places_key,
+                    xrange(counters.get(_COLOR_KEY, 0))),
+                self._transition_iterkeys(counters.get(_TRANSITION_KEY, 0)))
 
-    def associated_iterkeys_for_attribute(self, attribute):
-        for place_idx in xrange(getattr(self, 'num_%ss' % attribute)):
-            obj = getattr(self, attribute)(place_idx)
-            for key in obj.associated_iterkeys():
-                yield key
-            yield obj.key
+    @staticmethod
+    def _node_iterkeys(cls, key_function, count):
+        for idx in xrange(count):
+            key = key_function(idx)
+            for property_key in cls.property_keys(key):
+                yield property_key
+            yield key
+
+    def _group_tokens_iterkeys(self, num_color_groups):
+        gather_places = self.gather_places.value
+        for cg_idx in xrange(num_color_groups):
+            for place_idx in gather_places:
+                yield self.group_tokens_key(cg_idx, place_idx)
+                yield self.group_colors_key(cg_idx, place_idx)
+
+    def _transition_iterkeys(self, num_transitions):
+        for begin in xrange(0, num_transitions, self._TRANSITION_BATCH_SIZE):
+            end = min(begin + self._TRANSITION_BATCH_SIZE, num_transitions)
+            pairs = [(trans, action) for trans, action
+                    in self.transitions_and_actions(xrange(begin, end))
+                    if trans is not None]
+
+            pipe = self.connection.pipeline(transaction=False)
+            for trans, action in pairs:
+                pipe.smembers(trans.transient_keys.key)
+
+            for (trans, action), transient_keys in zip(pairs, pipe.execute()):
+                for key in transient_keys:
+                    yield key
+                if action is not None:
+                    for key in action.associated_iterkeys():
+                        yield key
+                for key in trans.property_keys(trans.key):
+                    yield key
+                yield trans.key
 
 
     @classmethod
     def make_default_key(cls):
-        return base64.b64encode(uuid4().bytes)[:-2]
+        # every other key of the net is a subkey of this one
+        return rom.hash_tag(base64.b64encode(uuid4().bytes)[:-2])
 
     @property
     def num_places(self):
@@ -79,6 +154,11 @@ class Net(rom.Object):
             raise ValueError('Tried to overwrite num_transitions')
 
 
+    @staticmethod
+    def initial_counters(num_places, num_transitions):
+        return {_PLACE_KEY: num_places, _TRANSITION_KEY: num_transitions}
+
+
     def constant(self, key, default=None):
         return self._constants.get(key, default)
 
@@ -114,22 +194,26 @@ class Net(rom.Object):
             raise ForeignTokenError("Token %s cannot be placed in net %s" %
                     (token.key, self.key))
 
-        keys = [self.color_marking.key, self.group_marking.key]
+        keys = self.marking_keys()
         args = [place_idx, token_idx, token.color.value,
                 token.color_group_idx.value]
+        args.extend(self.marking_args())
 
         rv = self._put_token_script(keys=keys, args=args)
         return rv
 
-    def notify_place(self, place_idx, color, service_interfaces):
-        key = self.marking_key(color, place_idx)
-        token_idx = self.color_marking.get(key)
+    def notify_place(self, place_idx, color, service_interfaces,
+            topology=None):
+        token_idx = self.marked_token(place_idx, color)
         if token_idx is not None:
             deferreds = []
             place = self.place(place_idx)
             place.first_token_timestamp.setnx()
 
-            arcs = place.arcs_out.value
+            if topology is None:
+                arcs = self.place_arcs_out(place_idx)
+            else:
+                arcs = topology.place_arcs_out[place_idx]
             orchestrator = service_interfaces['orchestrator']
             for transition_idx in arcs:
                 df = orchestrator.notify_transition(net_key=self.key,
@@ -137,36 +221,85 @@ class Net(rom.Object):
                         token_idx=token_idx)
                 deferreds.append(df)
 
-            return defer.DeferredList(deferreds)
+            return gather(deferreds)
         else:
             return defer.succeed(None)
 
     def notify_transition(self, transition_idx, place_idx, token_idx,
-            service_interfaces):
-        trans = self.transition(transition_idx)
-        token = self.token(token_idx)
-        color_descriptor = token.color_descriptor
+            service_interfaces, topology=None):
+        if topology is None:
+            trans, action, arcs_out = self.load_transition(transition_idx)
+        else:
+            trans, action = topology.transition(transition_idx, self)
+            arcs_out = topology.transition_arcs_out[transition_idx]
+
+        token = self.token(token_idx).load(['color', 'color_group_idx'])
+
+        if trans.can_fire_fused(action):
+            fired_arcs_out = trans.consume_fire_push(self, place_idx,
+                    token.color.value, token.color_group_idx.value)
+            if fired_arcs_out is not None:
+                return trans.notify_places(self.key, [token.color.value],
+                        service_interfaces, arcs_out=fired_arcs_out)
+            return defer.succeed(None)
+
+        color_descriptor = ColorDescriptor(token.color.value,
+                self.color_group(token.color_group_idx.value))
 
         consume_rv = trans.consume_tokens(place_idx, color_descriptor,
-                self.color_marking.key, self.group_marking.key)
+                self.color_marking.key, self.group_marking.key, net=self)
 
         if consume_rv == 0:
             new_tokens, deferred = trans.fire(self,
-                    color_descriptor, service_interfaces)
+                    color_descriptor, service_interfaces, action=action)
             if not new_tokens:
-                LOG.debug('Got no tokens from transition ("%s": %s) '
-                        'on net (%s).', trans.name.value, trans.index, self.key)
-            colors = [x.color.value for x in new_tokens]
+                LOG.debug('Got no tokens from transition (%s) on net (%s).',
+                        trans.key, self.key)
             trans.push_tokens(self, color_descriptor, new_tokens)
-            trans.notify_places(self.key, colors, service_interfaces)
+            colors = [x.color.value for x in new_tokens]
+            notify_deferred = trans.notify_places(self.key, colors,
+                    service_interfaces, arcs_out=arcs_out)
 
-            return deferred
+            # a failed hop made in-process must fail the incoming message
+            gathered = gather([deferred, notify_deferred])
+            return gathered.addCallback(lambda results: results[0][1])
         else:
             return defer.succeed(None)
 
+    def marked_token(self, place_idx, color):
+        """
+        Returns the index of the token of color in place_idx, or None.
+        Tokens in gather places are looked up in the hash of their color
+        group.
+        """
+        token_idx = self.color_marking.get(self.marking_key(color, place_idx))
+        if token_idx is not None:
+            return token_idx
+
+        color_group_idx = self.color_group_idx(color)
+        if color_group_idx is None:
+            return None
+        token_idx = self.connection.hget(
+                self.group_colors_key(color_group_idx, place_idx), color)
+        if token_idx is not None:
+            return int(token_idx)
+
     def color_group(self, idx):
         return self.color_groups[idx]
 
+    @property
+    def color_group_begins_key(self):
+        return self.subkey('color_group_begins')
+
+    def color_group_idx(self, color):
+        """
+        Returns the index of the color group color belongs to, or None.
+        """
+        found = self.connection.zrevrangebyscore(self.color_group_begins_key,
+                color, '-inf', start=0, num=1)
+        if found:
+            return int(found[0])
+
     def set_initial_color(self, initial_color):
         if self.counters.setnx(_COLOR_KEY, initial_color) == 0:
             raise ValueError("Cannot set initial color, since "
@@ -183,6 +316,10 @@ class Net(rom.Object):
                 begin=begin, end=end)
 
         self.color_groups[group_id] = cg
+        if size > 0:
+            # empty groups have no colors, and may begin where another does
+            self.connection.zadd(self.color_group_begins_key,
+                    **{str(group_id): begin})
 
         return cg
 
@@ -201,33 +338,241 @@ class Net(rom.Object):
     def transition(self, idx):
         return rom.get_object(self.connection, self.transition_key(idx))
 
+    def transition_action_key(self, idx):
+        return self.subkey(_TRANSITION_KEY, idx, 'action')
+
+    def transitions_and_actions(self, idxs):
+        """
+        Returns a (transition, action) pair for each of idxs with one MGET.
+        transition is None for a missing transition and action is None for
+        a transition without a stored action.
+        """
+        keys = []
+        for idx in idxs:
+            keys.append(self.transition_key(idx))
+            keys.append(self.transition_action_key(idx))
+        objects = rom.get_objects(self.connection, keys)
+        return zip(objects[0::2], objects[1::2])
+
+    def load_transition(self, idx):
+        """
+        Returns the transition, its stored action (or None) and its output
+        arcs (or None when they should be read from the transition).
+        """
+        trans, action = rom.get_objects(self.connection,
+                [self.transition_key(idx), self.transition_action_key(idx)])
+        if trans is None:
+            raise rom.NotInRedisError("No transition %s in net (%s)"
+                    % (idx, self.key))
+        return trans, action, None
+
+    def transition_from_classes(self, idx, transition_info, action_info):
+        """
+        Returns the transition at idx and its stored action (or None) given
+        their class_info, without reading them.
+        """
+        trans_cls = rom.Object.get_class(transition_info)
+        trans = trans_cls(connection=self.connection,
+                key=self.transition_key(idx))
+
+        if action_info is None:
+            action = None
+        else:
+            action_cls = rom.Object.get_class(action_info)
+            action = action_cls(connection=self.connection,
+                    key=self.transition_action_key(idx))
+
+        return trans, action
+
+    def place_arcs_out(self, idx):
+        return self.place(idx).arcs_out.value
+
+    def place_names(self, place_idxs):
+        """
+        Returns a dict mapping each of place_idxs to that place's name.
+        """
+        places = dict((idx, self.place(idx)) for idx in place_idxs)
+        rom.bulk_get(places.itervalues(), ['name'])
+        return dict((idx, p.name.value) for idx, p in places.iteritems())
+
+    def load_topology(self):
+        return NetTopology.load(self)
+
     def token_key(self, idx):
         return self.subkey(_TOKEN_KEY, idx)
 
     def token(self, idx):
-        return Token(self.connection, self.token_key(idx))
+        return self.token_class(self.connection, self.token_key(idx))
 
     def create_token(self, color, color_group_idx, data=None):
-        idx = self._incr_counter(_TOKEN_KEY) - 1
-        key = self.token_key(idx)
-        return Token.create(self.connection, key, net_key=self.key,
-                index=idx, data=data, color=color,
-                color_group_idx=color_group_idx)
+        """
+        Creates a token with a single script call.  The returned token's
+        scalars are already loaded.
+        """
+        args = self.token_creation_args()
+        args.extend([color, color_group_idx])
+        args.extend(_encode_token_data(data))
+
+        idx = self._create_token_script(keys=[self.counters.key], args=args)
+        return self.token(idx).loaded(net_key=self.key, index=idx,
+                color=color, color_group_idx=color_group_idx)
+
+    def create_tokens(self, color_group, data_list=None):
+        """
+        Creates a token for each color of color_group, in order, giving the
+        i-th token data_list[i] (None for no data).  Token indices are
+        reserved and tokens written by one script call per
+        _TOKEN_BATCH_SIZE tokens.  The returned tokens' scalars are already
+        loaded.
+        """
+        if data_list is None:
+            data_list = [None] * color_group.size
+        elif len(data_list) != color_group.size:
+            raise ValueError("Got %d data for the %d colors of color group "
+                    "%s" % (len(data_list), color_group.size, color_group.idx))
+
+        tokens = []
+        for begin in xrange(0, color_group.size, self._TOKEN_BATCH_SIZE):
+            batch = data_list[begin:begin + self._TOKEN_BATCH_SIZE]
+            first_color = color_group.begin + begin
+
+            args = self.token_creation_args()
+            args.extend([color_group.idx, first_color, len(batch)])
+            for data in batch:
+                encoded = _encode_token_data(data)
+                args.append(len(encoded) / 2)
+                args.extend(encoded)
+
+            first_idx = self._create_tokens_script(keys=[self.counters.key],
+                    args=args)
+            tokens.extend(self.token(first_idx + i).loaded(
+                    net_key=self.key, index=first_idx + i,
+                    color=first_color + i, color_group_idx=color_group.idx)
+                for i in xrange(len(batch)))
+
+        return tokens
+
+    def token_creation_args(self):
+        """
+        Script arguments that describe how new tokens are laid out in this
+        net (see token_lib.lua): net key, token key prefix, token
+        class_info, the hash field for class_info ('' when it has a key of
+        its own), key delimiter and token counter name.
+        """
+        if self.token_class._packed:
+            class_info_field = rom.CLASS_INFO_FIELD
+        else:
+            class_info_field = ''
+        return [self.key, self.token_key(''), self.token_class._info,
+                class_info_field, rom.KEY_DELIM, _TOKEN_KEY]
 
     def create_put_notify(self, place_idx, service_interfaces,
-            color, color_group_idx, data=None):
+            color, color_group_idx, data=None, topology=None):
         token = self.create_token(color, color_group_idx, data)
         self.put_token(place_idx, token)
-        return self.notify_place(place_idx, color, service_interfaces)
+        return self.notify_place(place_idx, color, service_interfaces,
+                topology=topology)
 
     @staticmethod
     def marking_key(tag, place_idx):
         return "%s:%s" % (tag, place_idx)
 
-    def describe_color_marking(self):
+    def marking_keys(self):
+        """
+        The keys scripts use to put tokens into places (see marking_lib.lua).
+        """
+        return [self.color_marking.key, self.group_marking.key,
+                self.gather_places.key, self.basic_arcs_out.key,
+                self.place_token_counts.key]
+
+    def marking_args(self):
+        """
+        The arguments that go with marking_keys: the prefix of group token
+        sets, the key format of satisfied_places counters and the prefix of
+        color_places sets.
+        """
+        return [self.group_tokens_prefix,
+                self.subkey(_TRANSITION_KEY, '%s', 'satisfied_places'),
+                self.color_places_prefix]
+
+    @property
+    def group_tokens_prefix(self):
+        return self.subkey('group_tokens', '')
+
+    def group_tokens_key(self, color_group_idx, place_idx):
+        return self.group_tokens_prefix + self.marking_key(color_group_idx,
+                place_idx)
+
+    def group_colors_key(self, color_group_idx, place_idx):
+        """
+        The hash of the tokens of a color group in a gather place by color,
+        kept in place of their color marking.
+        """
+        return self.group_tokens_key(color_group_idx, place_idx) + ':colors'
+
+    @property
+    def color_places_prefix(self):
+        return self.subkey('color_places', '')
+
+    def color_places_key(self, color):
+        return self.color_places_prefix + str(color)
+
+    def token_counts(self):
+        """
+        Returns the number of tokens in each place holding any.
+        """
+        return dict((int(place_idx), count) for place_idx, count
+                in self.place_token_counts.value.iteritems())
+
+    def color_places(self, color):
+        """
+        Returns the indices of the places other than gather places holding
+        a token of color.
+        """
+        return sorted(int(place_idx) for place_idx
+                in self.connection.smembers(self.color_places_key(color)))
+
+    def marking_page(self, cursor=0, count=1000, place_idx=None, color=None):
+        """
+        Returns the cursor of the next page (0 after the last one) and one
+        page of the color marking, as describe_color_marking does, read with
+        HSCAN.  The page can be limited to one place or one color.  count is
+        a hint passed to HSCAN, so pages may be larger or empty.
+        """
+        match = self.marking_key('*' if color is None else color,
+                '*' if place_idx is None else place_idx)
+        cursor, marking = self.color_marking.scan(cursor, match=match,
+                count=count)
+        return cursor, self._describe_marking(marking)
+
+    def describe_color_marking(self, page_size=1000):
+        """
+        Returns {marking key: (place name, token index)} for the whole color
+        marking, read page by page (see marking_page).  Tokens in gather
+        places are not part of it (see group_colors_key).
+        """
+        result = {}
+        cursor = None
+        while cursor != 0:
+            cursor, page = self.marking_page(cursor or 0, count=page_size)
+            result.update(page)
+        return result
+
+    def _describe_marking(self, marking):
+        names = self.place_names(set(k.split(':')[1] for k in marking))
+
         result = {}
-        for key, token_idx in self.color_marking.value.iteritems():
+        for key, token_idx in marking.iteritems():
             place_idx = key.split(':')[1]
-            result[key] = (self.place(place_idx).name.value, token_idx)
+            result[key] = (names[place_idx], token_idx)
 
         return result
+
+
+def _encode_token_data(data):
+    # alternating keys and values as token_lib.lua expects them
+    result = []
+    if data:
+        for data_key, value in data.iteritems():
+            result.extend([data_key, rom.json_enc(value)])
+    return result
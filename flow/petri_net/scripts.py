@@ -0,0 +1,17 @@
+# imported only so that every petri net Script is registered with redisom
+# before load_scripts runs
+from flow.petri_net import net  # pylint: disable=W0611
+from flow.petri_net.actions import merge  # pylint: disable=W0611
+from flow.petri_net.transitions import barrier  # pylint: disable=W0611
+from flow.petri_net.transitions import basic  # pylint: disable=W0611
+
+import flow.redisom as rom
+
+
+def load_scripts(connection):
+    """
+    SCRIPT LOADs the Lua scripts used by petri nets (and every other
+    registered redisom Script) so that the first messages handled do not
+    need to upload them.
+    """
+    return rom.load_scripts(connection)
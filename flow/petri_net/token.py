@@ -19,8 +19,23 @@ class Token(rom.Object):
 
     @property
     def color_descriptor(self):
+        self.load(['color', 'color_group_idx', 'net_key'], missing_only=True)
         return ColorDescriptor(self.color.value, self.color_group)
 
     @property
     def net(self):
         return rom.get_object(self.connection, self.net_key)
+
+
+class CompactToken(Token):
+    """
+    A token whose scalars share one hash at its key (see rom.Field): one key
+    per token, or two with data, instead of five or six.  data stays a
+    hash of its own so that merges still work key by key.  Used by
+    CompactNet.
+    """
+    net_key = rom.Property(rom.StringField)
+
+    color = rom.Property(rom.IntField)
+    color_group_idx = rom.Property(rom.IntField)
+    index = rom.Property(rom.IntField)
@@ -0,0 +1,71 @@
+import flow.redisom as rom
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class NetTopology(object):
+    """
+    Snapshot of the parts of a stored net that do not change once it has
+    been built: the output arcs of every place, and the class_info of every
+    transition and of its stored action (or None) with its output arcs.
+
+    Only plain data is kept, so a topology can be shared between threads:
+    new_net and transition make new redisom objects on every call.
+    """
+    def __init__(self, net, place_arcs_out, transition_classes,
+            transition_arcs_out):
+        self.net_class = net.__class__
+        self.net_key = net.key
+        self.connection = net.connection
+        self.place_arcs_out = place_arcs_out
+        self.transition_classes = transition_classes
+        self.transition_arcs_out = transition_arcs_out
+
+    @classmethod
+    def load(cls, net):
+        """
+        Reads the topology of net in a fixed number of round trips however
+        large it is: the counters, one MGET for the class_info of every
+        transition and action, and one pipeline for all of the arcs.
+        """
+        num_places = net.num_places
+        num_transitions = net.num_transitions
+
+        places = [net.place(i) for i in xrange(num_places)]
+
+        pairs = net.transitions_and_actions(xrange(num_transitions))
+        transitions = [transition for transition, action in pairs]
+
+        for i, transition in enumerate(transitions):
+            if transition is None:
+                raise rom.NotInRedisError("No transition %s in net (%s)"
+                        % (i, net.key))
+
+        rom.bulk_get(places + transitions, ['arcs_out'])
+
+        LOG.debug('Loaded topology of net (%s): %d places, %d transitions',
+                net.key, num_places, num_transitions)
+
+        return cls(net,
+                place_arcs_out=tuple(tuple(p.arcs_out.value) for p in places),
+                transition_classes=tuple((transition._info,
+                    None if action is None else action._info)
+                    for transition, action in pairs),
+                transition_arcs_out=tuple(tuple(t.arcs_out.value)
+                    for t in transitions))
+
+    def new_net(self):
+        return self.net_class(connection=self.connection, key=self.net_key)
+
+    def transition(self, idx, net):
+        """
+        Returns the transition of net and its stored action (or None).
+        """
+        try:
+            transition_info, action_info = self.transition_classes[idx]
+        except IndexError:
+            raise rom.NotInRedisError("No transition %s in net (%s)"
+                    % (idx, self.net_key))
+        return net.transition_from_classes(idx, transition_info, action_info)
@@ -14,21 +14,31 @@ class BarrierTransition(TransitionBase):
     ACTION_BASE_CLASS = BarrierActionBase
     DEFAULT_ACTION_CLASS = BarrierMergeAction
 
-    _consume_tokens = rom.Script(lua.load('consume_tokens_barrier'))
+    _consume_tokens = rom.Script(lua.load('arcs_lib', 'marking_lib',
+        'consume_tokens_barrier'))
 
     def consume_tokens(self, enabler, color_descriptor, color_marking_key,
-            group_marking_key):
-
+            group_marking_key, net=None):
+        """
+        Without net, every place is read through the color marking, which
+        does not hold the tokens of gather places (see Net.group_colors_key).
+        """
         color_group = color_descriptor.group
 
         active_tokens_key = self.active_tokens_key(color_descriptor)
         state_key = self.state_key(color_descriptor)
-        arcs_in_key = self.arcs_in.key
+        arcs_in_key, arcs_in_field = self.arcs_location('arcs_in')
         enablers_key = self.enablers.key
 
-        keys = [state_key, active_tokens_key, arcs_in_key, color_marking_key,
-                group_marking_key, enablers_key, self.transient_keys.key]
-        args = [enabler, color_group.idx, color_group.begin, color_group.end]
+        keys = [state_key, active_tokens_key, arcs_in_key, enablers_key,
+                self.transient_keys.key]
+        args = [enabler, color_group.idx, color_group.begin, color_group.end,
+                arcs_in_field]
+        if net is None:
+            keys.extend([color_marking_key, group_marking_key])
+        else:
+            keys.extend(net.marking_keys())
+            args.extend(net.marking_args())
 
         LOG.debug("Consume tokens: KEYS=%r, ARGS=%r", keys, args)
         rv = self._consume_tokens(keys=keys, args=args)
@@ -9,6 +9,9 @@ import logging
 
 LOG = logging.getLogger(__file__)
 
+# passed as fire's action when the caller has not already looked it up
+_LOOKUP = object()
+
 
 class TransitionBase(rom.Object):
     arcs_in = rom.Property(rom.List, value_decoder=int, value_encoder=int)
@@ -21,7 +24,13 @@ class TransitionBase(rom.Object):
 
     transient_keys = rom.Property(rom.Set)
 
-    _push_tokens_script = rom.Script(lua.load('push_tokens'))
+    _push_tokens_script = rom.Script(lua.load('arcs_lib', 'marking_lib',
+        'push_tokens_lib', 'push_tokens'))
+
+    # Transitions of a CompactNet keep their arcs in fields of the net's
+    # arcs hash rather than in their own lists, see arcs_location.
+    arcs_hash_key = None
+    arcs_field_format = ''
 
     def additional_associated_iterkeys(self):
         action = self.action
@@ -34,7 +43,7 @@ class TransitionBase(rom.Object):
             yield key
 
     def consume_tokens(self, enabler, color_descriptor, color_marking_key,
-            group_marking_key):
+            group_marking_key, net=None):
         raise NotImplementedError()
 
     def state_key(self, color_descriptor):
@@ -43,6 +52,26 @@ class TransitionBase(rom.Object):
     def active_tokens_key(self, color_descriptor):
         raise NotImplementedError()
 
+    def can_fire_fused(self, action):
+        """
+        Returns True if consume_fire_push can be used in place of
+        consume_tokens, fire and push_tokens for the given stored action.
+        """
+        return False
+
+    def consume_fire_push(self, net, enabler, color, color_group_idx):
+        raise NotImplementedError()
+
+
+    def arcs_location(self, name):
+        """
+        Returns the (key, field) pair scripts use to read the arcs_in or
+        arcs_out of this transition (see arcs_lib.lua).
+        """
+        if self.arcs_hash_key is None:
+            return getattr(self, name).key, ''
+        else:
+            return self.arcs_hash_key, self.arcs_field_format % name
 
     @property
     def action_key(self):
@@ -58,9 +87,10 @@ class TransitionBase(rom.Object):
             return
 
 
-    def fire(self, net, color_descriptor, service_interfaces):
+    def fire(self, net, color_descriptor, service_interfaces, action=_LOOKUP):
         active_tokens = self.active_tokens(color_descriptor)
-        action = self.action
+        if action is _LOOKUP:
+            action = self.action
         if action is None:
             action = self.DEFAULT_ACTION_CLASS(self.connection, self.action_key)
 
@@ -69,11 +99,16 @@ class TransitionBase(rom.Object):
                 service_interfaces=service_interfaces)
 
     def push_tokens(self, net, color_descriptor, tokens):
-        keys = [self.active_tokens(color_descriptor).key, self.arcs_out.key,
-                net.color_marking.key, net.group_marking.key,
+        arcs_out_key, arcs_out_field = self.arcs_location('arcs_out')
+        keys = [self.active_tokens(color_descriptor).key, arcs_out_key,
                 self.transient_keys.key]
+        keys.extend(net.marking_keys())
 
-        args = [len(tokens)]
+        rom.bulk_get(tokens, ['color_group_idx', 'color', 'index'],
+                missing_only=True)
+        args = [arcs_out_field]
+        args.extend(net.marking_args())
+        args.append(len(tokens))
         for t in tokens:
             args.extend([t.color_group_idx.value, t.color.value, t.index.value])
 
@@ -81,15 +116,14 @@ class TransitionBase(rom.Object):
         LOG.debug("rv=%r", rv)
         return rv[0]
 
-    def notify_places(self, net_key, colors, service_interfaces):
-        deferreds = []
+    def notify_places(self, net_key, colors, service_interfaces,
+            arcs_out=None):
+        if arcs_out is None:
+            arcs_out = self.arcs_out
 
         orchestrator = service_interfaces['orchestrator']
-        for place_idx, color in product(self.arcs_out, colors):
-            deferred = orchestrator.notify_place(net_key, place_idx, color)
-            deferreds.append(deferred)
-
-        return defer.DeferredList(deferreds)
+        return orchestrator.notify_places(net_key,
+                list(product(arcs_out, colors)))
 
     def active_tokens(self, color_descriptor):
         return rom.Set(connection=self.connection,
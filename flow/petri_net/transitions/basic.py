@@ -1,6 +1,8 @@
+from flow.petri_net import exceptions
 from flow.petri_net import lua
 from flow.petri_net.actions.base import BasicActionBase
 from flow.petri_net.actions.merge import BasicMergeAction
+from flow.petri_net.color import ColorDescriptor
 from flow.petri_net.transitions.base import TransitionBase
 
 import flow.redisom as rom
@@ -9,24 +11,42 @@ import logging
 
 LOG = logging.getLogger(__file__)
 
+_FIRE_ERROR = -2
+_DATA_CONFLICT = -3
+
 
 class BasicTransition(TransitionBase):
     ACTION_BASE_CLASS = BasicActionBase
     DEFAULT_ACTION_CLASS = BasicMergeAction
 
-    _consume_tokens = rom.Script(lua.load('consume_tokens_basic'))
+    # the number of input places holding a token of each color, see
+    # Net.basic_arcs_out
+    satisfied_places = rom.Property(rom.Hash, value_encoder=int,
+            value_decoder=int)
+
+    _consume_tokens = rom.Script(lua.load('arcs_lib', 'marking_lib',
+        'consume_tokens_basic_lib', 'consume_tokens_basic'))
+    _fire_basic_merge = rom.Script(lua.load('arcs_lib', 'marking_lib',
+        'consume_tokens_basic_lib', 'push_tokens_lib', 'token_lib',
+        'fire_basic_merge'))
 
     def consume_tokens(self, enabler, color_descriptor, color_marking_key,
-            group_marking_key):
+            group_marking_key, net=None):
 
         active_tokens_key = self.active_tokens_key(color_descriptor)
         state_key = self.state_key(color_descriptor)
-        arcs_in_key = self.arcs_in.key
+        arcs_in_key, arcs_in_field = self.arcs_location('arcs_in')
         enablers_key = self.enablers.key
 
-        keys = [state_key, active_tokens_key, arcs_in_key, color_marking_key,
-                group_marking_key, enablers_key, self.transient_keys.key]
-        args = [enabler, color_descriptor.group.idx, color_descriptor.color]
+        keys = [state_key, active_tokens_key, arcs_in_key, enablers_key,
+                self.transient_keys.key, self.satisfied_places.key]
+        args = [enabler, color_descriptor.group.idx, color_descriptor.color,
+                arcs_in_field]
+        if net is None:
+            keys.extend([color_marking_key, group_marking_key])
+        else:
+            keys.extend(net.marking_keys())
+            args.extend(net.marking_args())
 
         LOG.debug("Consume tokens: KEYS=%r, ARGS=%r", keys, args)
         rv = self._consume_tokens(keys=keys, args=args)
@@ -34,6 +54,49 @@ class BasicTransition(TransitionBase):
 
         return rv[0]
 
+    def can_fire_fused(self, action):
+        # subclasses of BasicMergeAction may override execute
+        return action is None or type(action) is BasicMergeAction
+
+    def consume_fire_push(self, net, enabler, color, color_group_idx):
+        """
+        Consume tokens, merge them as BasicMergeAction would and push the
+        result to the output places with a single script.
+
+        Returns the output place indices if the transition fired, otherwise
+        None.
+        """
+        color_descriptor = ColorDescriptor(color, None)
+        arcs_in_key, arcs_in_field = self.arcs_location('arcs_in')
+        arcs_out_key, arcs_out_field = self.arcs_location('arcs_out')
+
+        keys = [self.state_key(color_descriptor),
+                self.active_tokens_key(color_descriptor),
+                arcs_in_key, arcs_out_key, self.enablers.key,
+                self.transient_keys.key, net.counters.key,
+                self.satisfied_places.key]
+        keys.extend(net.marking_keys())
+        args = [enabler, color_group_idx, color]
+        args.extend(net.token_creation_args())
+        args.extend([arcs_in_field, arcs_out_field])
+        args.extend(net.marking_args())
+
+        LOG.debug("Fire basic merge: KEYS=%r, ARGS=%r", keys, args)
+        rv = self._fire_basic_merge(keys=keys, args=args)
+        LOG.debug("Fire basic merge returned: %r", rv)
+
+        if rv[0] == _DATA_CONFLICT:
+            # as BasicMergeAction.execute would
+            raise exceptions.BadTokenDataError('Failed to merge token data '
+                    'for transition (%s): %s' % (self.key, rv[1]))
+        elif rv[0] == _FIRE_ERROR:
+            raise exceptions.PetriNetError("Failed to fire transition (%s): %s"
+                    % (self.key, rv[1]))
+        elif rv[0] != 0:
+            return None
+
+        return [int(x) for x in rv[3]]
+
     def state_key(self, color_descriptor):
         return self.subkey("state", color_descriptor.color)
 
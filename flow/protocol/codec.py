@@ -0,0 +1,149 @@
+from flow.protocol import exceptions
+
+import json
+import struct
+
+
+JSON_CONTENT_TYPE = 'application/json'
+STRUCT_CONTENT_TYPE = 'application/x-flow-struct'
+
+_STRUCT_VERSION = 1
+_LENGTH = struct.Struct('!I')
+
+
+class JsonCodec(object):
+    content_type = JSON_CONTENT_TYPE
+
+    def supports(self, message_class):
+        return True
+
+    def encode(self, message):
+        return json.dumps(message.to_dict())
+
+    def decode(self, message_class, encoded_message):
+        try:
+            d = json.loads(encoded_message)
+        except:
+            raise exceptions.InvalidMessageException(
+                    'Could not deserialized message: %s.' % encoded_message)
+
+        return message_class(**d)
+
+
+class StructCodec(object):
+    """
+    Packs messages whose class declares `binary_fields` into a fixed struct
+    layout.  binary_fields is a sequence of (name, kind) pairs, where kind is
+    a struct format character for fixed size fields, 's' for a unicode
+    string or 'j' for an optional JSON encoded value.  Fixed size fields are
+    packed first (in network byte order), followed by the variable length
+    fields, each prefixed with its length.
+    """
+    content_type = STRUCT_CONTENT_TYPE
+
+    def __init__(self):
+        self._layouts = {}
+
+    def supports(self, message_class):
+        return getattr(message_class, 'binary_fields', None) is not None
+
+    def encode(self, message):
+        layout = self._layout(message.__class__)
+        parts = [layout.fixed.pack(_STRUCT_VERSION,
+            *[getattr(message, name) for name in layout.fixed_names])]
+
+        for name, kind in layout.variable_fields:
+            value = getattr(message, name, None)
+            if kind == 's':
+                data = value.encode('utf-8')
+            elif value is None:
+                data = ''
+            else:
+                data = json.dumps(value)
+            parts.append(_LENGTH.pack(len(data)))
+            parts.append(data)
+
+        return ''.join(parts)
+
+    def decode(self, message_class, encoded_message):
+        layout = self._layout(message_class)
+        try:
+            values = layout.fixed.unpack_from(encoded_message)
+            if values[0] != _STRUCT_VERSION:
+                raise exceptions.InvalidMessageException(
+                        'Unknown struct message version %s' % values[0])
+            d = dict(zip(layout.fixed_names, values[1:]))
+
+            offset = layout.fixed.size
+            for name, kind in layout.variable_fields:
+                (length,) = _LENGTH.unpack_from(encoded_message, offset)
+                offset += _LENGTH.size
+                data = encoded_message[offset:offset + length]
+                if len(data) != length:
+                    raise exceptions.InvalidMessageException(
+                            'Truncated field %s' % name)
+                offset += length
+
+                if kind == 's':
+                    d[name] = data.decode('utf-8')
+                elif data:
+                    d[name] = json.loads(data)
+
+        except (struct.error, ValueError) as e:
+            raise exceptions.InvalidMessageException(
+                    'Could not deserialize %s: %s' %
+                    (message_class.__name__, e))
+
+        return message_class(**d)
+
+    def _layout(self, message_class):
+        try:
+            return self._layouts[message_class]
+        except KeyError:
+            layout = _Layout(message_class.binary_fields)
+            self._layouts[message_class] = layout
+            return layout
+
+
+class _Layout(object):
+    def __init__(self, binary_fields):
+        fixed_format = ['!B']
+        self.fixed_names = []
+        self.variable_fields = []
+        for name, kind in binary_fields:
+            if kind in ('s', 'j'):
+                self.variable_fields.append((name, kind))
+            else:
+                fixed_format.append(kind)
+                self.fixed_names.append(name)
+
+        self.fixed = struct.Struct(''.join(fixed_format))
+
+
+_CODECS = dict((c.content_type, c) for c in [JsonCodec(), StructCodec()])
+
+
+def get_codec(content_type):
+    """
+    Returns the codec for an AMQP content type.  Messages without a content
+    type are JSON.
+    """
+    if content_type is None:
+        content_type = JSON_CONTENT_TYPE
+    try:
+        return _CODECS[content_type]
+    except (KeyError, TypeError):
+        raise exceptions.InvalidMessageException(
+                'Unsupported content type: %s' % (content_type,))
+
+
+def content_type_for(message_classes, preferred):
+    """
+    Returns the preferred content type if its codec can encode every one of
+    message_classes, otherwise JSON.
+    """
+    codec = get_codec(preferred)
+    if all(codec.supports(c) for c in message_classes):
+        return codec.content_type
+    else:
+        return JSON_CONTENT_TYPE
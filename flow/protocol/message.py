@@ -1,30 +1,80 @@
-import copy
-import json
 from flow.protocol import exceptions
+from flow.protocol.codec import get_codec
+
+
+class _MessageMeta(type):
+    """
+    Compiles the field declarations of each Message subclass once, when the
+    class is created: fields are stored in __slots__ and __init__ checks
+    them against precomputed tuples instead of walking the declaration
+    dicts for every message.
+    """
+    def __new__(mcs, name, bases, attrs):
+        required = _merged_fields(bases, attrs, 'required_fields')
+        optional = _merged_fields(bases, attrs, 'optional_fields')
+        # a field that is both required and optional is required
+        for field_name in required:
+            optional.pop(field_name, None)
+
+        field_names = tuple(sorted(required)) + tuple(sorted(optional))
+
+        inherited = set()
+        for base in bases:
+            inherited.update(getattr(base, '_field_names', ()))
+        attrs.setdefault('__slots__', tuple(n for n in field_names
+            if n not in inherited))
+
+        attrs['_field_names'] = field_names
+        attrs['_required'] = tuple(sorted(required.iteritems()))
+        attrs['_optional'] = tuple(sorted(optional.iteritems()))
+        attrs['_field_name_set'] = frozenset(field_names)
+
+        return type.__new__(mcs, name, bases, attrs)
+
+
+def _merged_fields(bases, attrs, attr_name):
+    if attr_name in attrs:
+        return dict(attrs[attr_name])
+    for base in bases:
+        if hasattr(base, attr_name):
+            return dict(getattr(base, attr_name))
+    return {}
 
 
 class Message(object):
+    __metaclass__ = _MessageMeta
+
     required_fields = {}
     optional_fields = {}
 
-    def __init__(self, **kwargs):
-        try:
-            for name, type_ in self.required_fields.iteritems():
-                value = kwargs.pop(name)
-                self._validate_field_value(name, value, type_)
-        except KeyError:
-            raise exceptions.InvalidMessageException(
-                    'Required field %s is missing' % name)
+    # (name, kind) pairs used by the struct codec, see flow.protocol.codec
+    binary_fields = None
 
-        for name, type_ in self.optional_fields.iteritems():
-            value = kwargs.pop(name, None)
-            if value is not None:
-                self._validate_field_value(name, value, type_)
+    def __init__(self, **kwargs):
+        for name, type_ in self._required:
+            try:
+                value = kwargs[name]
+            except KeyError:
+                raise exceptions.InvalidMessageException(
+                        'Required field %s is missing' % name)
+            if not isinstance(value, type_):
+                self._invalid_type(name, type_)
+            setattr(self, name, value)
 
-        if kwargs:
-            raise exceptions.InvalidMessageException(
-                    'Additional arguments passed to constructor for %s: %s' %
-                    (self.__class__.__name__, kwargs))
+        if len(kwargs) > len(self._required):
+            if not self._field_name_set.issuperset(kwargs):
+                extra = dict((k, v) for k, v in kwargs.iteritems()
+                        if k not in self._field_name_set)
+                raise exceptions.InvalidMessageException(
+                        'Additional arguments passed to constructor for '
+                        '%s: %s' % (self.__class__.__name__, extra))
+
+            for name, type_ in self._optional:
+                value = kwargs.get(name)
+                if value is not None:
+                    if not isinstance(value, type_):
+                        self._invalid_type(name, type_)
+                    setattr(self, name, value)
 
         self.validate()
 
@@ -33,40 +83,47 @@ class Message(object):
         # to be optionally specified by subclasses.
         pass
 
-    def _validate_field_value(self, name, value, type_):
-        if isinstance(value, type_):
-            setattr(self, name, value)
-        else:
-            raise exceptions.InvalidMessageException(
-                    'Message (%s) requires %s have type (%s)' %
-                    (self.__class__.__name__, name, type_))
+    def _invalid_type(self, name, type_):
+        raise exceptions.InvalidMessageException(
+                'Message (%s) requires %s have type (%s)' %
+                (self.__class__.__name__, name, type_))
 
-    def encode(self):
-        return json.dumps(self.to_dict())
+    def encode(self, content_type=None):
+        return get_codec(content_type).encode(self)
 
     @classmethod
-    def decode(cls, encoded_message):
-        try:
-            d = json.loads(encoded_message)
-        except:
-            raise exceptions.InvalidMessageException(
-                    'Could not deserialized message: %s.' % encoded_message)
-
-        return cls(**d)
+    def decode(cls, encoded_message, content_type=None):
+        return get_codec(content_type).decode(cls, encoded_message)
 
     def to_dict(self):
-        data = copy.copy(self.__dict__)
+        data = {}
+        for name in self._field_names:
+            try:
+                data[name] = getattr(self, name)
+            except AttributeError:
+                pass
         return data
 
     def __eq__(self, other):
         return (self.__class__ == other.__class__) and (
-                self.__dict__  == other.__dict__)
+                self.to_dict()  == other.to_dict())
+
+    def __ne__(self, other):
+        return not self == other
 
     def __repr__(self):
-        return '%s(**%s)' % (self.__class__.__name__, self.__dict__)
+        return '%s(**%s)' % (self.__class__.__name__, self.to_dict())
 
     def __getitem__(self, key):
-        return self.__dict__[key]
+        if key in self._field_name_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
 
     def get(self, key, default=None):
-        return self.__dict__.get(key, default)
+        try:
+            return self[key]
+        except KeyError:
+            return default
@@ -7,12 +7,26 @@ import functools
 import hashlib
 import redis
 import json
+import logging
 import re
+import threading
 import time
+import zlib
 
 
+LOG = logging.getLogger(__name__)
+
 KEY_DELIM = '|'
 
+# Every Script ever created, see load_scripts
+_SCRIPTS = []
+
+# See use_hash_tags
+_use_hash_tags = False
+
+# The hash field that holds the class_info of an object with Field properties
+CLASS_INFO_FIELD = '_class_info'
+
 # Redis scripts (Instantiated at the bottom of the file)
 _COPY_KEY_SCRIPT_BODY = """
 if redis.call('EXISTS', KEYS[1]) == 1 then
@@ -33,7 +47,8 @@ end
 return {0, "Success"}
 """
 
-_EXPIRE_CHUNK_SIZE = 3000
+# Keys deleted or expired per round trip by Object.delete and expire
+_KEY_CHUNK_SIZE = 3000
 
 
 def json_enc(obj):
@@ -51,6 +66,19 @@ def copy_key(connection, src, dst):
     return _COPY_KEY_SCRIPT(connection=connection, keys=[src, dst])
 
 
+def unlink(connection, *keys):
+    """
+    Removes keys with UNLINK, which frees their memory outside of the
+    server's main thread.  Servers older than 4.0 get a DEL instead.
+    """
+    try:
+        return connection.execute_command('UNLINK', *keys)
+    except redis.exceptions.ResponseError as e:
+        if not str(e).lower().startswith('unknown command'):
+            raise
+        return connection.delete(*keys)
+
+
 class RomIndexError(IndexError):
     pass
 
@@ -59,10 +87,40 @@ class NotInRedisError(KeyError):
     pass
 
 
+class ScriptUnavailableError(redis.exceptions.ResponseError):
+    """
+    Raised by a connection that can never run a script, as opposed to a
+    script that fails to compile.
+    """
+
+
 class Script(object):
-    def __init__(self, script_body=None):
+    """
+    A Lua script run with EVALSHA.  Every Script is registered when it is
+    created so that load_scripts can SCRIPT LOAD them all ahead of time.
+
+    Only a NOSCRIPT error -- the server has lost its script cache, e.g.
+    after a restart -- causes a retry, and only after every registered
+    script has been loaded again.  Errors raised by the script itself are
+    passed on without running it a second time.
+
+    Each script counts its calls, errors and time spent (see stats).  name
+    defaults to "<class_info>.<attribute>" for scripts defined on an Object
+    class.
+    """
+    def __init__(self, script_body=None, name=None):
         self.script_body = script_body
         self.script_hash = hashlib.sha1(script_body).hexdigest()
+        self.name = name
+
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.reloads = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+        _SCRIPTS.append(self)
 
     def __call__(self, connection=None, keys=[], args=[]):
         if connection is None:
@@ -70,11 +128,210 @@ class Script(object):
 
         num_keys = len(keys)
         keys_and_args = keys + args
+
+        begin_time = time.time()
+        failed = True
         try:
-            return connection.evalsha(self.script_hash,
-                    num_keys, *keys_and_args)
-        except redis.exceptions.ResponseError:
-            return connection.eval(self.script_body, num_keys, *keys_and_args)
+            try:
+                result = connection.evalsha(self.script_hash,
+                        num_keys, *keys_and_args)
+            except redis.exceptions.NoScriptError:
+                LOG.warning('Script %s is not loaded, loading all scripts',
+                        self.name or self.script_hash)
+                self._record_reload()
+                load_scripts(connection)
+                # EVAL reports the compile error if this one failed to load
+                result = connection.eval(self.script_body,
+                        num_keys, *keys_and_args)
+            failed = False
+            return result
+
+        finally:
+            self._record_call(time.time() - begin_time, failed)
+
+    def stats(self):
+        with self._stats_lock:
+            return {'calls': self.calls, 'errors': self.errors,
+                    'reloads': self.reloads, 'seconds': self.seconds,
+                    'max_seconds': self.max_seconds}
+
+    def _record_call(self, seconds, failed):
+        with self._stats_lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def _record_reload(self):
+        with self._stats_lock:
+            self.reloads += 1
+
+
+def load_scripts(connection):
+    """
+    SCRIPT LOADs every registered Script on connection, or on every shard of
+    a ShardedConnection.  Scripts that fail to compile are logged and
+    skipped, while a ScriptUnavailableError is raised.  Returns the number
+    of scripts loaded, summed over every connection.
+    """
+    if isinstance(connection, ShardedConnection):
+        connections = connection.connections
+    else:
+        connections = [connection]
+
+    scripts = dict((s.script_hash, s) for s in _SCRIPTS).values()
+    num_loaded = 0
+    for conn in connections:
+        pipe = conn.pipeline(transaction=False)
+        for script in scripts:
+            pipe.script_load(script.script_body)
+
+        for script, result in zip(scripts, pipe.execute(raise_on_error=False)):
+            if isinstance(result, ScriptUnavailableError):
+                raise result
+            elif isinstance(result, redis.exceptions.ResponseError):
+                LOG.error('Failed to load script %s: %s',
+                        script.name or script.script_hash, result)
+            else:
+                num_loaded += 1
+
+    LOG.debug('Loaded %d scripts on %d connections', num_loaded,
+            len(connections))
+    return num_loaded
+
+
+def script_stats():
+    """
+    Returns the stats of every registered Script that has been called, by
+    name.  Scripts sharing a name are added together.
+    """
+    result = {}
+    for script in _SCRIPTS:
+        stats = script.stats()
+        if not stats['calls']:
+            continue
+
+        name = script.name or script.script_hash
+        if name in result:
+            total = result[name]
+            for k in ['calls', 'errors', 'reloads', 'seconds']:
+                total[k] += stats[k]
+            total['max_seconds'] = max(total['max_seconds'],
+                    stats['max_seconds'])
+        else:
+            result[name] = stats
+
+    return result
+
+
+def use_hash_tags(enabled=True):
+    """
+    Turns the {hash tag} key scheme of hash_tag on or off for this process.
+    """
+    global _use_hash_tags
+    _use_hash_tags = enabled
+
+
+def hash_tag(key):
+    """
+    Returns key wrapped in a {hash tag} when the scheme is on (see
+    use_hash_tags), otherwise key itself.  Redis Cluster hashes only the
+    text between the braces, so every key built from the result with
+    Object.subkey lands in the same slot and may be used together in one
+    script or MULTI.
+    """
+    if _use_hash_tags:
+        return '{%s}' % key
+    else:
+        return key
+
+
+def key_tag(key):
+    """
+    Returns the part of key that decides its slot or shard: the contents of
+    its first non-empty {hash tag} as in Redis Cluster, otherwise the part
+    before the first KEY_DELIM (the whole key if that is empty).
+    """
+    begin = key.find('{')
+    if begin >= 0:
+        end = key.find('}', begin + 1)
+        if end > begin + 1:
+            return key[begin + 1:end]
+
+    return key.split(KEY_DELIM, 1)[0] or key
+
+
+class ShardedConnection(object):
+    """
+    Spreads objects over several redis connections by a hash of their key.
+
+    A ShardedConnection can be passed anywhere redisom expects a connection
+    to construct or look up an Object: the object is bound to the shard
+    chosen by connection_for, and everything reached through it -- its
+    properties, scripts and subobjects -- uses that shard directly.  Only
+    the key_tag of a key is hashed, so a net and all of its places,
+    transitions and tokens share a shard.
+    """
+    def __init__(self, connections):
+        if not connections:
+            raise TypeError("You must specify at least one connection")
+        self.connections = list(connections)
+
+    def connection_for(self, key):
+        idx = (zlib.crc32(key_tag(key)) & 0xffffffff) % len(self.connections)
+        return self.connections[idx]
+
+
+def connection_for(connection, key):
+    """
+    Returns the connection that holds key: its shard if connection is a
+    ShardedConnection, otherwise connection itself.
+    """
+    if isinstance(connection, ShardedConnection):
+        return connection.connection_for(key)
+    else:
+        return connection
+
+
+class DeferredWriteSession(object):
+    """
+    Stands in for a connection while objects are being created: writes are
+    queued on a single MULTI/EXEC pipeline and sent together by flush().
+    Pipelines opened by values inside the session are folded into it.
+
+    Replies are only available from flush(), so write commands return None
+    and reads are refused.
+    """
+    WRITE_COMMANDS = frozenset(['delete', 'hmset', 'hset', 'hsetnx',
+        'rpush', 'sadd', 'set', 'setnx'])
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._pipe = connection.pipeline(transaction=True)
+
+    def __getattr__(self, name):
+        if name not in self.WRITE_COMMANDS:
+            raise TypeError("Cannot use %s in a deferred write session"
+                    % name)
+
+        command = getattr(self._pipe, name)
+        def queue(*args, **kwargs):
+            command(*args, **kwargs)
+        return queue
+
+    def __len__(self):
+        return len(self._pipe)
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        # nested pipelines are sent with the rest of the session by flush
+        return []
+
+    def flush(self):
+        return self._pipe.execute()
 
 
 class Property(object):
@@ -113,11 +370,18 @@ class Value(object):
         return self.__class__(connection=self.connection, key=dst_key)
 
     def setnx(self, value):
+        self._invalidate()
         return self.connection.setnx(self.key, self._encode(value))
 
     def delete(self):
+        self._invalidate()
         return self.connection.delete(self.key)
 
+    def _invalidate(self):
+        # called by every write so that a loaded snapshot is not served
+        # after it
+        self._cached_value = UNINITIALIZED
+
 
     def _encode(self, value):
         return value
@@ -140,6 +404,15 @@ class Value(object):
     def _set_raw_value(self, new_value):
         return self.connection.set(self.key, self._encode(new_value))
 
+    def _pipeline_get_raw_value(self, pipe):
+        # queue the same read as _get_raw_value on a pipeline
+        pipe.get(self.key)
+
+    def _load_raw_value(self, raw_value):
+        # accepts a reply to _pipeline_get_raw_value
+        if raw_value is not None:
+            self._cached_value = self._decode(raw_value)
+
 
     def _validate_immutable(self):
         if self.immutable:
@@ -148,16 +421,19 @@ class Value(object):
 
 
     def _value_getter(self):
-        if self.cacheable:
-            if self._cached_value is UNINITIALIZED:
-                self._cached_value = self._get_decoded_value()
-
-            return self._cached_value
+        # _cached_value is also filled by bulk_get for non-cacheable values,
+        # until the next write through this Value
+        if self._cached_value is UNINITIALIZED:
+            value = self._get_decoded_value()
+            if self.cacheable:
+                self._cached_value = value
+            return value
         else:
-            return self._get_decoded_value()
+            return self._cached_value
 
     def _value_setter(self, new_value):
         self._validate_immutable()
+        self._invalidate()
         return self._set_raw_value(new_value)
 
 
@@ -201,10 +477,12 @@ class Timestamp(Value):
 class Int(Value):
     def incr(self, *args, **kwargs):
         self._validate_immutable()
+        self._invalidate()
         return self.connection.incr(self.key, *args, **kwargs)
 
     def decr(self, *args, **kwargs):
         self._validate_immutable()
+        self._invalidate()
         return self.connection.decr(self.key, *args, **kwargs)
 
     def _encode(self, value):
@@ -227,10 +505,71 @@ class String(Value):
         return str(value)
 
 
+class Field(Value):
+    """
+    A scalar kept in one field of the hash at key rather than in a key of
+    its own.  An Object's Field properties all share the hash at the
+    object's key, which then also holds its class_info (see
+    CLASS_INFO_FIELD), so such an object costs one key instead of one per
+    property.  Objects with Field properties cannot be found with
+    get_object; construct them directly.
+
+    Mix in front of a Value class for its encoding, as IntField does.
+    """
+    def __init__(self, connection=None, key=None, field=None, **kwargs):
+        if field is None:
+            raise TypeError("You must specify a field")
+        Value.__init__(self, connection=connection, key=key, **kwargs)
+        self.field = field
+
+    def copy(self, dst_key):
+        raw_value = self._get_raw_value()
+        if raw_value is not None:
+            self.connection.hset(dst_key, self.field, raw_value)
+        return self.__class__(connection=self.connection, key=dst_key,
+                field=self.field)
+
+    def setnx(self, value):
+        self._invalidate()
+        return self.connection.hsetnx(self.key, self.field,
+                self._encode(value))
+
+    def delete(self):
+        self._invalidate()
+        return self.connection.hdel(self.key, self.field)
+
+    def _get_raw_value(self):
+        return self.connection.hget(self.key, self.field)
+
+    def _set_raw_value(self, new_value):
+        return self.connection.hset(self.key, self.field,
+                self._encode(new_value))
+
+    def _pipeline_get_raw_value(self, pipe):
+        pipe.hget(self.key, self.field)
+
+
+class IntField(Field, Int):
+    def incr(self, amount=1):
+        self._validate_immutable()
+        self._invalidate()
+        return self.connection.hincrby(self.key, self.field, amount)
+
+    def decr(self, amount=1):
+        return self.incr(-amount)
+
+
+class StringField(Field, String):
+    pass
+
+
 class Set(Value):
     def _get_raw_value(self):
         return self.connection.smembers(self.key)
 
+    def _pipeline_get_raw_value(self, pipe):
+        pipe.smembers(self.key)
+
     def _set_raw_value(self, val):
         pipe = self.connection.pipeline()
         pipe.delete(self.key)
@@ -239,9 +578,11 @@ class Set(Value):
         pipe.execute()
 
     def add(self, val):
+        self._invalidate()
         return self.connection.sadd(self.key, val)
 
     def add_return_size(self, val):
+        self._invalidate()
         pipe = self.connection.pipeline()
         pipe.sadd(self.key, val)
         pipe.scard(self.key)
@@ -256,6 +597,7 @@ class Set(Value):
         return removed, size
 
     def discard(self, val):
+        self._invalidate()
         pipe = self.connection.pipeline()
         pipe.srem(self.key, val)
         pipe.scard(self.key)
@@ -263,6 +605,7 @@ class Set(Value):
         return removed, size
 
     def update(self, vals):
+        self._invalidate()
         return self.connection.sadd(self.key, *vals)
 
     def __iter__(self):
@@ -337,6 +680,7 @@ class List(EncodableContainer):
         return self._decode_value(result)
 
     def __setitem__(self, idx, val):
+        self._invalidate()
         try:
             return self.connection.lset(self.key, idx, self._encode_value(val))
         except redis.ResponseError:
@@ -349,6 +693,12 @@ class List(EncodableContainer):
     def _get_raw_value(self):
         return self._decode_values(self.connection.lrange(self.key, 0, -1))
 
+    def _pipeline_get_raw_value(self, pipe):
+        pipe.lrange(self.key, 0, -1)
+
+    def _load_raw_value(self, raw_value):
+        self._cached_value = self._decode_values(raw_value)
+
     def _set_raw_value(self, val):
         self.connection.delete(self.key)
         if val:
@@ -360,6 +710,7 @@ class List(EncodableContainer):
     def extend(self, vals):
         # Something in the redis module doesn't work well with
         # generators, so we need an actual list
+        self._invalidate()
         encoded_vals = self._encode_values(vals)
         if encoded_vals:
             return self.connection.rpush(self.key, *encoded_vals)
@@ -390,12 +741,16 @@ class Hash(EncodableContainer):
 
 
     def incrby(self, key, n):
+        self._invalidate()
         return self.connection.hincrby(self.key, key, n)
 
 
     def _get_raw_value(self):
         return self.connection.hgetall(self.key)
 
+    def _pipeline_get_raw_value(self, pipe):
+        pipe.hgetall(self.key)
+
     def _set_raw_value(self, d):
         if d:
             pipe = self.connection.pipeline()
@@ -407,9 +762,11 @@ class Hash(EncodableContainer):
 
 
     def __setitem__(self, hkey, val):
+        self._invalidate()
         return self.connection.hset(self.key, hkey, self._encode_value(val))
 
     def setnx(self, hkey, val):
+        self._invalidate()
         return self.connection.hsetnx(self.key, hkey, self._encode_value(val))
 
 
@@ -430,6 +787,7 @@ class Hash(EncodableContainer):
             return self._decode_value(result)
 
     def __delitem__(self, hkey):
+        self._invalidate()
         pipe = self.connection.pipeline()
         pipe.hexists(self.key, hkey)
         pipe.hdel(self.key, hkey)
@@ -457,8 +815,18 @@ class Hash(EncodableContainer):
     def update(self, other):
         if not other:
             return None
+        self._invalidate()
         return self.connection.hmset(self.key, self._encode(other))
 
+    def scan(self, cursor=0, match=None, count=None):
+        """
+        Returns the cursor to continue from (0 when done) and a dict of the
+        entries one HSCAN call returned.
+        """
+        cursor, raw = self.connection.hscan(self.key, cursor, match=match,
+                count=count)
+        return int(cursor), self._decode(raw)
+
     def iteritems(self):
         return self.value.iteritems()
 
@@ -495,7 +863,13 @@ class ObjectMeta(type):
                     this_hv[name] = value
                     delattr(cls, name)
 
+        cls._packed = any(issubclass(p.cls, Field)
+                for p in cls._rom_properties.itervalues())
+
         class_info = "%s:%s" % (cls.__module__, cls.__name__)
+        for name, value in class_dict.iteritems():
+            if isinstance(value, Script) and value.name is None:
+                value.name = "%s.%s" % (class_info, name)
         mcs._class_registry[class_info] = cls
         cls._info = class_info
 
@@ -526,15 +900,50 @@ class Object(object):
     def __init__(self, connection=None, key=None):
         if connection is None or key is None:
             raise TypeError("You must specify a connection and a key")
+        connection = connection_for(connection, key)
+        if self._packed:
+            class_info = StringField(connection=connection, key=key,
+                    field=CLASS_INFO_FIELD)
+        else:
+            class_info = String(connection=connection, key=key)
         self.__dict__.update({
             "key": key,
             "_cache": {},
-            "_class_info": String(connection=connection, key=key),
+            "_class_info": class_info,
             "connection": connection,
         })
 
         for name, script in self._rom_scripts.iteritems():
-            self.__dict__[name] = functools.partial(script, self.connection)
+            self.__dict__[name] = functools.partial(self._call_script, script)
+
+    def _call_script(self, script, keys=[], args=[]):
+        try:
+            return script(self.connection, keys=keys, args=args)
+        finally:
+            # the script may have written any of this object's properties
+            for prop in self._cache.values():
+                if not prop.cacheable:
+                    prop._invalidate()
+
+    def load(self, props=None, missing_only=False):
+        """
+        Fetch the values of the named properties (default: all of them) in a
+        single round trip.  Subsequent reads of their .value are served from
+        the loaded snapshot until the property is written through redisom or
+        one of this object's scripts is run.  With missing_only, properties
+        that already have a loaded value are not read again.
+        """
+        bulk_get([self], props, missing_only=missing_only)
+        return self
+
+    def loaded(self, **values):
+        """
+        Records property values the caller has just written (e.g. with a
+        script) as if load had read them.  Returns self.
+        """
+        for name, value in values.iteritems():
+            getattr(self, name)._cached_value = value
+        return self
 
     def copy(self, dst_key):
         target = self.__class__.create(connection=self.connection, key=dst_key)
@@ -558,8 +967,12 @@ class Object(object):
                         " on class %s" % (name, self.__class__.__name__))
             else:
                 cls = propdef.cls
-                prop = cls.create(connection=self.connection,
-                        key=self.subkey(name), **propdef.kwargs)
+                if issubclass(cls, Field):
+                    prop = cls.create(connection=self.connection,
+                            key=self.key, field=name, **propdef.kwargs)
+                else:
+                    prop = cls.create(connection=self.connection,
+                            key=self.subkey(name), **propdef.kwargs)
                 self._cache[name] = prop
 
             result = prop
@@ -623,23 +1036,39 @@ class Object(object):
     def subkey(self, *args):
         return _make_key(self.key, *args)
 
+    @classmethod
+    def property_keys(cls, key):
+        """
+        Returns the keys of the properties of an object of this class at
+        key, without reading anything.
+        """
+        return [_make_key(key, name)
+                for name, propdef in cls._rom_properties.iteritems()
+                if not issubclass(propdef.cls, Field)]
+
     def associated_iterkeys(self):
-        for name in self._rom_properties.iterkeys():
-            yield getattr(self, name).key
-        yield self.key
+        """
+        Yields every key belonging to this object: the keys from
+        additional_associated_iterkeys first, then the object's own.  Keys
+        are yielded as they are found so that delete and expire work in
+        bounded batches, and an interrupted delete can be repeated.
+        """
         for name in self.additional_associated_iterkeys():
             yield name
+        for name in self.property_keys(self.key):
+            yield name
+        yield self.key
 
     def additional_associated_iterkeys(self):
         # override as a generator to add to .associated_iterkeys
         return []
 
     def delete(self):
-        keys = list(self.associated_iterkeys())
-        self.connection.delete(*keys)
+        for group in grouper(_KEY_CHUNK_SIZE, self.associated_iterkeys()):
+            unlink(self.connection, *[key for key in group if key is not None])
 
     def expire(self, seconds):
-        key_groups = grouper(_EXPIRE_CHUNK_SIZE, self.associated_iterkeys())
+        key_groups = grouper(_KEY_CHUNK_SIZE, self.associated_iterkeys())
         for group in key_groups:
             _EXPIRE_KEY_SCRIPT(connection=self.connection,
                     keys=[key for key in group if key is not None],
@@ -650,6 +1079,7 @@ def get_object(connection=None, key=None):
     if connection is None or key is None:
         raise TypeError("You must specify connection and key")
 
+    connection = connection_for(connection, key)
     class_info = connection.get(key)
     if class_info is None:
         raise NotInRedisError("No object found in redis with key (%s)" % key)
@@ -659,6 +1089,69 @@ def get_object(connection=None, key=None):
     return obj
 
 
+def bulk_get(objects, props=None, missing_only=False):
+    """
+    Load the named properties (default: all of them) of every object in
+    objects using one pipeline per connection (objects on different shards
+    of a ShardedConnection are bound to different connections).  See
+    Object.load.  With missing_only, properties that already have a loaded
+    value (see Object.loaded) are not read again.
+    """
+    objects = list(objects)
+
+    # connection id -> (pipeline, properties read on it)
+    pipelines = {}
+    for obj in objects:
+        if id(obj.connection) not in pipelines:
+            pipelines[id(obj.connection)] = (
+                    obj.connection.pipeline(transaction=False), [])
+        pipe, loaded = pipelines[id(obj.connection)]
+
+        if props is None:
+            names = obj._rom_properties.keys()
+        else:
+            names = props
+
+        for name in names:
+            if name not in obj._rom_properties:
+                raise AttributeError("Unknown attribute %s" % name)
+            prop = getattr(obj, name)
+            if missing_only and prop._cached_value is not UNINITIALIZED:
+                continue
+            prop._pipeline_get_raw_value(pipe)
+            loaded.append(prop)
+
+    for pipe, loaded in pipelines.itervalues():
+        if loaded:
+            for prop, raw_value in zip(loaded, pipe.execute()):
+                prop._load_raw_value(raw_value)
+
+    return objects
+
+
+def get_objects(connection=None, keys=None):
+    """
+    Like get_object for many keys at once, using a single MGET.  Keys with no
+    object stored at them give None.  All of keys must be on the same shard
+    (see ShardedConnection).
+    """
+    if connection is None or keys is None:
+        raise TypeError("You must specify connection and keys")
+    if not keys:
+        return []
+
+    connection = connection_for(connection, keys[0])
+
+    result = []
+    for key, class_info in zip(keys, connection.mget(keys)):
+        if class_info is None:
+            result.append(None)
+        else:
+            cls = Object.get_class(class_info)
+            result.append(cls(connection=connection, key=key))
+    return result
+
+
 def create_object(cls, connection=None, key=None, **kwargs):
     if key is None:
         key = cls.make_default_key()
@@ -688,5 +1181,6 @@ def invoke_instance_method(connection, method_descriptor, **kwargs):
     return method(**kwargs)
 
 
-_COPY_KEY_SCRIPT = Script(_COPY_KEY_SCRIPT_BODY)
-_EXPIRE_KEY_SCRIPT = Script(_EXPIRE_KEY_SCRIPT_BODY)
+_COPY_KEY_SCRIPT = Script(_COPY_KEY_SCRIPT_BODY, name='flow.redisom.copy_key')
+_EXPIRE_KEY_SCRIPT = Script(_EXPIRE_KEY_SCRIPT_BODY,
+        name='flow.redisom.expire_keys')
@@ -1,5 +1,6 @@
 from flow.util.exit import exit_process
 from flow.exit_codes import EXECUTE_ERROR
+from twisted.internet import defer
 import logging
 
 LOG = logging.getLogger(__name__)
@@ -13,3 +14,15 @@ def add_callback_and_default_errback(_deferred, _callback_fn, *args, **kwargs):
     _deferred.addCallback(_callback_fn, *args, **kwargs)
     _deferred.addErrback(catch_errors_and_crash)
     return _deferred
+
+def gather(deferreds):
+    """
+    Like DeferredList, but fails with the first failure among deferreds
+    instead of recording it in the results.
+    """
+    deferred = defer.DeferredList(deferreds, fireOnOneErrback=True,
+            consumeErrors=True)
+    return deferred.addErrback(_first_failure)
+
+def _first_failure(failure):
+    return failure.value.subFailure
@@ -18,6 +18,18 @@ def increment(*args, **kwargs):
     except:
         LOG.exception('failed to increment args=%s, kwargs=%s', args, kwargs)
 
+def gauge(*args, **kwargs):
+    try:
+        statsd.gauge(*args, **kwargs)
+    except:
+        LOG.exception('failed to gauge args=%s, kwargs=%s', args, kwargs)
+
+def timing(*args, **kwargs):
+    try:
+        statsd.timing(*args, **kwargs)
+    except:
+        LOG.exception('failed to time args=%s, kwargs=%s', args, kwargs)
+
 def create_timer(name):
     return statsd.StatsdTimer(name)
 
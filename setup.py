@@ -56,7 +56,6 @@ setup(
         },
         entry_points = entry_points,
         install_requires = [
-            'blist',
             'hiredis',
             'injector',
             'ipython',
@@ -4,6 +4,8 @@ from flow.brokers.local import LocalBroker
 from flow.orchestrator.handlers import PetriCreateTokenHandler
 from flow.orchestrator.handlers import PetriNotifyPlaceHandler
 from flow.orchestrator.handlers import PetriNotifyTransitionHandler
+from flow.orchestrator.storage_threads import StorageThreads
+from flow.orchestrator.topology_cache import TopologyCache
 from flow.orchestrator.service_interface import OrchestratorServiceInterface
 from flow.petri_net import builder
 from flow.shell_command.fork.handler import ForkShellCommandMessageHandler
@@ -56,7 +58,7 @@ def main(redis_socket_path, expect_failure):
                 'notify_transition_x': {'notify_transition_q':
                                         ['notify_transition_rk']},
                 'fork_submit_x': {'fork_submit_q': ['fork_submit_rk']}}
-    broker = LocalBroker(bindings=bindings)
+    broker = LocalBroker(bindings=bindings, concurrency=4)
 
     service_interfaces = {
             'orchestrator': OrchestratorServiceInterface(broker=broker,
@@ -70,18 +72,29 @@ def main(redis_socket_path, expect_failure):
                 exchange='fork_submit_x',
                 submit_routing_key='fork_submit_rk')}
 
+    topology_cache = TopologyCache(storage=conn, max_size=10)
+    storage_threads = StorageThreads(size=0)
     broker.register_handler(
             PetriCreateTokenHandler(redis=conn,
                 service_interfaces=service_interfaces,
-                queue_name='create_token_q'))
+                queue_name='create_token_q',
+                short_circuit_depth=0, short_circuit_budget=0,
+                topology_cache=topology_cache,
+                storage_threads=storage_threads))
     broker.register_handler(
             PetriNotifyPlaceHandler(redis=conn,
                 service_interfaces=service_interfaces,
-                queue_name='notify_place_q'))
+                queue_name='notify_place_q',
+                short_circuit_depth=0, short_circuit_budget=0,
+                topology_cache=topology_cache,
+                storage_threads=storage_threads))
     broker.register_handler(
             PetriNotifyTransitionHandler(redis=conn,
                 service_interfaces=service_interfaces,
-                queue_name='notify_transition_q'))
+                queue_name='notify_transition_q',
+                short_circuit_depth=0, short_circuit_budget=0,
+                topology_cache=topology_cache,
+                storage_threads=storage_threads))
 
     resource_type_definitions = {}
     broker.register_handler(
@@ -1,7 +1,16 @@
+from flow.petri_net import future
+from flow.petri_net.actions.merge import BasicMergeAction
+from flow.petri_net.builder import Builder, CompactBuilder
 from test_helpers.builder_test_base import BuilderTestBase
-from test_helpers.redistest import RedisTest
+from test_helpers.redistest import RedisTest, is_connected, start_redis
 from unittest import TestCase, main
 
+import flow.redisom as rom
+import mock
+import redis
+import tempfile
+import time
+
 
 class TestBuilderSystemTests(BuilderTestBase, RedisTest):
     def setUp(self):
@@ -9,5 +18,106 @@ class TestBuilderSystemTests(BuilderTestBase, RedisTest):
         BuilderTestBase.setUp(self)
 
 
+class TestShardedBuilder(RedisTest):
+    @classmethod
+    def setUpClass(cls):
+        super(TestShardedBuilder, cls).setUpClass()
+
+        cls.other_unix_socket_path = tempfile.mktemp()
+        cls.other_server = start_redis(cls.other_unix_socket_path)
+        cls.other_conn = redis.Redis(
+                unix_socket_path=cls.other_unix_socket_path)
+
+        begin_time = time.time()
+        while not is_connected(cls.other_conn) and (
+                time.time() - begin_time <= 1):
+            time.sleep(.01)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.other_server.terminate()
+        super(TestShardedBuilder, cls).tearDownClass()
+
+    def setUp(self):
+        RedisTest.setUp(self)
+        self.shards = [self.conn, self.other_conn]
+        self.sharded = rom.ShardedConnection(self.shards)
+
+        self.future_net = future.FutureNet('sharded')
+        start = self.future_net.add_place('start')
+        end = self.future_net.add_place('end')
+        self.future_net.bridge_places(start, end)
+
+    def tearDown(self):
+        self.other_conn.flushall()
+        RedisTest.tearDown(self)
+
+    def assert_nets_on_own_shards(self, builder_class):
+        nets = [builder_class(self.sharded).store(self.future_net, {}, {})
+                for i in xrange(20)]
+
+        for net in nets:
+            shard = self.sharded.connection_for(net.key)
+            self.assertIs(shard, net.connection)
+            self.assertEqual('sharded', net.name.value)
+            self.assertEqual(1,
+                    len(net.load_topology().transition_classes))
+
+            for other in self.shards:
+                if other is not shard:
+                    self.assertEqual([], other.keys(net.key + '*'))
+
+        self.assertTrue(all(s.dbsize() for s in self.shards))
+
+    def test_store(self):
+        self.assert_nets_on_own_shards(Builder)
+
+    def test_store_compact(self):
+        self.assert_nets_on_own_shards(CompactBuilder)
+
+
+class TestHashTags(RedisTest):
+    def setUp(self):
+        RedisTest.setUp(self)
+        rom.use_hash_tags()
+        self.addCleanup(rom.use_hash_tags, False)
+
+        self.future_net = future.FutureNet('tagged')
+        start = self.future_net.add_place('start')
+        middle = self.future_net.add_place('middle')
+        end = self.future_net.add_place('end')
+        self.future_net.bridge_places(start, middle)
+        self.merge = self.future_net.add_basic_transition('merge',
+                action=future.FutureAction(BasicMergeAction))
+        self.merge.add_arc_in(middle)
+        self.merge.add_arc_out(end)
+        self.future_places = [start, middle, end]
+
+    def assert_net_in_one_slot(self, builder_class):
+        builder = builder_class(self.conn)
+        net = builder.store(self.future_net, {}, {})
+        self.assertTrue(net.key.startswith('{') and net.key.endswith('}'))
+
+        start, middle, end = [builder.future_places[p]
+                for p in self.future_places]
+        cg = net.add_color_group(1)
+        token = net.create_token(cg.begin, cg.idx, data={'x': 1})
+        net.put_token(middle, token)
+        net.notify_transition(builder.future_transitions[self.merge], middle,
+                token_idx=token.index.value,
+                service_interfaces={'orchestrator': mock.Mock()})
+
+        self.assertIsNot(None, net.color_marking.get(
+            net.marking_key(cg.begin, end)))
+        self.assertEqual(set([rom.key_tag(net.key)]),
+                set(rom.key_tag(key) for key in self.conn.keys()))
+
+    def test_store(self):
+        self.assert_net_in_one_slot(Builder)
+
+    def test_store_compact(self):
+        self.assert_net_in_one_slot(CompactBuilder)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,265 @@
+from flow.orchestrator.short_circuit import ShortCircuitOrchestrator
+from flow.petri_net import future
+from flow.petri_net.actions.remove_data import RemoveDataAction
+from flow.petri_net.builder import Builder, CompactBuilder
+from flow.petri_net.color import ColorDescriptor
+from flow.petri_net.compact_net import CompactNet
+from flow.petri_net.token import CompactToken
+from flow.petri_net.transitions.barrier import BarrierTransition
+from flow.petri_net.transitions.basic import BasicTransition
+import flow.redisom as rom
+
+from test_helpers.redistest import RedisTest
+from unittest import main
+from mock import Mock
+
+
+class TestCompactNet(RedisTest):
+    def setUp(self):
+        self.future_net = future.FutureNet('compact')
+        self.start = self.future_net.add_place('start')
+        self.middle = self.future_net.add_place('middle')
+        self.end = self.future_net.add_place('end')
+
+        self.first = self.future_net.add_basic_transition('first')
+        self.first.add_arc_in(self.start)
+        self.first.add_arc_out(self.middle)
+
+        self.second = self.future_net.add_basic_transition('second',
+                action=future.FutureAction(RemoveDataAction,
+                    fields=['x']))
+        self.second.add_arc_in(self.middle)
+        self.second.add_arc_out(self.end)
+
+        self.builder = CompactBuilder(self.conn)
+        self.net = self.builder.store(self.future_net, {'v': 1}, {'c': 2})
+
+    def place_idx(self, future_place):
+        return self.builder.future_places[future_place]
+
+    def transition_idx(self, future_transition):
+        return self.builder.future_transitions[future_transition]
+
+    def test_store(self):
+        net = rom.get_object(self.conn, self.net.key)
+        self.assertIsInstance(net, CompactNet)
+        self.assertEqual('compact', net.name.value)
+        self.assertEqual(1, net.variable('v'))
+        self.assertEqual(2, net.constant('c'))
+        self.assertEqual(3, net.num_places)
+        self.assertEqual(2, net.num_transitions)
+
+        # net, name, variables, constants, counters, structure, arcs,
+        # basic_arcs_out, and the action with its args
+        self.assertEqual(10, len(self.conn.keys()))
+
+        self.assertRaises(TypeError, net.add_place, 'late')
+
+    def test_load_topology_matches_builder(self):
+        topology = self.net.load_topology()
+
+        # the same future net gets the same indices from both builders
+        legacy = Builder(self.conn).store(self.future_net, {}, {})
+        legacy_topology = legacy.load_topology()
+
+        self.assertEqual(legacy_topology.place_arcs_out,
+                topology.place_arcs_out)
+        self.assertEqual(legacy_topology.transition_arcs_out,
+                topology.transition_arcs_out)
+
+        trans, action = topology.transition(
+                self.transition_idx(self.second), self.net)
+        self.assertIsInstance(trans, BasicTransition)
+        self.assertIsInstance(action, RemoveDataAction)
+        self.assertEqual(['x'], action.args['fields'])
+        self.assertEqual((self.place_idx(self.end),),
+                topology.transition_arcs_out[
+                    self.transition_idx(self.second)])
+
+    def test_load_transition(self):
+        idx = self.transition_idx(self.first)
+        trans, action, arcs_out = self.net.load_transition(idx)
+        self.assertIsInstance(trans, BasicTransition)
+        self.assertIs(None, action)
+        self.assertEqual([self.place_idx(self.middle)], arcs_out)
+        self.assertEqual((self.net.arcs.key, 'T%d.arcs_in' % idx),
+                trans.arcs_location('arcs_in'))
+        self.assertEqual([self.place_idx(self.start)],
+                self.net.arcs['T%d.arcs_in' % idx])
+        self.assertEqual([self.place_idx(self.middle)],
+                self.net.arcs['T%d.arcs_out' % idx])
+
+        self.assertRaises(rom.NotInRedisError, self.net.load_transition, 2)
+
+    def test_fire_fused(self):
+        cg = self.net.add_color_group(1)
+        token = self.net.create_token(cg.begin, cg.idx)
+        start_idx = self.place_idx(self.start)
+        self.net.put_token(start_idx, token)
+
+        orchestrator = Mock()
+        svcs = {'orchestrator': orchestrator}
+        self.net.notify_place(start_idx, cg.begin, svcs)
+        orchestrator.notify_transition.assert_called_once_with(
+                net_key=self.net.key,
+                transition_idx=self.transition_idx(self.first),
+                place_idx=start_idx, token_idx=token.index.value)
+
+        self.net.notify_transition(self.transition_idx(self.first), start_idx,
+                token.index.value, svcs)
+        middle_idx = self.place_idx(self.middle)
+        orchestrator.notify_places.assert_called_once_with(self.net.key,
+                [(middle_idx, cg.begin)])
+        self.assertEqual({self.net.marking_key(cg.begin, middle_idx): 0},
+                self.net.color_marking.value)
+
+    def test_short_circuit_failure(self):
+        cg = self.net.add_color_group(1)
+        token = self.net.create_token(cg.begin, cg.idx)
+        start_idx = self.place_idx(self.start)
+        self.net.put_token(start_idx, token)
+
+        # the hop to the middle place fails after the first transition fired
+        topology_cache = Mock()
+        topology_cache.lookup.side_effect = [
+                (self.net, self.net.load_topology()), RuntimeError('lost')]
+        orchestrator = Mock()
+        services = ShortCircuitOrchestrator.wrap(topology_cache,
+                {'orchestrator': orchestrator}, max_depth=5, budget=10)
+
+        deferred = self.net.notify_place(start_idx, cg.begin, services)
+        errors = []
+        deferred.addErrback(errors.append)
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0].value, RuntimeError)
+        self.assertEqual(2, topology_cache.lookup.call_count)
+        self.assertFalse(orchestrator.notify_place.called)
+
+    def test_fire_with_action(self):
+        cg = self.net.add_color_group(1)
+        token = self.net.create_token(cg.begin, cg.idx, data={'x': 1, 'y': 2})
+        middle_idx = self.place_idx(self.middle)
+        self.net.put_token(middle_idx, token)
+
+        orchestrator = Mock()
+        self.net.notify_transition(self.transition_idx(self.second),
+                middle_idx, token.index.value, {'orchestrator': orchestrator})
+
+        end_idx = self.place_idx(self.end)
+        orchestrator.notify_places.assert_called_once_with(self.net.key,
+                [(end_idx, cg.begin)])
+        marking = self.net.color_marking.value
+        new_token = self.net.token(marking[
+            self.net.marking_key(cg.begin, end_idx)])
+        self.assertEqual({'y': 2}, new_token.data.value)
+
+    def test_barrier_consume(self):
+        future_net = future.FutureNet('barrier')
+        places = [future_net.add_place(), future_net.add_place()]
+        join = future_net.add_barrier_transition('join')
+        for place in places:
+            join.add_arc_in(place)
+
+        builder = CompactBuilder(self.conn)
+        net = builder.store(future_net, {}, {})
+        trans = net.transition(builder.future_transitions[join])
+        self.assertIsInstance(trans, BarrierTransition)
+
+        cg = net.add_color_group(2)
+        color_descriptor = ColorDescriptor(cg.begin, cg)
+        for color in cg.colors:
+            token = net.create_token(color, cg.idx)
+            for place in places:
+                net.put_token(builder.future_places[place], token)
+
+        rv = trans.consume_tokens(builder.future_places[places[0]],
+                color_descriptor, net.color_marking.key,
+                net.group_marking.key, net=net)
+        self.assertEqual(0, rv)
+        self.assertEqual(2, len(trans.active_tokens(color_descriptor).value))
+        self.assertEqual({}, net.color_marking.value)
+
+    def test_create_token(self):
+        cg = self.net.add_color_group(1)
+        keys_before = len(self.conn.keys())
+
+        token = self.net.create_token(cg.begin, cg.idx)
+        self.assertIsInstance(token, CompactToken)
+        self.assertEqual(keys_before + 1, len(self.conn.keys()))
+        self.assertEqual('hash', self.conn.type(token.key))
+
+        token = self.net.token(token.index.value)
+        self.assertTrue(token.exists())
+        self.assertEqual(self.net.key, token.net_key.value)
+        self.assertEqual(cg.begin, token.color.value)
+        self.assertEqual(cg.idx, token.color_group_idx.value)
+        self.assertEqual(0, token.index.value)
+        self.assertEqual(cg.begin, token.color_descriptor.color)
+
+        token = self.net.create_token(cg.begin, cg.idx, data={'x': [1]})
+        self.assertEqual(keys_before + 3, len(self.conn.keys()))
+        self.assertEqual({'x': [1]},
+                self.net.token(token.index.value).data.value)
+
+    def test_create_tokens(self):
+        cg = self.net.add_color_group(2)
+        keys_before = len(self.conn.keys())
+
+        tokens = self.net.create_tokens(cg, [None, {'x': 1}])
+        self.assertEqual(keys_before + 3, len(self.conn.keys()))
+        for i, token in enumerate(tokens):
+            self.assertIsInstance(token, CompactToken)
+            token = self.net.token(token.index.value)
+            self.assertEqual(i, token.index.value)
+            self.assertEqual(cg.begin + i, token.color.value)
+            self.assertEqual(cg.idx, token.color_group_idx.value)
+        self.assertEqual({'x': 1}, self.net.token(1).data.value)
+
+    def test_merge_creates_compact_token(self):
+        future_net = future.FutureNet('merge')
+        places = [future_net.add_place(), future_net.add_place()]
+        end = future_net.add_place()
+        merge = future_net.add_basic_transition('merge')
+        for place in places:
+            merge.add_arc_in(place)
+        merge.add_arc_out(end)
+
+        builder = CompactBuilder(self.conn)
+        net = builder.store(future_net, {}, {})
+        cg = net.add_color_group(1)
+        for i, place in enumerate(places):
+            token = net.create_token(cg.begin, cg.idx, data={'p%d' % i: i})
+            net.put_token(builder.future_places[place], token)
+
+        orchestrator = Mock()
+        place_idx = builder.future_places[places[1]]
+        net.notify_transition(builder.future_transitions[merge], place_idx,
+                token.index.value, {'orchestrator': orchestrator})
+
+        token_idx = net.color_marking.value[net.marking_key(cg.begin,
+            builder.future_places[end])]
+        new_token = net.token(token_idx)
+        self.assertEqual('hash', self.conn.type(new_token.key))
+        self.assertEqual(2, new_token.index.value)
+        self.assertEqual(cg.begin, new_token.color.value)
+        self.assertEqual({'p0': 0, 'p1': 1}, new_token.data.value)
+
+    def test_describe_color_marking(self):
+        cg = self.net.add_color_group(1)
+        token = self.net.create_token(cg.begin, cg.idx)
+        end_idx = self.place_idx(self.end)
+        self.net.put_token(end_idx, token)
+
+        self.assertEqual({self.net.marking_key(cg.begin, end_idx):
+            ('end', token.index.value)}, self.net.describe_color_marking())
+
+    def test_delete(self):
+        cg = self.net.add_color_group(1)
+        self.net.create_token(cg.begin, cg.idx)
+
+        self.net.delete()
+        self.assertEqual([], self.conn.keys())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from flow.petri_net.actions.merge import BasicMergeAction
+from flow.petri_net.color import ColorDescriptor
 from flow.petri_net.net import Net, ColorGroup, Token
 from flow.petri_net.net import PlaceNotFoundError, ForeignTokenError
 from flow.petri_net.transitions.basic import BasicTransition
@@ -6,7 +7,7 @@ import flow.redisom as rom
 
 from test_helpers import NetTest
 from unittest import main
-from mock import MagicMock, Mock, ANY
+from mock import MagicMock, Mock, ANY, patch
 
 class TestNet(NetTest):
     def setUp(self):
@@ -17,6 +18,53 @@ class TestNet(NetTest):
         color_group = self.net.add_color_group(size=1)
         return self.net.create_token(color_group.begin, color_group.idx, data)
 
+    def test_create_token(self):
+        token = self.create_simple_token(data={'x': 1})
+        self.assertEqual(Token._info, self.conn.get(token.key))
+        self.assertEqual(self.net.key, self.conn.get(token.net_key.key))
+        self.assertEqual(self.token.index.value + 1, token.index.value)
+
+        token = self.net.token(token.index.value)
+        self.assertEqual({'x': 1}, token.data.value)
+        self.assertEqual(self.token.color.value + 1, token.color.value)
+
+    def test_create_tokens(self):
+        cg = self.net.add_color_group(3)
+        tokens = self.net.create_tokens(cg, [{'x': 1}, None, {'y': [2]}])
+        self.assertEqual(range(cg.begin, cg.end),
+                [t.color.value for t in tokens])
+
+        first_idx = self.token.index.value + 1
+        for i, token in enumerate(tokens):
+            self.assertEqual(Token._info, self.conn.get(token.key))
+            token = self.net.token(first_idx + i)
+            self.assertEqual(first_idx + i, token.index.value)
+            self.assertEqual(cg.begin + i, token.color.value)
+            self.assertEqual(cg.idx, token.color_group_idx.value)
+            self.assertEqual(self.net.key, token.net_key.value)
+
+        self.assertEqual({'x': 1}, self.net.token(first_idx).data.value)
+        self.assertEqual({}, self.net.token(first_idx + 1).data.value)
+        self.assertEqual({'y': [2]}, self.net.token(first_idx + 2).data.value)
+
+        self.assertRaises(ValueError, self.net.create_tokens, cg, [None])
+
+    def test_create_tokens_in_batches(self):
+        cg = self.net.add_color_group(5)
+        with patch.object(Net, '_TOKEN_BATCH_SIZE', 2):
+            with patch.object(self.net, '_create_tokens_script',
+                    wraps=self.net._create_tokens_script) as script:
+                tokens = self.net.create_tokens(cg)
+        self.assertEqual(3, script.call_count)
+
+        first_idx = self.token.index.value + 1
+        self.assertEqual(range(first_idx, first_idx + 5),
+                [t.index.value for t in tokens])
+        self.assertEqual(range(cg.begin, cg.end),
+                [self.net.token(t.index.value).color.value for t in tokens])
+        self.assertEqual([], self.net.create_tokens(
+            self.net.add_color_group(0)))
+
     def test_put_token_place_not_found(self):
         token_idx = self.token.index.value
 
@@ -117,6 +165,108 @@ class TestNet(NetTest):
         self.assertEqual(123.0, home.first_token_timestamp.value)
 
 
+    def test_notify_transition_fused(self):
+        home = self.net.add_place("home")
+        out_a = self.net.add_place("out a")
+        out_b = self.net.add_place("out b")
+        trans = self.net.add_transition(BasicTransition)
+        trans.arcs_in = [home.index.value]
+        trans.arcs_out = [out_a.index.value, out_b.index.value]
+
+        self.net.put_token(home.index.value, self.token)
+        color = self.token.color.value
+
+        orchestrator = Mock()
+        svcs = {"orchestrator": orchestrator}
+        self.net.notify_transition(0, home.index.value,
+                self.token.index.value, svcs)
+
+        orchestrator.notify_places.assert_called_once_with('net',
+                [(out_a.index.value, color), (out_b.index.value, color)])
+        self.assertEqual({self.net.marking_key(color, 1): 0,
+            self.net.marking_key(color, 2): 0}, self.net.color_marking.value)
+
+    def test_describe_color_marking(self):
+        home = self.net.add_place("home")
+        away = self.net.add_place("away")
+        other_token = self.create_simple_token()
+
+        self.net.put_token(home.index.value, self.token)
+        self.net.put_token(away.index.value, other_token)
+
+        expected = {
+            self.net.marking_key(self.token.color.value, 0): ("home",
+                self.token.index.value),
+            self.net.marking_key(other_token.color.value, 1): ("away",
+                other_token.index.value),
+        }
+        self.assertEqual(expected, self.net.describe_color_marking())
+
+    def test_marking_indexes(self):
+        home = self.net.add_place("home").index.value
+        away = self.net.add_place("away").index.value
+        other_token = self.create_simple_token()
+        color = self.token.color.value
+
+        self.net.put_token(home, self.token)
+        self.net.put_token(away, self.token)
+        self.net.put_token(away, other_token)
+        self.assertEqual({home: 1, away: 2}, self.net.token_counts())
+        self.assertEqual([home, away], self.net.color_places(color))
+        self.assertEqual([away],
+                self.net.color_places(other_token.color.value))
+
+        trans = self.net.add_transition(BasicTransition)
+        trans.arcs_in.value = [home, away]
+        color_descriptor = ColorDescriptor(color,
+                self.net.color_group(self.token.color_group_idx.value))
+        self.assertEqual(0, trans.consume_tokens(home, color_descriptor,
+            self.net.color_marking.key, self.net.group_marking.key,
+            net=self.net))
+
+        self.assertEqual({away: 1}, self.net.token_counts())
+        self.assertEqual([], self.net.color_places(color))
+
+    def test_marking_predating_indexes(self):
+        home = self.net.add_place("home").index.value
+        self.net.put_token(home, self.token)
+        color = self.token.color.value
+        self.conn.delete(self.net.place_token_counts.key,
+                self.net.color_places_key(color))
+
+        trans = self.net.add_transition(BasicTransition)
+        trans.arcs_in.value = [home]
+        color_descriptor = ColorDescriptor(color,
+                self.net.color_group(self.token.color_group_idx.value))
+        self.assertEqual(0, trans.consume_tokens(home, color_descriptor,
+            self.net.color_marking.key, self.net.group_marking.key,
+            net=self.net))
+
+        self.assertEqual({}, self.net.token_counts())
+        self.assertEqual([], self.net.color_places(color))
+
+    def test_marking_page(self):
+        places = [self.net.add_place("p%d" % i).index.value
+                for i in xrange(3)]
+        cg = self.net.add_color_group(10)
+        for token in self.net.create_tokens(cg):
+            for place_idx in places:
+                self.net.put_token(place_idx, token)
+
+        cursor, page = self.net.marking_page(place_idx=places[1], count=100)
+        self.assertEqual(0, cursor)
+        self.assertEqual(10, len(page))
+        self.assertEqual(set([("p1", self.net.color_marking[key])
+            for key in page]), set(page.values()))
+
+        cursor, page = self.net.marking_page(color=cg.begin + 2, count=100)
+        self.assertItemsEqual([self.net.marking_key(cg.begin + 2, p)
+            for p in places], page.keys())
+
+        self.assertEqual(self.net.describe_color_marking(),
+                self.net.describe_color_marking(page_size=2))
+        self.assertEqual(30, len(self.net.describe_color_marking()))
+
     def test_delete(self):
         p = self.net.add_place('p')
         trans = self.net.add_transition(BasicTransition)
@@ -125,11 +275,46 @@ class TestNet(NetTest):
         tok = self.net.create_token(cg.begin, cg.idx)
 
         self.net.delete()
-        print list(self.net.associated_iterkeys_for_attribute('place'))
-        print [i for i in self.net.associated_iterkeys()]
+        self.assertEqual([], self.conn.keys())
 
+    def build_large_net(self):
+        for i in xrange(3):
+            self.net.add_place('p%d' % i)
+        for i in xrange(5):
+            trans = self.net.add_transition(BasicTransition, name='t%d' % i)
+            if i % 2:
+                BasicMergeAction.create(self.conn, key=trans.action_key,
+                        args={'i': i})
+            state_key = trans.subkey('state', i)
+            self.conn.set(state_key, 'x')
+            trans.transient_keys.add(state_key)
+
+        cg = self.net.add_color_group(20)
+        for color in cg.colors:
+            self.net.create_token(color, cg.idx, data={'c': color})
+
+    @patch('flow.redisom._KEY_CHUNK_SIZE', 7)
+    @patch.object(Net, '_TRANSITION_BATCH_SIZE', 2)
+    def test_delete_in_batches(self):
+        self.build_large_net()
+        self.net.delete()
         self.assertEqual([], self.conn.keys())
 
+        # repeating a delete is harmless
+        self.net.delete()
+
+    @patch('flow.redisom._KEY_CHUNK_SIZE', 7)
+    @patch.object(Net, '_TRANSITION_BATCH_SIZE', 2)
+    def test_expire(self):
+        self.build_large_net()
+        self.net.expire(100)
+
+        keys = self.conn.keys()
+        self.assertEqual(set(keys), set(self.net.associated_iterkeys())
+                & set(keys))
+        for key in keys:
+            self.assertTrue(0 < self.conn.ttl(key) <= 100, key)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,87 @@
+from flow.petri_net.actions.merge import BasicMergeAction
+from flow.petri_net.topology import NetTopology
+from flow.petri_net.transitions.barrier import BarrierTransition
+from flow.petri_net.transitions.basic import BasicTransition
+import flow.redisom as rom
+
+from test_helpers import NetTest
+from unittest import main
+from mock import Mock
+
+
+class TestNetTopology(NetTest):
+    def setUp(self):
+        NetTest.setUp(self)
+        self.start = self.net.add_place("start")
+        self.end_a = self.net.add_place("end a")
+        self.end_b = self.net.add_place("end b")
+
+        self.basic = self.net.add_transition(BasicTransition)
+        self.basic.arcs_in = [0]
+        self.basic.arcs_out = [1, 2]
+        self.start.arcs_out = [0, 1]
+
+        self.barrier = self.net.add_transition(BarrierTransition)
+        self.barrier.arcs_in = [0]
+        self.barrier.arcs_out = [2]
+        self.barrier.set_action(BasicMergeAction)
+
+    def test_load(self):
+        topology = NetTopology.load(self.net)
+
+        self.assertEqual(((0, 1), (), ()), topology.place_arcs_out)
+        self.assertEqual(((1, 2), (2,)), topology.transition_arcs_out)
+
+        trans, action = topology.transition(0, self.net)
+        self.assertIsInstance(trans, BasicTransition)
+        self.assertEqual(self.basic.key, trans.key)
+        self.assertIs(None, action)
+
+        trans, action = topology.transition(1, self.net)
+        self.assertIsInstance(trans, BarrierTransition)
+        self.assertIsInstance(action, BasicMergeAction)
+
+        self.assertRaises(rom.NotInRedisError, topology.transition, 2,
+                self.net)
+
+    def test_new_objects(self):
+        # a topology is shared by storage threads, so it keeps no redisom
+        # objects (with their loaded values) of its own
+        topology = NetTopology.load(self.net)
+
+        net = topology.new_net()
+        self.assertIsNot(net, topology.new_net())
+        self.assertIsInstance(net, type(self.net))
+        self.assertEqual(self.net.key, net.key)
+
+        self.assertIsNot(topology.transition(1, net)[0],
+                topology.transition(1, net)[0])
+
+    def test_notify_place(self):
+        topology = NetTopology.load(self.net)
+        self.start.arcs_out = [5]
+        cg = self.net.add_color_group(1)
+        token = self.net.create_token(cg.begin, cg.idx)
+        self.net.put_token(0, token)
+
+        orchestrator = Mock()
+        self.net.notify_place(0, cg.begin, {'orchestrator': orchestrator},
+                topology=topology)
+        self.assertEqual([0, 1], sorted(kwargs['transition_idx'] for _, kwargs
+                in orchestrator.notify_transition.call_args_list))
+
+    def test_notify_transition(self):
+        topology = NetTopology.load(self.net)
+        cg = self.net.add_color_group(1)
+        token = self.net.create_token(cg.begin, cg.idx)
+        self.net.put_token(0, token)
+
+        orchestrator = Mock()
+        self.net.notify_transition(0, 0, token.index.value,
+                {'orchestrator': orchestrator}, topology=topology)
+        orchestrator.notify_places.assert_called_once_with('net',
+                [(1, cg.begin), (2, cg.begin)])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
+from flow.petri_net import future
 from flow.petri_net.actions.base import BarrierActionBase
+from flow.petri_net.builder import Builder, CompactBuilder
 from flow.petri_net.color import ColorDescriptor
 from flow.petri_net.transitions.barrier import BarrierTransition
 from mock import MagicMock
-from test_helpers import NetTest
+from test_helpers import NetTest, RedisTest
+from twisted.internet import defer
 from unittest import main
 
 import flow.redisom as rom
@@ -155,5 +158,204 @@ class TestBarrier(NetTest):
                 token.color_group_idx.value)
 
 
+class GatherAction(BarrierActionBase):
+    count = rom.Property(rom.Int)
+
+    def execute(self, color_descriptor, active_tokens, net, service_interfaces):
+        self.count.incr(len(active_tokens))
+        color_group = color_descriptor.group
+        new_token = net.create_token(color_group.parent_color,
+                color_group.parent_color_group_idx)
+        return [new_token], defer.succeed(None)
+
+
+class TestGatherPlaces(RedisTest):
+    def setUp(self):
+        RedisTest.setUp(self)
+        self.future_net = future.FutureNet('gather')
+        self.gather = self.future_net.add_place('gather')
+        self.shared = self.future_net.add_place('shared')
+        self.end = self.future_net.add_place('end')
+
+        self.join = self.future_net.add_barrier_transition('join')
+        self.join.add_arc_in(self.gather)
+        self.join.add_arc_in(self.shared)
+        self.join.add_arc_out(self.end)
+
+        # shared also feeds a basic transition, so it is not a gather place
+        self.other = self.future_net.add_basic_transition('other')
+        self.other.add_arc_in(self.shared)
+
+    def store(self, builder_class):
+        self.builder = builder_class(self.conn)
+        self.net = self.builder.store(self.future_net, {}, {})
+        self.trans = self.net.transition(
+                self.builder.future_transitions[self.join])
+
+    def place_idx(self, future_place):
+        return self.builder.future_places[future_place]
+
+    def put_tokens(self, color_group, places):
+        for token in self.net.create_tokens(color_group):
+            for place in places:
+                self.net.put_token(self.place_idx(place), token)
+
+    def check_consume(self, builder_class):
+        self.store(builder_class)
+        gather_idx = self.place_idx(self.gather)
+        shared_idx = self.place_idx(self.shared)
+        self.assertEqual(set([str(gather_idx)]),
+                self.net.gather_places.value)
+
+        cg = self.net.add_color_group(5)
+        color_descriptor = ColorDescriptor(cg.begin, cg)
+        self.put_tokens(cg, [self.gather, self.shared])
+
+        group_tokens = self.net.group_tokens_key(cg.idx, gather_idx)
+        group_colors = self.net.group_colors_key(cg.idx, gather_idx)
+        self.assertEqual(5, self.conn.scard(group_tokens))
+        self.assertEqual(5, self.conn.hlen(group_colors))
+        self.assertFalse(self.conn.exists(self.net.group_tokens_key(cg.idx,
+            shared_idx)))
+        self.assertItemsEqual([self.net.marking_key(c, shared_idx)
+            for c in cg.colors], self.net.color_marking.keys())
+        self.assertEqual([shared_idx], self.net.color_places(cg.begin))
+        self.assertEqual({gather_idx: 5, shared_idx: 5},
+                self.net.token_counts())
+
+        rv = self.trans.consume_tokens(gather_idx, color_descriptor,
+                self.net.color_marking.key, self.net.group_marking.key,
+                net=self.net)
+        self.assertEqual(0, rv)
+        self.assertEqual(5, len(self.trans.active_tokens(color_descriptor)))
+        self.assertEqual({}, self.net.color_marking.value)
+        self.assertEqual({}, self.net.group_marking.value)
+        self.assertFalse(self.conn.exists(group_tokens))
+        self.assertFalse(self.conn.exists(group_colors))
+        self.assertEqual({}, self.net.token_counts())
+        self.assertEqual([], self.net.color_places(cg.begin))
+
+    def test_consume(self):
+        self.check_consume(Builder)
+
+    def test_consume_compact(self):
+        self.check_consume(CompactBuilder)
+
+    def test_consume_without_net(self):
+        self.store(Builder)
+        cg = self.net.add_color_group(2)
+        self.put_tokens(cg, [self.gather, self.shared])
+        gather_idx = self.place_idx(self.gather)
+
+        rv = self.trans.consume_tokens(gather_idx, ColorDescriptor(cg.begin,
+            cg), self.net.color_marking.key, self.net.group_marking.key)
+        self.assertEqual(-1, rv)
+        self.assertEqual(2, self.conn.scard(
+            self.net.group_tokens_key(cg.idx, gather_idx)))
+
+    def test_consume_command_count(self):
+        # a barrier fed only by gather places, so no command is per color
+        self.future_net = future.FutureNet('gather only')
+        places = [self.future_net.add_place(name) for name in 'abc']
+        self.join = self.future_net.add_barrier_transition('join')
+        for place in places:
+            self.join.add_arc_in(place)
+        self.store(Builder)
+        self.assertEqual(3, len(self.net.gather_places))
+
+        counts = []
+        for size in [2, 20]:
+            cg = self.net.add_color_group(size)
+            self.put_tokens(cg, places)
+
+            self.conn.config_resetstat()
+            rv = self.trans.consume_tokens(self.place_idx(places[0]),
+                    ColorDescriptor(cg.begin, cg), self.net.color_marking.key,
+                    self.net.group_marking.key, net=self.net)
+            self.assertEqual(0, rv)
+            counts.append(command_count(self.conn))
+            self.assertEqual({}, self.net.token_counts())
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_group_tokens_mismatch(self):
+        self.store(Builder)
+        cg = self.net.add_color_group(2)
+        self.put_tokens(cg, [self.gather, self.shared])
+        gather_idx = self.place_idx(self.gather)
+        self.conn.srem(self.net.group_tokens_key(cg.idx, gather_idx), 0)
+
+        rv = self.trans.consume_tokens(gather_idx, ColorDescriptor(cg.begin,
+            cg), self.net.color_marking.key, self.net.group_marking.key,
+            net=self.net)
+        self.assertEqual(-1, rv)
+        self.assertEqual(2, len(self.net.color_marking))
+        self.assertEqual(2, self.conn.hlen(self.net.group_colors_key(cg.idx,
+            gather_idx)))
+
+    def test_put_token_twice(self):
+        self.store(Builder)
+        cg = self.net.add_color_group(1)
+        token, other_token = self.net.create_tokens(cg) + \
+                self.net.create_tokens(cg)
+        gather_idx = self.place_idx(self.gather)
+
+        self.assertEqual(0, self.net.put_token(gather_idx, token))
+        self.assertEqual(0, self.net.put_token(gather_idx, token))
+        self.assertEqual(-1, self.net.put_token(gather_idx, other_token))
+        self.assertEqual({gather_idx: 1}, self.net.token_counts())
+
+    def test_notify_place(self):
+        self.store(Builder)
+        self.net.add_color_group(2)
+        cg = self.net.add_color_group(3)
+        self.put_tokens(cg, [self.gather])
+        gather_idx = self.place_idx(self.gather)
+        token_idx = self.net.marked_token(gather_idx, cg.begin + 1)
+        self.assertEqual(cg.begin + 1,
+                self.net.token(token_idx).color.value)
+
+        orchestrator = MagicMock()
+        self.net.notify_place(gather_idx, cg.begin + 1,
+                {'orchestrator': orchestrator})
+        orchestrator.notify_transition.assert_called_once_with(
+                net_key=self.net.key,
+                transition_idx=self.builder.future_transitions[self.join],
+                place_idx=gather_idx, token_idx=token_idx)
+        self.assertIsNone(self.net.marked_token(gather_idx, cg.end))
+
+    def test_notify_transition(self):
+        self.store(Builder)
+        parent = self.net.add_color_group(1)
+        cg = self.net.add_color_group(3, parent_color=parent.begin,
+                parent_color_group_idx=parent.idx)
+        self.put_tokens(cg, [self.gather, self.shared])
+
+        self.trans.set_action(GatherAction)
+        orchestrator = MagicMock()
+        self.net.notify_transition(self.builder.future_transitions[self.join],
+                self.place_idx(self.gather), 0,
+                {'orchestrator': orchestrator})
+
+        end_idx = self.place_idx(self.end)
+        self.assertEqual([self.net.marking_key(cg.parent_color, end_idx)],
+                self.net.color_marking.keys())
+        self.assertEqual(3, self.trans.action.count.value)
+
+    def test_delete(self):
+        self.store(Builder)
+        self.put_tokens(self.net.add_color_group(2), [self.gather])
+
+        self.net.delete()
+        self.assertEqual([], self.conn.keys())
+
+
+def command_count(conn):
+    # commands run since the last CONFIG RESETSTAT, scripts' included
+    return sum(stats['calls'] for name, stats
+            in conn.info('commandstats').iteritems()
+            if name not in ('cmdstat_config', 'cmdstat_info'))
+
+
 if __name__ == "__main__":
     main()
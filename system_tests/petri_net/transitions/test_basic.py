@@ -1,6 +1,12 @@
+from flow.petri_net import future
+from flow.petri_net.actions.merge import BasicMergeAction
+from flow.petri_net.actions.remove_data import RemoveDataAction
+from flow.petri_net.builder import Builder, CompactBuilder
 from flow.petri_net.color import ColorDescriptor
+from flow.petri_net.exceptions import BadTokenDataError
 from flow.petri_net.transitions.basic import BasicTransition
-from test_helpers import NetTest
+from mock import Mock
+from test_helpers import NetTest, RedisTest
 from unittest import main
 
 import flow.redisom as rom
@@ -116,6 +122,166 @@ class TestBasic(NetTest):
         self.assertNotIn(trans.active_tokens_key(color_descriptor),
                 trans.transient_keys)
 
+    def test_can_fire_fused(self):
+        trans = self.setup_transition(BasicTransition, 1, 1)
+        self.assertTrue(trans.can_fire_fused(None))
+        self.assertTrue(trans.can_fire_fused(
+            BasicMergeAction(self.conn, trans.action_key)))
+        self.assertFalse(trans.can_fire_fused(
+            RemoveDataAction(self.conn, trans.action_key)))
+
+    def test_consume_fire_push_waiting(self):
+        color_group = self.net.add_color_group(size=1)
+        trans = self.setup_transition(BasicTransition, 2, 1)
+        tokens = self._make_colored_tokens(color_group)
+        self._put_tokens([0], color_group.colors, color_group.idx, tokens)
+
+        rv = trans.consume_fire_push(self.net, 0, color_group.begin,
+                color_group.idx)
+
+        self.assertEqual(None, rv)
+        self.assertEqual(1, len(self.net.color_marking))
+
+    def test_consume_fire_push_single_token(self):
+        color_group = self.net.add_color_group(size=1)
+        trans = self.setup_transition(BasicTransition, 1, 2)
+        tokens = self._make_colored_tokens(color_group)
+        self._put_tokens([0], color_group.colors, color_group.idx, tokens)
+
+        rv = trans.consume_fire_push(self.net, 0, color_group.begin,
+                color_group.idx)
+
+        self.assertEqual([1, 2], rv)
+        self.assertEqual(1, self.net.num_tokens)
+        self.assertEqual({"0:1": 0, "0:2": 0}, self.net.color_marking.value)
+        self.assertEqual({"0:1": 1, "0:2": 1}, self.net.group_marking.value)
+        self.assertEqual(0, len(trans.transient_keys))
+
+    def test_consume_fire_push_merge(self):
+        color_group = self.net.add_color_group(size=1)
+        color = color_group.begin
+        trans = self.setup_transition(BasicTransition, 2, 1)
+        for place_idx, data in enumerate([{'a': 1}, {'a': 1, 'b': [2]}]):
+            token = self.net.create_token(color, color_group.idx, data=data)
+            self.net.put_token(place_idx, token)
+
+        rv = trans.consume_fire_push(self.net, 1, color, color_group.idx)
+
+        self.assertEqual([2], rv)
+        self.assertEqual(3, self.net.num_tokens)
+        new_token = self.net.token(2)
+        self.assertEqual({'a': 1, 'b': [2]}, new_token.data.value)
+        self.assertEqual(color, new_token.color.value)
+        self.assertEqual(color_group.idx, new_token.color_group_idx.value)
+        self.assertEqual(2, new_token.index.value)
+        self.assertEqual(self.net.key, new_token.net_key.value)
+        self.assertTrue(new_token.exists())
+        self.assertEqual({"0:2": 2}, self.net.color_marking.value)
+
+    def test_consume_fire_push_conflict(self):
+        color_group = self.net.add_color_group(size=1)
+        color = color_group.begin
+        trans = self.setup_transition(BasicTransition, 2, 1)
+        for place_idx, data in enumerate([{'a': 1}, {'a': 2}]):
+            token = self.net.create_token(color, color_group.idx, data=data)
+            self.net.put_token(place_idx, token)
+
+        self.assertRaises(BadTokenDataError, trans.consume_fire_push,
+                self.net, 1, color, color_group.idx)
+        self.assertEqual(2, self.net.num_tokens)
+
+        # as the action does when the transition is not fused
+        action = BasicMergeAction(self.conn, trans.action_key)
+        self.assertRaises(BadTokenDataError, action.execute, self.net,
+                ColorDescriptor(color, color_group), [0, 1], {})
+
+
+class TestSatisfiedPlaces(RedisTest):
+    def setUp(self):
+        RedisTest.setUp(self)
+        self.future_net = future.FutureNet('wide join')
+        self.inputs = [self.future_net.add_place() for i in xrange(5)]
+        self.end = self.future_net.add_place('end')
+
+        self.join = self.future_net.add_basic_transition('join')
+        for place in self.inputs:
+            self.join.add_arc_in(place)
+        self.join.add_arc_out(self.end)
+
+        self.other = self.future_net.add_basic_transition('other')
+        self.other.add_arc_in(self.inputs[0])
+
+    def store(self, builder_class):
+        self.builder = builder_class(self.conn)
+        self.net = self.builder.store(self.future_net, {}, {})
+        self.cg = self.net.add_color_group(1)
+        self.color_descriptor = ColorDescriptor(self.cg.begin, self.cg)
+
+    def place_idx(self, future_place):
+        return self.builder.future_places[future_place]
+
+    def transition(self, future_transition):
+        return self.net.transition(
+                self.builder.future_transitions[future_transition])
+
+    def put_token(self, future_place):
+        token = self.net.create_token(self.cg.begin, self.cg.idx)
+        self.net.put_token(self.place_idx(future_place), token)
+        return token
+
+    def check_consume(self, builder_class):
+        self.store(builder_class)
+        join = self.transition(self.join)
+        other = self.transition(self.other)
+        self.assertItemsEqual([self.builder.future_transitions[self.join],
+                self.builder.future_transitions[self.other]],
+                self.net.basic_arcs_out[self.place_idx(self.inputs[0])])
+
+        for i, place in enumerate(self.inputs):
+            token = self.put_token(place)
+            # putting the same token again is not counted twice
+            self.net.put_token(self.place_idx(place), token)
+            self.assertEqual({str(self.cg.begin): i + 1},
+                    join.satisfied_places.value)
+            self.assertEqual({str(self.cg.begin): 1},
+                    other.satisfied_places.value)
+
+            rv = join.consume_tokens(self.place_idx(place),
+                    self.color_descriptor, self.net.color_marking.key,
+                    self.net.group_marking.key, net=self.net)
+            self.assertEqual(len(self.inputs) - i - 1, rv)
+
+        self.assertFalse(self.conn.exists(
+            join.state_key(self.color_descriptor)))
+        self.assertEqual(5, len(join.active_tokens(self.color_descriptor)))
+        self.assertEqual({}, self.net.color_marking.value)
+        self.assertEqual({}, join.satisfied_places.value)
+        self.assertEqual({}, other.satisfied_places.value)
+
+    def test_consume(self):
+        self.check_consume(Builder)
+
+    def test_consume_compact(self):
+        self.check_consume(CompactBuilder)
+
+    def test_fire_fused(self):
+        self.store(CompactBuilder)
+        for place in self.inputs:
+            token = self.put_token(place)
+
+        orchestrator = Mock()
+        self.net.notify_transition(self.builder.future_transitions[self.join],
+                self.place_idx(self.inputs[-1]), token.index.value,
+                {'orchestrator': orchestrator})
+
+        end_idx = self.place_idx(self.end)
+        orchestrator.notify_places.assert_called_once_with(self.net.key,
+                [(end_idx, self.cg.begin)])
+        self.assertEqual([self.net.marking_key(self.cg.begin, end_idx)],
+                self.net.color_marking.keys())
+        self.assertEqual({},
+                self.transition(self.other).satisfied_places.value)
+
 
 if __name__ == "__main__":
     main()
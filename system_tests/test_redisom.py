@@ -17,11 +17,17 @@ _return_keys_script = "return KEYS"
 
 _return_args_script = "return ARGV"
 
+_incr_then_fail_script = """
+redis.call('INCR', KEYS[1])
+return redis.error_reply('failed after incr')
+"""
+
 class ScriptObj(rom.Object):
     good = rom.Script(script_body=_good_script)
     bad = rom.Script(script_body=_bad_script)
     keys = rom.Script(script_body=_return_keys_script)
     args = rom.Script(script_body=_return_args_script)
+    incr_then_fail = rom.Script(script_body=_incr_then_fail_script)
 
 
 class SimpleObj(rom.Object):
@@ -58,6 +64,62 @@ class TestRedisOm(RedisTest):
             keys=["a", "b", "c"], args=['1', '2', '3']))
 
 
+class TestScriptRegistry(RedisTest):
+    def setUp(self):
+        RedisTest.setUp(self)
+        self.conn.script_flush()
+        self.obj = ScriptObj.create(self.conn, key="x")
+
+    def script(self, name):
+        return ScriptObj._rom_scripts[name]
+
+    def test_names(self):
+        self.assertEqual('%s:ScriptObj.good' % __name__,
+                self.script('good').name)
+
+    def test_load_scripts(self):
+        num_scripts = rom.load_scripts(self.conn)
+        # all but the bad script
+        self.assertEqual(len(set(s.script_hash for s in rom._SCRIPTS)) - 1,
+                num_scripts)
+        hashes = [self.script(n).script_hash for n in ['good', 'keys']]
+        self.assertEqual([True, True], self.conn.script_exists(*hashes))
+
+    def test_reload_on_noscript(self):
+        script = self.script('good')
+        before = script.stats()
+
+        self.assertEqual([1, 2, '3'], self.obj.good())
+        self.assertTrue(self.conn.script_exists(
+            self.script('keys').script_hash)[0])
+
+        after = script.stats()
+        self.assertEqual(1, after['calls'] - before['calls'])
+        self.assertEqual(1, after['reloads'] - before['reloads'])
+        self.assertEqual(0, after['errors'] - before['errors'])
+
+        self.obj.good()
+        self.assertEqual(after['reloads'], script.stats()['reloads'])
+
+    def test_script_error_is_not_retried(self):
+        rom.load_scripts(self.conn)
+        script = self.script('incr_then_fail')
+        errors = script.stats()['errors']
+
+        self.assertRaises(redis.exceptions.ResponseError,
+                self.obj.incr_then_fail, keys=['counter'])
+        self.assertEqual('1', self.conn.get('counter'))
+        self.assertEqual(errors + 1, script.stats()['errors'])
+
+    def test_script_stats(self):
+        self.obj.keys(keys=['a'])
+        self.obj.keys(keys=['b'])
+
+        stats = rom.script_stats()['%s:ScriptObj.keys' % __name__]
+        self.assertGreaterEqual(stats['calls'], 2)
+        self.assertGreaterEqual(stats['seconds'], stats['max_seconds'])
+
+
 class TestCopyScript(RedisTest):
     def test_direct_primitives(self):
         self.conn.set("scalar1", "hello world")
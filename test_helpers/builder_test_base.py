@@ -10,6 +10,7 @@ class BuilderTestBase(object):
         self.builder = builder.Builder(self.conn)
 
         self.stored_net = Mock()
+        self.stored_net.connection = self.conn
         self.test_key = 'thing_under_test'
         self.stored_net.place_key.return_value = self.test_key
         self.stored_net.transition_key.return_value = self.test_key
@@ -35,6 +36,9 @@ class BuilderTestBase(object):
 
         stored_net = self.builder.store(skynet, variables, constants)
 
+        self.assertIs(self.conn, stored_net.connection)
+        self.assertEqual(9, stored_net.num_places)
+        self.assertEqual(9, stored_net.num_transitions)
         self.assertEqual('skynet', stored_net.name.value)
         self.assertItemsEqual(variables, stored_net.variables.value)
 
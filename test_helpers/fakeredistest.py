@@ -10,6 +10,12 @@ class FakeRedisAdapter(fakeredis.FakeRedis):
         usec = int((now - sec)*1e6)
         return sec, usec
 
+    def unlink(self, *keys):
+        return self.delete(*keys)
+
+    def execute_command(self, command, *args):
+        return getattr(self, command.lower())(*args)
+
 
 class FakeRedisTest(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,71 @@
+import unittest
+try:
+    from unittest import mock
+except:
+    import mock
+
+from flow.brokers.amqp.ack_batcher import AckBatcher
+from twisted.internet import task
+
+
+class AckBatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.ack = mock.Mock()
+        self.clock = task.Clock()
+        self.batcher = AckBatcher(self.ack, max_pending=3, max_delay=0.5,
+                clock=self.clock)
+        for tag in xrange(1, 6):
+            self.batcher.delivered(tag)
+
+    def test_disabled(self):
+        batcher = AckBatcher(self.ack, max_pending=1, max_delay=0.5,
+                clock=self.clock)
+        batcher.delivered(1)
+        batcher.acknowledge(1)
+        self.ack.assert_called_once_with(1, multiple=False)
+
+    def test_count_threshold(self):
+        self.batcher.acknowledge(1)
+        self.batcher.acknowledge(2)
+        self.assertEqual(0, self.ack.call_count)
+
+        self.batcher.acknowledge(3)
+        self.ack.assert_called_once_with(3, multiple=True)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_timer(self):
+        self.batcher.acknowledge(1)
+        self.clock.advance(0.4)
+        self.assertEqual(0, self.ack.call_count)
+
+        self.clock.advance(0.1)
+        self.ack.assert_called_once_with(1, multiple=True)
+
+    def test_out_of_order(self):
+        self.batcher.acknowledge(2)
+        self.batcher.acknowledge(3)
+        self.batcher.acknowledge(4)
+        self.clock.advance(1)
+        self.assertEqual(0, self.ack.call_count)
+
+        self.batcher.acknowledge(1)
+        self.ack.assert_called_once_with(4, multiple=True)
+
+    def test_rejected(self):
+        self.batcher.acknowledge(1)
+        self.batcher.rejected(2)
+        self.batcher.acknowledge(4)
+        self.batcher.rejected(3)
+        self.batcher.rejected(5)
+        self.clock.advance(1)
+
+        self.ack.assert_called_once_with(4, multiple=True)
+
+    def test_only_rejected(self):
+        self.batcher.rejected(1)
+        self.clock.advance(1)
+        self.assertEqual(0, self.ack.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from flow.brokers.amqp.batch import encode_batch, decode_batch
+from flow.protocol.exceptions import InvalidMessageException
+
+
+class BatchTests(unittest.TestCase):
+    def test_round_trip(self):
+        messages = ['{"a": 1}', '', 'x' * 1000]
+        self.assertEqual(messages, decode_batch(encode_batch(messages)))
+
+    def test_empty(self):
+        self.assertEqual('', encode_batch([]))
+        self.assertEqual([], decode_batch(''))
+
+    def test_truncated_prefix(self):
+        body = encode_batch(['abc'])
+        self.assertRaises(InvalidMessageException, decode_batch,
+                body + '\x00\x00')
+
+    def test_truncated_entry(self):
+        body = encode_batch(['abc', 'defg'])
+        self.assertRaises(InvalidMessageException, decode_batch, body[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
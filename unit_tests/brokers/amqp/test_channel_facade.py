@@ -107,7 +107,17 @@ class ChannelFacadeTests(unittest.TestCase):
         return_value = self.cf.basic_ack(recieve_tag)
 
         self.assertIs(return_value, expected_return_value)
-        self.cf._pika_channel.basic_ack.assert_called_once_with(recieve_tag)
+        self.cf._pika_channel.basic_ack.assert_called_once_with(recieve_tag,
+                multiple=False)
+
+    def test_basic_qos(self):
+        self.cf._pika_channel = mock.Mock()
+        return_value = self.cf.basic_qos(prefetch_count=5, all_channels=True)
+
+        self.assertIs(return_value,
+                self.cf._pika_channel.basic_qos.return_value)
+        self.cf._pika_channel.basic_qos.assert_called_once_with(
+                prefetch_count=5, all_channels=True)
 
     def test_basic_reject(self):
         self.cf._pika_channel = mock.Mock()
@@ -0,0 +1,55 @@
+import unittest
+try:
+    from unittest import mock
+except:
+    import mock
+
+from flow.brokers.amqp.channel_pool import ChannelPool
+from twisted.internet import defer
+
+
+class ChannelPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.cm = mock.Mock()
+        self.cm.connect.return_value = defer.Deferred()
+        self.cm.open_channel.side_effect = lambda: defer.Deferred()
+
+    def test_single_channel(self):
+        pool = ChannelPool(connection_manager=self.cm,
+                publish_channel_count=0, dedicated_consume_channels=False)
+
+        self.assertIs(pool.primary, pool.publish_channel())
+        self.assertIs(pool.primary, pool.publish_channel())
+        self.assertIs(pool.primary, pool.consume_channel('a'))
+        self.assertIs(pool.primary.connection_manager, self.cm)
+
+    def test_round_robin_publish(self):
+        pool = ChannelPool(connection_manager=self.cm,
+                publish_channel_count=2, dedicated_consume_channels=False)
+
+        first = pool.publish_channel()
+        second = pool.publish_channel()
+        self.assertIsNot(first, second)
+        self.assertIsNot(first, pool.primary)
+        self.assertIs(first, pool.publish_channel())
+
+    def test_dedicated_consume_channels(self):
+        pool = ChannelPool(connection_manager=self.cm,
+                publish_channel_count=0, dedicated_consume_channels=True)
+
+        a = pool.consume_channel('a')
+        self.assertIs(a, pool.consume_channel('a'))
+        self.assertIsNot(a, pool.consume_channel('b'))
+        self.assertIsNot(a, pool.primary)
+
+    def test_dedicated_channel_opened_once(self):
+        pool = ChannelPool(connection_manager=self.cm,
+                publish_channel_count=0, dedicated_consume_channels=True)
+
+        channel = pool.consume_channel('a')
+        self.assertIs(channel.connect(), channel.connect())
+        self.assertEqual(1, self.cm.open_channel.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
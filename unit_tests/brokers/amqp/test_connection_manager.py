@@ -149,6 +149,33 @@ class ConnectionManagerTests(unittest.TestCase):
         self.cm._connect_deferred.callback.assert_called_once_with(channel)
 
 
+    def test_open_channel(self):
+        connect_deferred = defer.Deferred()
+        self.cm.connect = mock.Mock(return_value=connect_deferred)
+        self.cm._connection = mock.Mock()
+        ch_d = defer.Deferred()
+        self.cm._connection.channel.return_value = ch_d
+
+        deferred = self.cm.open_channel()
+        first_channel = mock.Mock()
+        connect_deferred.callback(first_channel)
+        self.assertFalse(deferred.called)
+
+        channel = mock.Mock()
+        channel.basic_qos.return_value = defer.succeed(None)
+        ch_d.callback(channel)
+        channel.basic_qos.assert_called_once_with(
+                prefetch_count=connection_params.prefetch_count)
+
+        result = []
+        deferred.addCallback(result.append)
+        self.assertEqual([channel], result)
+
+        # other users of the connect deferred still get the first channel
+        connect_result = []
+        connect_deferred.addCallback(connect_result.append)
+        self.assertEqual([first_channel], connect_result)
+
     def test_private_on_connectTCP_failed(self):
         self.cm._connection_attempts = 1
         self.cm.state = CONNECTING
@@ -0,0 +1,98 @@
+import unittest
+try:
+    from unittest import mock
+except:
+    import mock
+
+from flow.brokers.amqp.prefetch_controller import AdaptivePrefetchParams
+from flow.brokers.amqp.prefetch_controller import PrefetchController
+from twisted.internet import task
+
+
+class PrefetchControllerTests(unittest.TestCase):
+    def setUp(self):
+        self.channel = mock.Mock()
+        self.clock = task.Clock()
+        self.params = AdaptivePrefetchParams(prefetch_count=8, minimum=2,
+                maximum=32, interval=1, latency_target=0.5)
+
+    def create_controller(self):
+        return PrefetchController(self.channel, self.params, name='q',
+                clock=self.clock)
+
+    def run_window(self, controller, concurrency, latency):
+        # all but the last delivery finish inside the window, the last one
+        # closes it
+        for i in xrange(concurrency):
+            controller.started()
+        for i in xrange(concurrency - 1):
+            controller.finished(self.clock.seconds() - latency)
+        self.clock.advance(self.params.interval)
+        controller.finished(self.clock.seconds() - latency)
+
+    def test_disabled_by_default(self):
+        params = AdaptivePrefetchParams(prefetch_count=8, minimum=1,
+                maximum=0, interval=1, latency_target=1)
+        self.assertFalse(params.enabled)
+        self.assertTrue(self.params.enabled)
+
+    def test_channel_limit(self):
+        self.create_controller()
+        self.assertEqual([mock.call.basic_qos(prefetch_count=0),
+            mock.call.basic_qos(prefetch_count=8, all_channels=True)],
+            [c for c in self.channel.mock_calls if c[0] == 'basic_qos'])
+
+    def test_saturated_doubles(self):
+        controller = self.create_controller()
+        self.channel.reset_mock()
+
+        self.run_window(controller, 8, 0.1)
+        self.assertEqual(16, controller.prefetch_count)
+        self.channel.basic_qos.assert_called_once_with(prefetch_count=16,
+                all_channels=True)
+
+        self.run_window(controller, 16, 0.1)
+        self.run_window(controller, 32, 0.1)
+        self.assertEqual(32, controller.prefetch_count)
+
+    def test_slow_handlers_halve(self):
+        controller = self.create_controller()
+
+        self.run_window(controller, 8, 2)
+        self.assertEqual(4, controller.prefetch_count)
+        self.run_window(controller, 4, 2)
+        self.run_window(controller, 2, 2)
+        self.assertEqual(2, controller.prefetch_count)
+
+    def test_underused_shrinks(self):
+        controller = self.create_controller()
+
+        self.run_window(controller, 4, 0.1)
+        self.assertEqual(8, controller.prefetch_count)
+
+        self.run_window(controller, 3, 0.1)
+        self.assertEqual(6, controller.prefetch_count)
+
+        self.run_window(controller, 1, 0.1)
+        self.assertEqual(2, controller.prefetch_count)
+
+    def test_no_change_within_interval(self):
+        controller = self.create_controller()
+
+        self.channel.reset_mock()
+        start_time = controller.started()
+        self.clock.advance(0.5)
+        controller.finished(start_time)
+        self.assertEqual(0, self.channel.basic_qos.call_count)
+
+    def test_initial_value_clamped(self):
+        self.params.prefetch_count = 100
+        controller = self.create_controller()
+
+        self.assertEqual(32, controller.prefetch_count)
+        self.channel.basic_qos.assert_called_with(prefetch_count=32,
+                all_channels=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
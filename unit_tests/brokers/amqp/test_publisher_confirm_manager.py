@@ -151,3 +151,33 @@ class TestPublisherConfirmManager(unittest.TestCase):
                 publish_tag=fake_tag, multiple=multiple)
         fake_deferred.callback.assert_called_once_with(fake_tag)
         self.pcm.remove_confirm_deferred.assert_called_once_with(fake_tag)
+
+    def test_fire_multiple(self):
+        deferreds = [defer.Deferred() for i in xrange(1000)]
+        for tag, deferred in enumerate(deferreds, 1):
+            self.pcm.add_confirm_deferred(tag, deferred)
+        self.assertEqual(1000, self.pcm.outstanding_count)
+
+        with mock.patch('flow.util.stats.gauge') as gauge:
+            self.pcm._fire_confirm_deferreds(publish_tag=600, multiple=True)
+            gauge.assert_called_once_with(
+                    'amqp.publisher_confirms.outstanding', 400)
+
+        self.assertTrue(all(d.called for d in deferreds[:600]))
+        self.assertFalse(any(d.called for d in deferreds[600:]))
+        self.assertEqual(600, self.pcm.confirmed_count)
+        self.assertEqual(601, self.pcm._confirm_tags[0])
+        self.assertEqual(400, len(self.pcm._publish_times))
+
+    def test_fire_single_out_of_order(self):
+        for tag in [1, 2, 3]:
+            self.pcm.add_confirm_deferred(tag, defer.Deferred())
+
+        with mock.patch('time.time', return_value=self.pcm._publish_times[0]
+                + 0.5):
+            self.pcm._fire_confirm_deferreds(publish_tag=2, multiple=False)
+
+        self.assertEqual([1, 3], list(self.pcm._confirm_tags))
+        self.assertEqual(2, len(self.pcm._publish_times))
+        self.assertEqual(1, self.pcm.confirmed_count)
+        self.assertAlmostEqual(0.5, self.pcm.max_confirm_latency, places=3)
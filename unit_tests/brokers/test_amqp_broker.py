@@ -2,7 +2,11 @@ from twisted.python.failure import Failure
 from twisted.internet import defer
 from flow.protocol.exceptions import InvalidMessageException
 
+from flow.brokers.amqp.batch import BATCH_MESSAGE_TYPE, encode_batch
+from flow.brokers.amqp.prefetch_controller import AdaptivePrefetchParams
 from flow.brokers.amqp_broker import AmqpBroker
+from flow.orchestrator.messages import NotifyPlaceMessage
+from flow.protocol.codec import JSON_CONTENT_TYPE, STRUCT_CONTENT_TYPE
 
 import unittest
 import mock
@@ -11,8 +15,17 @@ import mock
 class AmqpBrokerTests(unittest.TestCase):
     def setUp(self):
         self.channel = mock.Mock()
+        self.channel_pool = mock.Mock()
+        self.channel_pool.primary = self.channel
+        self.channel_pool.publish_channel.return_value = self.channel
+        self.channel_pool.consume_channel.return_value = self.channel
 
-        self.b = AmqpBroker(channel=self.channel)
+        self.prefetch_params = mock.Mock()
+        self.prefetch_params.enabled = False
+
+        self.b = AmqpBroker(channel_pool=self.channel_pool,
+                prefetch_params=self.prefetch_params, ack_batch_size=1,
+                ack_batch_delay=0, content_type=JSON_CONTENT_TYPE)
 
     def test_publish(self):
         exchange_name = mock.Mock()
@@ -30,7 +43,63 @@ class AmqpBrokerTests(unittest.TestCase):
         self.channel.basic_publish.assert_called_once_with(
                 exchange_name=exchange_name,
                 routing_key=routing_key,
-                encoded_message=encoded_message)
+                encoded_message=encoded_message,
+                content_type=JSON_CONTENT_TYPE)
+        message.encode.assert_called_once_with(JSON_CONTENT_TYPE)
+
+    def test_publish_many(self):
+        messages = [mock.Mock(), mock.Mock()]
+        messages[0].encode.return_value = 'first'
+        messages[1].encode.return_value = 'second'
+
+        return_value = self.b.publish_many('exchange', 'routing_key', messages)
+        self.assertIs(return_value, self.channel.basic_publish.return_value)
+        self.channel.basic_publish.assert_called_once_with(
+                exchange_name='exchange',
+                routing_key='routing_key',
+                encoded_message=encode_batch(['first', 'second']),
+                message_type=BATCH_MESSAGE_TYPE,
+                content_type=JSON_CONTENT_TYPE)
+
+    def test_publish_round_robin(self):
+        channels = [mock.Mock(), mock.Mock()]
+        self.channel_pool.publish_channel.side_effect = channels
+        message = mock.Mock()
+
+        self.b.publish('exchange', 'routing_key', message)
+        self.b.publish('exchange', 'routing_key', message)
+        for channel in channels:
+            self.assertEqual(1, channel.basic_publish.call_count)
+
+    def test_publish_struct(self):
+        self.b.content_type = STRUCT_CONTENT_TYPE
+        message = NotifyPlaceMessage(net_key='net', place_idx=1, color=2)
+
+        self.b.publish('exchange', 'routing_key', message)
+        self.channel.basic_publish.assert_called_once_with(
+                exchange_name='exchange',
+                routing_key='routing_key',
+                encoded_message=message.encode(STRUCT_CONTENT_TYPE),
+                content_type=STRUCT_CONTENT_TYPE)
+
+    def test_publish_struct_unsupported(self):
+        self.b.content_type = STRUCT_CONTENT_TYPE
+        message = mock.Mock()
+        message.binary_fields = None
+
+        self.b.publish('exchange', 'routing_key', message)
+        message.encode.assert_called_once_with(JSON_CONTENT_TYPE)
+
+    def test_publish_many_single(self):
+        message = mock.Mock()
+        message.encode.return_value = 'only'
+
+        self.b.publish_many('exchange', 'routing_key', [message])
+        self.channel.basic_publish.assert_called_once_with(
+                exchange_name='exchange',
+                routing_key='routing_key',
+                encoded_message='only',
+                content_type=JSON_CONTENT_TYPE)
 
     def test_register_handler(self):
         handler = mock.Mock()
@@ -41,20 +110,52 @@ class AmqpBrokerTests(unittest.TestCase):
         self.assertIs(return_value, deferred)
 
         deferred.addCallback.assert_called_once_with(self.b._start_handler,
-                handler=handler)
+                handler=handler, channel=self.channel)
+        self.channel_pool.consume_channel.assert_called_once_with(
+                handler.queue_name)
 
     def test_private_start_handler(self):
+        pika_channel = mock.Mock()
         channel = mock.Mock()
-        self.b.channel = mock.Mock()
         deferred = mock.Mock()
         channel.basic_consume = mock.Mock(return_value=deferred)
         handler = mock.Mock()
         handler.queue_name = 'fake_queue_name'
 
-        return_value = self.b._start_handler(channel, handler=handler)
-        self.assertIs(return_value, channel)
+        return_value = self.b._start_handler(pika_channel, handler=handler,
+                channel=channel)
+        self.assertIs(return_value, pika_channel)
+
+        channel.basic_consume.assert_called_once_with(queue='fake_queue_name')
+        deferred.addCallback.assert_called_once_with(self.b._begin_get_loop,
+                handler=handler, channel=channel)
+
+    def test_private_start_handler_prefetch_controller(self):
+        self.b.prefetch_params = AdaptivePrefetchParams(prefetch_count=8,
+                minimum=1, maximum=32, interval=1, latency_target=1)
+        channel = mock.Mock()
+        handlers = [mock.Mock(queue_name=name) for name in ['a', 'b']]
+
+        for handler in handlers:
+            self.b._start_handler(None, handler=handler, channel=channel)
+
+        # the consumers get no limit of their own, so the channel-wide one
+        # reaches them while they are running
+        self.assertEqual([
+            mock.call.basic_qos(prefetch_count=0),
+            mock.call.basic_qos(prefetch_count=8, all_channels=True),
+            mock.call.basic_consume(queue='a'),
+            mock.call.basic_consume(queue='b'),
+        ], [c for c in channel.mock_calls if c[0] in
+            ['basic_qos', 'basic_consume']])
 
-        self.b.channel.basic_consume.assert_called_once_with(queue='fake_queue_name')
+        controller = self.b.prefetch_controllers[channel]
+        self.assertEqual(1, len(self.b.prefetch_controllers))
+        self.assertEqual('a, b', controller.name)
+
+        controller._set_prefetch_count(16)
+        channel.basic_qos.assert_called_with(prefetch_count=16,
+                all_channels=True)
 
     def test_private_begin_get_loop(self):
         queue = mock.Mock()
@@ -64,10 +165,11 @@ class AmqpBrokerTests(unittest.TestCase):
 
         self.b._get_message_from_queue = mock.Mock()
 
-        return_value = self.b._begin_get_loop(consume_info, handler)
+        return_value = self.b._begin_get_loop(consume_info, handler,
+                self.channel)
         self.assertIs(return_value, consume_info)
         self.b._get_message_from_queue.assert_called_once_with(
-                queue=queue, handler=handler)
+                queue=queue, handler=handler, channel=self.channel)
 
     def test_private_get_message_from_queue(self):
         deferred = mock.Mock(defer.Deferred)
@@ -75,9 +177,11 @@ class AmqpBrokerTests(unittest.TestCase):
         queue.get = mock.Mock(return_value=deferred)
         handler = mock.Mock()
 
-        return_value = self.b._get_message_from_queue(queue, handler)
+        return_value = self.b._get_message_from_queue(queue, handler,
+                self.channel)
 
-        deferred.addCallback.assert_any_call(mock.ANY, queue=queue, handler=handler)
+        deferred.addCallback.assert_any_call(mock.ANY, queue=queue,
+                handler=handler, channel=self.channel)
         deferred.addErrback.assert_any_call(mock.ANY, handler=handler)
 
     def test_private_message_recieved(self):
@@ -99,47 +203,162 @@ class AmqpBrokerTests(unittest.TestCase):
         self.b._get_message_from_queue = mock.Mock()
 
         # without raising exception
-        return_value = self.b._message_recieved(get_info, queue, handler)
+        return_value = self.b._message_recieved(get_info, queue, handler,
+                self.channel)
         self.assertIs(return_value, get_info)
 
         handler.assert_called_once_with(message)
         deferred.addCallbacks.assert_called_once_with(
                 self.b._ack, self.b._reject,
-                callbackArgs=(recieve_tag,),
-                errbackArgs=(recieve_tag,))
-        self.b._get_message_from_queue.assert_called_once_with(queue, handler)
+                callbackArgs=(recieve_tag, self.channel),
+                errbackArgs=(recieve_tag, self.channel))
+        self.b._get_message_from_queue.assert_called_once_with(queue, handler,
+                self.channel)
 
         # raising InvalidMessageException
         handler.message_class.decode.side_effect = InvalidMessageException
         failed_deferred = mock.Mock()
         fake_fail = mock.Mock(return_value=failed_deferred)
         with mock.patch('twisted.internet.defer.fail', new=fake_fail):
-            return_value = self.b._message_recieved(get_info, queue, handler)
+            return_value = self.b._message_recieved(get_info, queue, handler,
+                    self.channel)
             self.assertIs(return_value, get_info)
 
             handler.assert_called__with(message)
             failed_deferred.addCallbacks.assert_called_with(
                     self.b._ack, self.b._reject,
-                    callbackArgs=(recieve_tag,),
-                    errbackArgs=(recieve_tag,))
-            self.b._get_message_from_queue.assert_called_with(queue, handler)
+                    callbackArgs=(recieve_tag, self.channel),
+                    errbackArgs=(recieve_tag, self.channel))
+            self.b._get_message_from_queue.assert_called_with(queue, handler,
+                    self.channel)
+
 
+    def _batch_get_info(self, messages):
+        basic_deliver = mock.Mock()
+        basic_deliver.delivery_tag = 'tag'
+        basic_deliver.routing_key = 'routing_key'
+        properties = mock.Mock()
+        properties.type = BATCH_MESSAGE_TYPE
+        properties.content_type = None
+        return (mock.Mock(), basic_deliver, properties, encode_batch(messages))
+
+    def test_private_message_recieved_batch(self):
+        get_info = self._batch_get_info(['a', 'b'])
+        deferreds = [defer.Deferred(), defer.Deferred()]
+        handler = mock.Mock(side_effect=deferreds)
+        handler.message_class.decode = lambda m, content_type: m.upper()
+
+        self.b._get_message_from_queue = mock.Mock()
+
+        self.b._message_recieved(get_info, mock.Mock(), handler, self.channel)
+        self.assertEqual([mock.call('A'), mock.call('B')],
+                handler.mock_calls)
+
+        deferreds[0].callback(None)
+        self.assertEqual(0, self.channel.basic_ack.call_count)
+        deferreds[1].callback(None)
+        self.channel.basic_ack.assert_called_once_with('tag')
+
+    def test_private_message_recieved_batch_failure(self):
+        get_info = self._batch_get_info(['a', 'b', 'c'])
+        handler = mock.Mock(side_effect=[defer.succeed(None),
+            defer.fail(RuntimeError('oops')), defer.succeed(None)])
+        handler.message_class.decode = lambda m, content_type: m
+        confirm = defer.Deferred()
+        self.channel.basic_publish.return_value = confirm
+
+        self.b._get_message_from_queue = mock.Mock()
+
+        self.b._message_recieved(get_info, mock.Mock(), handler, self.channel)
+        self.assertEqual(3, handler.call_count)
+        self.channel.basic_publish.assert_called_once_with(
+                exchange_name='dead', routing_key='routing_key',
+                encoded_message='b', content_type=None)
+
+        self.assertEqual(0, self.channel.basic_ack.call_count)
+        confirm.callback(None)
+        self.channel.basic_ack.assert_called_once_with('tag')
+        self.assertEqual(0, self.channel.basic_reject.call_count)
+
+    def test_private_message_recieved_batch_dead_letter_failure(self):
+        get_info = self._batch_get_info(['a', 'b'])
+        handler = mock.Mock(side_effect=[defer.fail(RuntimeError('oops')),
+            defer.succeed(None)])
+        handler.message_class.decode = lambda m, content_type: m
+        self.channel.basic_publish.return_value = defer.fail(
+                RuntimeError('nack'))
+
+        self.b._get_message_from_queue = mock.Mock()
+
+        self.b._message_recieved(get_info, mock.Mock(), handler, self.channel)
+        self.assertEqual(0, self.channel.basic_ack.call_count)
+        self.channel.basic_reject.assert_called_once_with('tag')
+
+    def test_private_message_recieved_batch_invalid(self):
+        get_info = self._batch_get_info(['a', 'b'])
+        handler = mock.Mock(return_value=defer.succeed(None))
+        handler.message_class.decode = mock.Mock(
+                side_effect=[InvalidMessageException, 'B'])
+        self.channel.basic_publish.return_value = defer.succeed(None)
+
+        self.b._get_message_from_queue = mock.Mock()
+
+        self.b._message_recieved(get_info, mock.Mock(), handler, self.channel)
+        handler.assert_called_once_with('B')
+        self.channel.basic_publish.assert_called_once_with(
+                exchange_name='dead', routing_key='routing_key',
+                encoded_message='a', content_type=None)
+        self.channel.basic_ack.assert_called_once_with('tag')
+
+    def test_private_message_recieved_prefetch_controller(self):
+        self.prefetch_params.enabled = True
+        controller = mock.Mock()
+        self.b.prefetch_controllers[self.channel] = controller
+        self.b._get_message_from_queue = mock.Mock()
+
+        deferred = defer.Deferred()
+        handler = mock.Mock(return_value=deferred)
+        properties = mock.Mock()
+        get_info = (mock.Mock(), mock.Mock(), properties, 'message')
+
+        self.b._message_recieved(get_info, mock.Mock(), handler, self.channel)
+        self.assertEqual(1, controller.started.call_count)
+        self.assertEqual(0, controller.finished.call_count)
+
+        deferred.callback(None)
+        controller.finished.assert_called_once_with(
+                controller.started.return_value)
 
     def test_private_ack(self):
         confirm_info = mock.Mock()
         recieve_tag = mock.Mock()
-        self.b.channel = mock.Mock()
+        channel = mock.Mock()
 
-        return_value = self.b._ack(confirm_info, recieve_tag)
+        return_value = self.b._ack(confirm_info, recieve_tag, channel)
         self.assertIs(return_value, confirm_info)
-        self.b.channel.basic_ack.assert_called_once_with(recieve_tag)
+        channel.basic_ack.assert_called_once_with(recieve_tag)
+
+    def test_private_ack_batched(self):
+        b = AmqpBroker(channel_pool=self.channel_pool,
+                prefetch_params=self.prefetch_params, ack_batch_size=2,
+                ack_batch_delay=1, content_type=JSON_CONTENT_TYPE)
+        other_channel = mock.Mock()
+        for channel in [self.channel, other_channel]:
+            b._acks_for(channel).delivered(1)
+            b._acks_for(channel).delivered(2)
+
+        b._ack(None, 2, self.channel)
+        b._ack(None, 1, self.channel)
+        self.channel.basic_ack.assert_called_once_with(2, multiple=True)
+
+        b._ack(None, 1, other_channel)
+        self.assertEqual(0, other_channel.basic_ack.call_count)
 
     def test_private_reject(self):
         reason = mock.Mock()
         recieve_tag = mock.Mock()
-        self.b.channel = mock.Mock()
+        channel = mock.Mock()
 
-        return_value = self.b._reject(reason, recieve_tag)
+        return_value = self.b._reject(reason, recieve_tag, channel)
         self.assertIs(return_value, None)
-        self.b.channel.basic_reject.assert_called_once_with(recieve_tag)
-
+        channel.basic_reject.assert_called_once_with(recieve_tag)
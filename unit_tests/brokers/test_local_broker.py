@@ -0,0 +1,100 @@
+from flow.brokers.local import LocalBroker
+from twisted.internet import defer
+
+import mock
+import unittest
+
+
+class FakeHandler(object):
+    def __init__(self, queue_name):
+        self.queue_name = queue_name
+        self.message_class = mock.Mock()
+        self.message_class.decode = lambda m: m
+        self.received = []
+        self.deferreds = []
+
+    def __call__(self, message):
+        self.received.append(message)
+        deferred = defer.Deferred()
+        self.deferreds.append(deferred)
+        return deferred
+
+
+class LocalBrokerTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor_patcher = mock.patch('flow.brokers.local.reactor')
+        self.reactor = self.reactor_patcher.start()
+
+        self.handler = FakeHandler('q')
+
+    def tearDown(self):
+        self.reactor_patcher.stop()
+
+    def create_broker(self, concurrency):
+        broker = LocalBroker(bindings={'x': {'q': ['rk']}},
+                concurrency=concurrency)
+        broker.register_handler(self.handler)
+        return broker
+
+    def publish(self, broker, *messages):
+        for m in messages:
+            broker.raw_publish('x', 'rk', m)
+
+    def test_concurrency_limit(self):
+        broker = self.create_broker(2)
+        self.publish(broker, 'a', 'b', 'c')
+
+        listen_deferred = broker.listen()
+        self.assertEqual(['a', 'b'], self.handler.received)
+        self.assertEqual(2, broker.in_flight)
+
+        self.handler.deferreds[1].callback(None)
+        self.assertEqual(['a', 'b', 'c'], self.handler.received)
+        self.assertFalse(listen_deferred.called)
+
+        self.handler.deferreds[0].callback(None)
+        self.handler.deferreds[2].callback(None)
+        self.assertTrue(listen_deferred.called)
+        self.reactor.callWhenRunning.assert_called_once_with(
+                self.reactor.stop)
+
+    def test_messages_published_by_handlers(self):
+        broker = self.create_broker(1)
+        self.publish(broker, 'a')
+        listen_deferred = broker.listen()
+
+        self.publish(broker, 'b')
+        self.assertEqual(['a'], self.handler.received)
+        self.handler.deferreds[0].callback(None)
+
+        self.assertEqual(['a', 'b'], self.handler.received)
+        self.assertFalse(listen_deferred.called)
+
+        self.handler.deferreds[1].callback(None)
+        self.assertTrue(listen_deferred.called)
+
+    def test_empty_queue(self):
+        broker = self.create_broker(1)
+        listen_deferred = broker.listen()
+
+        self.assertTrue(listen_deferred.called)
+        self.reactor.callWhenRunning.assert_called_once_with(
+                self.reactor.stop)
+
+    def test_handler_failure(self):
+        broker = self.create_broker(2)
+        self.publish(broker, 'a', 'b')
+        listen_deferred = broker.listen()
+
+        self.handler.deferreds[0].errback(RuntimeError('oops'))
+        self.assertFalse(listen_deferred.called)
+        self.handler.deferreds[1].callback(None)
+
+        errors = []
+        listen_deferred.addErrback(errors.append)
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].check(RuntimeError))
+
+
+if __name__ == '__main__':
+    unittest.main()
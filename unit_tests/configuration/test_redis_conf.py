@@ -0,0 +1,79 @@
+from flow.configuration.inject.redis_conf import RedisConfiguration, connect
+from unittest import TestCase, main
+
+import flow.redisom as rom
+import mock
+import os
+
+
+class RedisConfigurationTest(TestCase):
+    def setUp(self):
+        self.module = RedisConfiguration()
+        self.options = {
+            'max_connections': 5,
+            'socket_timeout': 2,
+            'socket_connect_timeout': 1,
+            'socket_keepalive': True,
+        }
+
+    def provide(self, host=None, port=6379, path=None, shards=[],
+            hash_tags=False):
+        with mock.patch.dict(os.environ, clear=True):
+            return self.module.provide_redis(host=host, port=port,
+                    path=path, shards=shards, hash_tags=hash_tags,
+                    **self.options)
+
+    def test_tcp(self):
+        conn = self.provide(host='redis-host', port=1234)
+        pool = conn.connection_pool
+        self.assertEqual(5, pool.max_connections)
+        self.assertEqual('redis-host', pool.connection_kwargs['host'])
+        self.assertEqual(1234, pool.connection_kwargs['port'])
+        self.assertEqual(2, pool.connection_kwargs['socket_timeout'])
+        self.assertEqual(1, pool.connection_kwargs['socket_connect_timeout'])
+        self.assertTrue(pool.connection_kwargs['socket_keepalive'])
+
+    def test_unix_socket(self):
+        conn = self.provide(path='/tmp/redis.sock')
+        pool = conn.connection_pool
+        self.assertEqual('/tmp/redis.sock', pool.connection_kwargs['path'])
+        self.assertEqual(2, pool.connection_kwargs['socket_timeout'])
+        self.assertNotIn('socket_keepalive', pool.connection_kwargs)
+
+    def test_socket_from_environment(self):
+        with mock.patch.dict(os.environ, FLOW_REDIS_SOCKET='/tmp/env.sock'):
+            conn = self.module.provide_redis(host='redis-host', port=1,
+                    path=None, shards=[{'host': 'a'}], hash_tags=False,
+                    **self.options)
+        self.assertEqual('/tmp/env.sock',
+                conn.connection_pool.connection_kwargs['path'])
+
+    def test_shards(self):
+        conn = self.provide(host='ignored', shards=[
+            {'host': 'a', 'port': 1},
+            {'unix_socket_path': '/tmp/b.sock', 'max_connections': 3},
+        ])
+        self.assertIsInstance(conn, rom.ShardedConnection)
+
+        a, b = [c.connection_pool for c in conn.connections]
+        self.assertEqual('a', a.connection_kwargs['host'])
+        self.assertEqual(5, a.max_connections)
+        self.assertEqual('/tmp/b.sock', b.connection_kwargs['path'])
+        self.assertEqual(3, b.max_connections)
+
+    def test_hash_tags(self):
+        self.addCleanup(rom.use_hash_tags, False)
+        self.provide(host='redis-host', hash_tags=True)
+        self.assertEqual('{net}', rom.hash_tag('net'))
+
+        self.provide(host='redis-host')
+        self.assertEqual('net', rom.hash_tag('net'))
+
+    def test_connect_defaults(self):
+        pool = connect(host='localhost').connection_pool
+        self.assertEqual(6379, pool.connection_kwargs['port'])
+        self.assertIs(None, pool.connection_kwargs['socket_timeout'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from flow.orchestrator.short_circuit import ShortCircuitOrchestrator
+from twisted.internet import defer
+from unittest import TestCase, main
+
+import mock
+
+
+class ShortCircuitOrchestratorTest(TestCase):
+    def setUp(self):
+        self.topology_cache = mock.Mock()
+        self.topology = mock.Mock()
+        self.orchestrator = mock.Mock()
+        self.fork = mock.Mock()
+        self.service_interfaces = {'orchestrator': self.orchestrator,
+                'fork': self.fork}
+
+        self.net = mock.Mock()
+        self.net.notify_place.return_value = defer.succeed('place')
+        self.net.notify_transition.return_value = defer.succeed('transition')
+
+        self.topology_cache.lookup.return_value = (self.net, self.topology)
+
+    def wrap(self, max_depth, budget):
+        return ShortCircuitOrchestrator.wrap(self.topology_cache,
+                self.service_interfaces, max_depth=max_depth, budget=budget)
+
+    def test_wrap_disabled(self):
+        self.assertIs(self.service_interfaces, self.wrap(0, 10))
+        self.assertIs(self.service_interfaces, self.wrap(10, 0))
+
+    def test_wrap(self):
+        services = self.wrap(2, 10)
+        self.assertIsInstance(services['orchestrator'],
+                ShortCircuitOrchestrator)
+        self.assertIs(self.fork, services['fork'])
+        self.assertIs(self.fork, services.get('fork'))
+        self.assertEqual('x', services.get('missing', 'x'))
+
+    def test_notify_place(self):
+        orchestrator = self.wrap(2, 10)['orchestrator']
+        deferred = orchestrator.notify_place('net', 3, 7)
+
+        self.assertEqual('place', deferred.result)
+        self.topology_cache.lookup.assert_called_once_with('net')
+        self.assertEqual(0, len(self.orchestrator.mock_calls))
+
+        args, kwargs = self.net.notify_place.call_args
+        self.assertEqual((3,), args)
+        self.assertEqual(7, kwargs['color'])
+        self.assertIs(self.topology, kwargs['topology'])
+        next_hop = kwargs['service_interfaces']['orchestrator']
+        self.assertEqual(1, next_hop.depth)
+        self.assertIs(self.fork, kwargs['service_interfaces']['fork'])
+
+    def test_notify_transition(self):
+        orchestrator = self.wrap(2, 10)['orchestrator']
+        deferred = orchestrator.notify_transition('net', 1, 2, 3)
+
+        self.assertEqual('transition', deferred.result)
+        args, kwargs = self.net.notify_transition.call_args
+        self.assertEqual((1, 2), args)
+        self.assertEqual(3, kwargs['token_idx'])
+        self.assertIs(self.topology, kwargs['topology'])
+
+    def test_depth_limit(self):
+        orchestrator = self.wrap(1, 10)['orchestrator']
+        orchestrator.notify_place('net', 3, 7)
+
+        kwargs = self.net.notify_place.call_args[1]
+        next_hop = kwargs['service_interfaces']['orchestrator']
+        next_hop.notify_transition('net', 1, 2, 3)
+
+        self.assertEqual(0, len(self.net.notify_transition.mock_calls))
+        self.orchestrator.notify_transition.assert_called_once_with(
+                'net', 1, 2, 3)
+
+    def test_budget_limit(self):
+        orchestrator = self.wrap(5, 2)['orchestrator']
+        for i in xrange(3):
+            orchestrator.notify_place('net', i, 7)
+
+        self.assertEqual(2, len(self.net.notify_place.mock_calls))
+        self.orchestrator.notify_place.assert_called_once_with('net', 2, 7)
+
+    def test_budget_shared_with_next_hop(self):
+        orchestrator = self.wrap(5, 2)['orchestrator']
+        orchestrator.notify_place('net', 0, 7)
+        kwargs = self.net.notify_place.call_args[1]
+        next_hop = kwargs['service_interfaces']['orchestrator']
+
+        next_hop.notify_place('net', 1, 7)
+        next_hop.notify_place('net', 2, 7)
+
+        self.assertEqual(2, len(self.net.notify_place.mock_calls))
+        self.orchestrator.notify_place.assert_called_once_with('net', 2, 7)
+
+    def test_exception_becomes_failure(self):
+        self.net.notify_place.side_effect = RuntimeError('oops')
+        orchestrator = self.wrap(2, 10)['orchestrator']
+
+        deferred = orchestrator.notify_place('net', 3, 7)
+        self.assertRaises(RuntimeError, deferred.result.raiseException)
+        deferred.addErrback(lambda _: None)
+
+    def test_create_token(self):
+        orchestrator = self.wrap(2, 10)['orchestrator']
+        orchestrator.create_token('net', 1, 2, 3, data={'a': 1})
+        self.orchestrator.create_token.assert_called_once_with('net', 1,
+                2, 3, data={'a': 1})
+
+
+if __name__ == "__main__":
+    main()
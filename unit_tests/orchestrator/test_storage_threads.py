@@ -0,0 +1,92 @@
+from flow.orchestrator import storage_threads
+from flow.orchestrator.storage_threads import StorageThreads
+from twisted.internet import defer
+from unittest import TestCase, main
+
+import mock
+
+
+class StorageThreadsTest(TestCase):
+    def setUp(self):
+        self.orchestrator = mock.Mock()
+        self.orchestrator.notify_place.return_value = defer.succeed('sent')
+        self.service_interfaces = {'orchestrator': self.orchestrator}
+
+        # run "in the pool" synchronously
+        patcher = mock.patch.object(storage_threads.threads,
+                'deferToThreadPool')
+        self.defer_to_thread_pool = patcher.start()
+        self.defer_to_thread_pool.side_effect = (
+                lambda reactor, pool, f, *args: defer.maybeDeferred(f, *args))
+        self.addCleanup(patcher.stop)
+
+        for name in ['ThreadPool', 'reactor']:
+            patcher = mock.patch.object(storage_threads, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def notify(self, service_interfaces, place_idx):
+        self.calling_services = service_interfaces
+        self.orchestrator_calls_during = self.orchestrator.method_calls[:]
+        service_interfaces['orchestrator'].notify_place('net', place_idx, 0)
+        return service_interfaces['orchestrator'].notify_place('net', 4, 1)
+
+    def test_inline(self):
+        threads = StorageThreads(size=0)
+        result = threads.run(self.notify, self.service_interfaces, 3)
+
+        self.assertIs(self.service_interfaces, self.calling_services)
+        self.assertEqual('sent', result.result)
+        self.assertFalse(self.defer_to_thread_pool.called)
+
+    def test_threaded(self):
+        threads = StorageThreads(size=2)
+        result = threads.run(self.notify, self.service_interfaces, 3)
+
+        self.assertIsNot(self.service_interfaces, self.calling_services)
+        self.assertEqual([], self.orchestrator_calls_during)
+        self.assertEqual([
+                mock.call.notify_place('net', 3, 0),
+                mock.call.notify_place('net', 4, 1),
+            ], self.orchestrator.method_calls)
+
+        self.assertTrue(result.called)
+        self.assertEqual(3, len(result.result))
+
+        threads.run(self.notify, self.service_interfaces, 5)
+        storage_threads.ThreadPool.assert_called_once_with(minthreads=2,
+                maxthreads=2, name='flow-storage')
+
+    def test_threaded_no_calls(self):
+        threads = StorageThreads(size=2)
+        result = threads.run(lambda services, x: x * 2,
+                self.service_interfaces, 3)
+        self.assertEqual(6, result.result)
+
+    def test_threaded_service_failure(self):
+        self.orchestrator.notify_place.return_value = defer.fail(
+                RuntimeError('broker down'))
+
+        threads = StorageThreads(size=2)
+        result = threads.run(self.notify, self.service_interfaces, 3)
+
+        errors = []
+        result.addErrback(errors.append)
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0].value, RuntimeError)
+
+    def test_threaded_exception(self):
+        def broken(services):
+            services['orchestrator'].notify_place('net', 1, 0)
+            raise RuntimeError('lua error')
+
+        threads = StorageThreads(size=2)
+        errors = []
+        threads.run(broken, self.service_interfaces).addErrback(errors.append)
+
+        self.assertIsInstance(errors[0].value, RuntimeError)
+        self.assertFalse(self.orchestrator.notify_place.called)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from flow.orchestrator.topology_cache import TopologyCache
+from flow.redisom import NotInRedisError
+from unittest import TestCase, main
+
+import mock
+
+
+class TopologyCacheTest(TestCase):
+    def setUp(self):
+        self.storage = mock.Mock()
+
+        self.nets = {}
+        self.load = mock.Mock()
+
+        patcher = mock.patch('flow.orchestrator.topology_cache.get_object')
+        self.get_object = patcher.start()
+        self.get_object.side_effect = self._get_object
+        self.addCleanup(patcher.stop)
+
+    def _get_object(self, storage, key):
+        if key in self.nets and not self.nets[key].connection.exists(key):
+            raise NotInRedisError(key)
+        net = self.nets.setdefault(key, mock.Mock(key=key))
+        net.load_topology.side_effect = self.load
+        self.load.side_effect = lambda: mock.Mock(
+                new_net=mock.Mock(return_value=net))
+        return net
+
+    def test_disabled(self):
+        cache = TopologyCache(storage=self.storage, max_size=0)
+        first = cache.lookup('a')
+        self.assertEqual((self.nets['a'], None), first)
+        self.assertEqual(first, cache.lookup('a'))
+        self.assertEqual(2, self.get_object.call_count)
+        self.assertEqual(0, self.load.call_count)
+
+    def test_cached(self):
+        cache = TopologyCache(storage=self.storage, max_size=2)
+        net, topology = cache.lookup('a')
+        self.assertIs(self.nets['a'], net)
+        self.assertEqual((net, topology), cache.lookup('a'))
+        self.assertEqual(1, self.load.call_count)
+
+    def test_lru_eviction(self):
+        cache = TopologyCache(storage=self.storage, max_size=2)
+        cache.lookup('a')
+        cache.lookup('b')
+        cache.lookup('a')
+        cache.lookup('c')
+        self.assertEqual(3, self.load.call_count)
+
+        cache.lookup('a')
+        self.assertEqual(3, self.load.call_count)
+        cache.lookup('b')
+        self.assertEqual(4, self.load.call_count)
+
+    def test_deleted_net(self):
+        cache = TopologyCache(storage=self.storage, max_size=2)
+        net, topology = cache.lookup('a')
+        net.connection.exists.return_value = False
+
+        self.assertRaises(NotInRedisError, cache.lookup, 'a')
+        self.assertEqual(2, self.get_object.call_count)
+        self.assertEqual(1, self.load.call_count)
+
+
+if __name__ == "__main__":
+    main()
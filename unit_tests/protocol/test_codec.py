@@ -0,0 +1,63 @@
+from flow.orchestrator.messages import CreateTokenMessage
+from flow.orchestrator.messages import NotifyPlaceMessage
+from flow.orchestrator.messages import NotifyTransitionMessage
+from flow.protocol.codec import JSON_CONTENT_TYPE, STRUCT_CONTENT_TYPE
+from flow.protocol.codec import content_type_for, get_codec
+from flow.protocol.exceptions import InvalidMessageException
+from flow.shell_command.messages import ShellCommandSubmitMessage
+
+import json
+import unittest
+
+
+class CodecTest(unittest.TestCase):
+    def setUp(self):
+        self.messages = [
+            NotifyPlaceMessage(net_key=u'net', place_idx=3, color=2**40),
+            NotifyTransitionMessage(net_key=u'net', place_idx=3,
+                transition_idx=4, token_idx=5),
+            CreateTokenMessage(net_key=u'net', place_idx=3, color=7,
+                color_group_idx=1, data={'a': [1, 2]}),
+            CreateTokenMessage(net_key=u'net', place_idx=3, color=7,
+                color_group_idx=1),
+        ]
+
+    def test_round_trip(self):
+        for content_type in [JSON_CONTENT_TYPE, STRUCT_CONTENT_TYPE]:
+            for message in self.messages:
+                encoded = message.encode(content_type)
+                self.assertEqual(message,
+                        message.decode(encoded, content_type=content_type))
+
+    def test_default_is_json(self):
+        message = self.messages[0]
+        self.assertEqual(message.to_dict(), json.loads(message.encode()))
+        self.assertEqual(message, NotifyPlaceMessage.decode(message.encode()))
+
+    def test_struct_is_smaller(self):
+        message = self.messages[0]
+        self.assertLess(len(message.encode(STRUCT_CONTENT_TYPE)),
+                len(message.encode(JSON_CONTENT_TYPE)))
+
+    def test_struct_truncated(self):
+        encoded = self.messages[0].encode(STRUCT_CONTENT_TYPE)
+        for end in [0, 5, len(encoded) - 1]:
+            self.assertRaises(InvalidMessageException,
+                    NotifyPlaceMessage.decode, encoded[:end],
+                    content_type=STRUCT_CONTENT_TYPE)
+
+    def test_unknown_content_type(self):
+        self.assertRaises(InvalidMessageException, get_codec, 'text/plain')
+
+    def test_content_type_for(self):
+        self.assertEqual(STRUCT_CONTENT_TYPE, content_type_for(
+            [NotifyPlaceMessage, CreateTokenMessage], STRUCT_CONTENT_TYPE))
+        self.assertEqual(JSON_CONTENT_TYPE, content_type_for(
+            [NotifyPlaceMessage, ShellCommandSubmitMessage],
+            STRUCT_CONTENT_TYPE))
+        self.assertEqual(JSON_CONTENT_TYPE, content_type_for(
+            [NotifyPlaceMessage], JSON_CONTENT_TYPE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+from flow.protocol.exceptions import InvalidMessageException
+from flow.protocol.message import Message
+
+import unittest
+
+
+class ExampleMessage(Message):
+    required_fields = {
+            'name': basestring,
+            'count': (int, long),
+    }
+
+    optional_fields = {
+            'data': dict,
+    }
+
+
+class ExtendedMessage(ExampleMessage):
+    optional_fields = {
+            'data': dict,
+            'extra': int,
+    }
+
+
+class MessageTest(unittest.TestCase):
+    def test_slots(self):
+        message = ExampleMessage(name='a', count=1)
+        self.assertFalse(hasattr(message, '__dict__'))
+        self.assertEqual(('count', 'name', 'data'), message._field_names)
+        self.assertRaises(AttributeError, setattr, message, 'other', 1)
+
+    def test_to_dict(self):
+        message = ExampleMessage(name='a', count=1, data=None)
+        self.assertEqual({'name': 'a', 'count': 1}, message.to_dict())
+
+        message = ExampleMessage(name='a', count=1, data={'b': 2})
+        self.assertEqual({'name': 'a', 'count': 1, 'data': {'b': 2}},
+                message.to_dict())
+
+    def test_get(self):
+        message = ExampleMessage(name='a', count=1)
+        self.assertEqual('a', message['name'])
+        self.assertEqual('a', message.get('name'))
+        self.assertRaises(KeyError, message.__getitem__, 'data')
+        self.assertEqual({}, message.get('data', {}))
+        self.assertRaises(KeyError, message.__getitem__, 'validate')
+
+    def test_missing_required(self):
+        self.assertRaises(InvalidMessageException, ExampleMessage, name='a')
+
+    def test_wrong_type(self):
+        self.assertRaises(InvalidMessageException, ExampleMessage,
+                name='a', count='1')
+        self.assertRaises(InvalidMessageException, ExampleMessage,
+                name='a', count=1, data=[])
+
+    def test_extra_arguments(self):
+        self.assertRaises(InvalidMessageException, ExampleMessage,
+                name='a', count=1, other=2)
+
+    def test_equality(self):
+        self.assertEqual(ExampleMessage(name='a', count=1),
+                ExampleMessage(name='a', count=1))
+        self.assertNotEqual(ExampleMessage(name='a', count=1),
+                ExampleMessage(name='a', count=2))
+        self.assertNotEqual(ExampleMessage(name='a', count=1),
+                ExtendedMessage(name='a', count=1))
+
+    def test_subclass(self):
+        message = ExtendedMessage(name='a', count=1, extra=3)
+        self.assertEqual({'name': 'a', 'count': 1, 'extra': 3},
+                message.to_dict())
+        self.assertEqual(('extra',), ExtendedMessage.__slots__)
+        self.assertFalse(hasattr(message, '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,271 @@
+from flow.brokers.local import LocalBroker
+from flow.memory_storage import MemoryStorage
+from flow.orchestrator.handlers import PetriCreateTokenHandler
+from flow.orchestrator.handlers import PetriNotifyPlaceHandler
+from flow.orchestrator.handlers import PetriNotifyTransitionHandler
+from flow.orchestrator.service_interface import OrchestratorServiceInterface
+from flow.orchestrator.storage_threads import StorageThreads
+from flow.orchestrator.topology_cache import TopologyCache
+from flow.petri_net import future
+from flow.petri_net.actions.base import BarrierActionBase
+from flow.petri_net.builder import Builder, CompactBuilder
+from flow.util.containers import head
+from redis.exceptions import NoScriptError, ResponseError
+from twisted.internet import defer
+
+import flow.petri_net.memory_scripts
+import flow.redisom as rom
+import mock
+import unittest
+
+
+class TestMemoryStorage(unittest.TestCase):
+    def setUp(self):
+        self.conn = MemoryStorage()
+
+    def test_strings(self):
+        self.assertIs(None, self.conn.get('a'))
+        self.assertTrue(self.conn.set('a', 1))
+        self.assertEqual('1', self.conn.get('a'))
+        self.assertFalse(self.conn.setnx('a', 2))
+        self.assertEqual(3, self.conn.incr('a', 2))
+        self.assertEqual(2, self.conn.decr('a'))
+        self.assertEqual(['2', None], self.conn.mget(['a', 'b']))
+        self.assertEqual('string', self.conn.type('a'))
+
+    def test_hashes(self):
+        self.assertEqual(1, self.conn.hset('h', 'x', 1))
+        self.assertEqual(0, self.conn.hset('h', 'x', 2))
+        self.assertEqual(0, self.conn.hsetnx('h', 'x', 3))
+        self.assertTrue(self.conn.hmset('h', {'y': 'b', 3: 4.5}))
+        self.assertEqual({'x': '2', 'y': 'b', '3': '4.5'},
+                self.conn.hgetall('h'))
+        self.assertEqual(['2', None], self.conn.hmget('h', ['x', 'z']))
+        self.assertEqual(5, self.conn.hincrby('h', 'x', 3))
+
+        self.assertEqual(2, self.conn.hdel('h', 'x', 'y', 'z'))
+        self.assertEqual(1, self.conn.hdel('h', 3))
+        self.assertFalse(self.conn.exists('h'))
+
+    def test_hscan(self):
+        expected = dict(('f%d' % i, str(i)) for i in xrange(50))
+        self.conn.hmset('h', expected)
+
+        result = {}
+        cursor, page = self.conn.hscan('h', count=7)
+        result.update(page)
+        while cursor:
+            cursor, page = self.conn.hscan('h', cursor, count=7)
+            self.assertLessEqual(len(page), 8)
+            result.update(page)
+        self.assertEqual(expected, result)
+
+        cursor, page = self.conn.hscan('h', match='f1?', count=100)
+        self.assertEqual(0, cursor)
+        self.assertEqual(sorted('f1%d' % i for i in xrange(10)),
+                sorted(page))
+
+    def test_lists(self):
+        self.assertEqual(3, self.conn.rpush('l', 'a', 'b', 'c'))
+        self.assertEqual(['a', 'b', 'c'], self.conn.lrange('l', 0, -1))
+        self.assertEqual(['b'], self.conn.lrange('l', 1, -2))
+        self.assertTrue(self.conn.lset('l', 1, 'x'))
+        self.assertEqual('x', self.conn.lindex('l', 1))
+        self.assertIs(None, self.conn.lindex('l', 5))
+        self.assertEqual(3, self.conn.llen('l'))
+
+    def test_sets(self):
+        self.assertEqual(2, self.conn.sadd('s', 1, 2, 2))
+        self.assertEqual(1, self.conn.sadd('t', 3))
+        self.assertTrue(self.conn.sismember('s', 1))
+        self.assertEqual(3, self.conn.sunionstore('u', ['s', 't']))
+        self.assertEqual(set(['1', '2', '3']), self.conn.smembers('u'))
+
+        self.assertEqual(1, self.conn.srem('t', 3, 4))
+        self.assertFalse(self.conn.exists('t'))
+        self.assertEqual(0, self.conn.scard('t'))
+
+    def test_sorted_sets(self):
+        self.assertEqual(2, self.conn.zadd('z', 'a', 1, b=5))
+        self.assertEqual(0, self.conn.zadd('z', a=3))
+        self.assertEqual(['b', 'a'],
+                self.conn.zrevrangebyscore('z', '+inf', '-inf'))
+        self.assertEqual([('a', 3.0)], self.conn.zrevrangebyscore('z', 4,
+            '-inf', start=0, num=1, withscores=True))
+        self.assertEqual([], self.conn.zrevrangebyscore('z', 2, '-inf'))
+        self.assertEqual('zset', self.conn.type('z'))
+        self.assertRaises(ResponseError, self.conn.hget, 'z', 'a')
+
+    def test_wrong_type(self):
+        self.conn.set('a', 1)
+        self.assertRaises(ResponseError, self.conn.hget, 'a', 'x')
+        self.assertRaises(ResponseError, self.conn.sadd, 'a', 'x')
+
+    def test_keys(self):
+        self.conn.set('a:1', 1)
+        self.conn.sadd('a:2', 1)
+        self.conn.set('b', 1)
+        self.assertEqual(['a:1', 'a:2'], sorted(self.conn.keys('a:*')))
+
+        self.assertTrue(self.conn.rename('a:2', 'c'))
+        self.assertEqual('set', self.conn.type('c'))
+        self.assertRaises(ResponseError, self.conn.rename, 'a:2', 'd')
+
+        self.assertEqual(2, self.conn.execute_command('UNLINK', 'a:1', 'c',
+            'x'))
+        self.assertEqual(['b'], self.conn.keys())
+
+    def test_expire(self):
+        self.conn.set('a', 1)
+        self.assertEqual(-1, self.conn.ttl('a'))
+        self.assertTrue(self.conn.expire('a', 10))
+        self.assertEqual(10, self.conn.ttl('a'))
+        self.assertFalse(self.conn.expire('b', 10))
+
+        with mock.patch('flow.memory_storage._now') as now:
+            now.return_value = 1e12
+            self.assertIs(None, self.conn.get('a'))
+            self.assertEqual(-2, self.conn.ttl('a'))
+
+    def test_pipeline(self):
+        self.conn.set('a', 1)
+
+        pipe = self.conn.pipeline()
+        pipe.get('a').sadd('a', 1)
+        pipe.hset('h', 'x', 1)
+        self.assertEqual(3, len(pipe))
+        self.assertRaises(ResponseError, pipe.execute)
+        self.assertEqual('1', self.conn.hget('h', 'x'))
+
+        pipe.get('a')
+        pipe.sadd('a', 1)
+        result = pipe.execute(raise_on_error=False)
+        self.assertEqual('1', result[0])
+        self.assertIsInstance(result[1], ResponseError)
+        self.assertEqual(0, len(pipe))
+
+    def test_pipeline_unexpected_error(self):
+        pipe = self.conn.pipeline()
+        pipe.set('a', 1)
+        pipe.expire('a', 'soon')
+        pipe.set('b', 2)
+        self.assertRaises(ValueError, pipe.execute, raise_on_error=False)
+        self.assertEqual(['1', '2'], self.conn.mget(['a', 'b']))
+
+    def test_scripts(self):
+        script = rom._COPY_KEY_SCRIPT
+        self.assertEqual(script.script_hash,
+                self.conn.script_load(script.script_body))
+
+        self.conn.hset('h', 'x', 1)
+        rom.copy_key(self.conn, 'h', 'h2')
+        self.conn.hset('h', 'x', 2)
+        self.assertEqual({'x': '1'}, self.conn.hgetall('h2'))
+
+        unknown = 'return 1'
+        self.assertRaises(rom.ScriptUnavailableError, self.conn.script_load,
+                unknown)
+        self.assertRaises(NoScriptError, self.conn.evalsha, 'abc', 0)
+        self.assertRaises(ResponseError, self.conn.eval, unknown, 0)
+
+    def test_load_scripts(self):
+        with mock.patch.object(rom, '_SCRIPTS', [rom._COPY_KEY_SCRIPT]):
+            self.assertEqual(1, rom.load_scripts(self.conn))
+
+            rom.Script('return 2')
+            self.assertRaises(rom.ScriptUnavailableError, rom.load_scripts,
+                    self.conn)
+
+
+class JoinAction(BarrierActionBase):
+    def execute(self, net, color_descriptor, active_tokens,
+            service_interfaces):
+        data = net.token(head(active_tokens)).data.value
+        new_token = net.create_token(color_descriptor.color,
+                color_descriptor.group.idx, data=data)
+        return [new_token], defer.succeed(None)
+
+
+class TestMemoryStorageWorkflow(unittest.TestCase):
+    def setUp(self):
+        self.conn = MemoryStorage()
+
+        patcher = mock.patch('flow.brokers.local.reactor')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.broker = LocalBroker(bindings={
+            'create_token_x': {'create_token_q': ['create_token_rk']},
+            'notify_place_x': {'notify_place_q': ['notify_place_rk']},
+            'notify_transition_x': {'notify_transition_q':
+                ['notify_transition_rk']},
+        }, concurrency=1)
+        self.orchestrator = OrchestratorServiceInterface(broker=self.broker,
+                create_token_exchange='create_token_x',
+                create_token_routing_key='create_token_rk',
+                notify_place_exchange='notify_place_x',
+                notify_place_routing_key='notify_place_rk',
+                notify_transition_exchange='notify_transition_x',
+                notify_transition_routing_key='notify_transition_rk')
+
+        topology_cache = TopologyCache(storage=self.conn, max_size=10)
+        for handler_class, queue_name in [
+                (PetriCreateTokenHandler, 'create_token_q'),
+                (PetriNotifyPlaceHandler, 'notify_place_q'),
+                (PetriNotifyTransitionHandler, 'notify_transition_q')]:
+            self.broker.register_handler(handler_class(redis=self.conn,
+                service_interfaces={'orchestrator': self.orchestrator},
+                queue_name=queue_name, short_circuit_depth=0,
+                short_circuit_budget=0, topology_cache=topology_cache,
+                storage_threads=StorageThreads(size=0)))
+
+        self.build_workflow()
+
+    def build_workflow(self, barrier_join=False):
+        self.future_net = future.FutureNet('workflow')
+        self.start = self.future_net.add_place('start')
+        self.end = self.future_net.add_place('end')
+
+        split = self.future_net.add_basic_transition('split')
+        split.add_arc_in(self.start)
+        if barrier_join:
+            # the branches become gather places
+            join = self.future_net.add_barrier_transition('join',
+                    action=future.FutureAction(JoinAction))
+        else:
+            join = self.future_net.add_basic_transition('join')
+        join.add_arc_out(self.end)
+        for i in xrange(2):
+            place = self.future_net.add_place('branch %d' % i)
+            split.add_arc_out(place)
+            join.add_arc_in(place)
+
+    def run_workflow(self, builder):
+        net = builder.store(self.future_net, {}, {})
+        cg = net.add_color_group(1)
+
+        self.orchestrator.create_token(net.key,
+                builder.future_places[self.start], cg.begin, cg.idx,
+                data={'x': 1})
+        listen_deferred = self.broker.listen()
+        self.assertTrue(listen_deferred.called)
+
+        marking = net.color_marking.value
+        self.assertEqual([net.marking_key(cg.begin,
+            builder.future_places[self.end])], marking.keys())
+        token = net.token(marking.values()[0])
+        self.assertEqual({'x': 1}, token.data.value)
+
+    def test_builder(self):
+        self.run_workflow(Builder(self.conn))
+
+    def test_compact_builder(self):
+        self.run_workflow(CompactBuilder(self.conn))
+
+    def test_gather(self):
+        self.build_workflow(barrier_join=True)
+        self.run_workflow(Builder(self.conn))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 from flow.redisom import NotInRedisError
-from test_helpers.fakeredistest import FakeRedisTest
+from test_helpers.fakeredistest import FakeRedisAdapter, FakeRedisTest
 
 import flow.redisom as rom
+import mock
 import os
 import unittest
 
@@ -23,11 +24,22 @@ class SimpleObj(rom.Object):
         return arg
 
 
+class ScriptObj(rom.Object):
+    count = rom.Property(rom.Int)
+    touch = rom.Script("return 0")
+
+
 class OtherObj(rom.Object):
     """Used to test what happens getting an object of the wrong type"""
     pass
 
 
+class PackedObj(rom.Object):
+    name = rom.Property(rom.StringField)
+    count = rom.Property(rom.IntField)
+    ahash = rom.Property(rom.Hash)
+
+
 class TestEncoders(FakeRedisTest):
     def test_json_enc_dec(self):
         self.assertEqual('null', rom.json_enc(None))
@@ -507,6 +519,18 @@ class TestHash(FakeRedisTest):
         seen = dict((k, v) for k, v in self.h.iteritems())
         self.assertEqual(native, seen)
 
+    def test_scan(self):
+        h = rom.Hash(connection=self.conn, key="h", value_encoder=int,
+                value_decoder=int)
+        h.value = {"a:1": 1, "b:1": 2, "a:2": 3}
+
+        seen = {}
+        cursor = None
+        while cursor != 0:
+            cursor, page = h.scan(cursor or 0, match="a:*", count=1)
+            seen.update(page)
+        self.assertEqual({"a:1": 1, "a:2": 3}, seen)
+
     def test_json_encoding(self):
         h = rom.Hash(connection=self.conn, key="h",
                      value_encoder=rom.json_enc,
@@ -715,6 +739,113 @@ class TestObject(FakeRedisTest):
         # redis quirk: smembers returns list([]) when fetching an empty list
         self.assertEqual(0, self.conn.llen(key))
 
+    def test_associated_iterkeys(self):
+        obj = SimpleObj(connection=self.conn, key="x")
+        keys = list(obj.associated_iterkeys())
+        self.assertEqual("x", keys[-1])
+        self.assertEqual(sorted(SimpleObj.property_keys("x")),
+                sorted(keys[:-1]))
+        self.assertIn(obj.ascalar.key, keys)
+
+    def test_unlink_falls_back_to_delete(self):
+        conn = mock.Mock()
+        conn.execute_command.side_effect = rom.redis.exceptions.ResponseError(
+                "unknown command 'UNLINK'")
+        rom.unlink(conn, 'a', 'b')
+        conn.delete.assert_called_once_with('a', 'b')
+
+        conn.execute_command.side_effect = rom.redis.exceptions.ResponseError(
+                "WRONGTYPE")
+        self.assertRaises(rom.redis.exceptions.ResponseError,
+                rom.unlink, conn, 'a')
+
+    def test_load(self):
+        obj = SimpleObj.create(connection=self.conn, key="x", ascalar="hi",
+                ahash={'a': 'b'}, alist=['1', '2'], aset=['z'])
+        timestamp = obj.atimestamp.setnx()
+
+        obj_ref = SimpleObj(connection=self.conn, key="x")
+        self.assertIs(obj_ref, obj_ref.load())
+        self.conn.flushall()
+
+        self.assertEqual("hi", obj_ref.ascalar.value)
+        self.assertEqual({'a': 'b'}, obj_ref.ahash.value)
+        self.assertEqual(['1', '2'], obj_ref.alist.value)
+        self.assertEqual(set(['z']), obj_ref.aset.value)
+        self.assertEqual(timestamp, obj_ref.atimestamp.value)
+        self.assertRaises(NotInRedisError, getattr,
+                obj_ref.a_method_arg, 'value')
+
+        obj_ref.ascalar = "bye"
+        self.assertEqual("bye", obj_ref.ascalar.value)
+
+    def test_load_props(self):
+        SimpleObj.create(connection=self.conn, key="x", ascalar="hi",
+                alist=['1'])
+        obj = SimpleObj(connection=self.conn, key="x").load(['ascalar'])
+
+        self.conn.set(obj.ascalar.key, "bye")
+        self.conn.rpush(obj.alist.key, '2')
+        self.assertEqual("hi", obj.ascalar.value)
+        self.assertEqual(['1', '2'], obj.alist.value)
+
+        self.assertRaises(AttributeError, obj.load, ['key'])
+
+    def test_writes_clear_loaded_values(self):
+        obj = SimpleObj.create(connection=self.conn, key="x", ahash={'a': 1},
+                alist=['1'], aset=['z'])
+        obj.load()
+
+        obj.ahash['b'] = 2
+        obj.alist.append('2')
+        obj.aset.add('y')
+        self.assertEqual({'a': '1', 'b': '2'}, obj.ahash.value)
+        self.assertEqual(['1', '2'], obj.alist.value)
+        self.assertEqual(set(['y', 'z']), obj.aset.value)
+
+        obj.load()
+        obj.ahash.update({'c': 3})
+        obj.aset.discard('z')
+        self.assertEqual('3', obj.ahash.value['c'])
+        self.assertEqual(set(['y']), obj.aset.value)
+
+    def test_scripts_clear_loaded_values(self):
+        obj = ScriptObj.create(connection=self.conn, key="x", count=1)
+        obj.load()
+        self.assertEqual(2, obj.count.incr())
+        self.assertEqual(2, obj.count.value)
+
+        obj.load()
+        self.conn.set(obj.count.key, 5)
+        with mock.patch.object(rom.Script, '__call__') as call:
+            obj.touch(keys=[obj.count.key])
+            call.assert_called_once_with(obj.connection,
+                    keys=[obj.count.key], args=[])
+        self.assertEqual(5, obj.count.value)
+
+    def test_bulk_get(self):
+        objs = [SimpleObj.create(connection=self.conn, key=str(i),
+                ascalar=i) for i in xrange(3)]
+        refs = [SimpleObj(connection=self.conn, key=o.key) for o in objs]
+
+        self.assertEqual(refs, rom.bulk_get(iter(refs), ['ascalar']))
+        self.conn.flushall()
+        self.assertEqual(['0', '1', '2'], [r.ascalar.value for r in refs])
+        self.assertEqual([], rom.bulk_get([]))
+
+    def test_bulk_get_missing_only(self):
+        objs = [SimpleObj.create(connection=self.conn, key=str(i),
+                ascalar=i) for i in xrange(2)]
+        refs = [SimpleObj(connection=self.conn, key=objs[0].key),
+                SimpleObj(connection=self.conn, key=objs[1].key).loaded(
+                    ascalar='loaded')]
+
+        rom.bulk_get(refs, ['ascalar'], missing_only=True)
+        self.assertEqual(['0', 'loaded'], [r.ascalar.value for r in refs])
+
+        rom.bulk_get(refs, ['ascalar'])
+        self.assertEqual(['0', '1'], [r.ascalar.value for r in refs])
+
     def test_class_not_loaded_in_specified_module(self):
         class_info = 'unit_tests:LoadableObj'
         self.conn.set('y', class_info)
@@ -724,5 +855,163 @@ class TestObject(FakeRedisTest):
         self.assertRaises(ImportError, rom.Object.get_class, class_info)
 
 
+class TestPackedObject(FakeRedisTest):
+    def test_create(self):
+        obj = PackedObj.create(connection=self.conn, key="x", name="n",
+                count=3, ahash={'a': 'b'})
+        self.assertEqual(['x', 'x|ahash'], sorted(self.conn.keys()))
+        self.assertEqual({rom.CLASS_INFO_FIELD: PackedObj._info,
+            'name': 'n', 'count': '3'}, self.conn.hgetall('x'))
+
+        obj = PackedObj(connection=self.conn, key="x")
+        self.assertTrue(obj.exists())
+        self.assertEqual("n", obj.name.value)
+        self.assertEqual(3, obj.count.value)
+        self.assertEqual(['x|ahash'], PackedObj.property_keys('x'))
+
+    def test_field_operations(self):
+        obj = PackedObj.create(connection=self.conn, key="x", count=3)
+        self.assertEqual(5, obj.count.incr(2))
+        self.assertEqual(4, obj.count.decr())
+        self.assertFalse(obj.count.setnx(7))
+        self.assertTrue(obj.name.setnx('n'))
+
+        obj.count.delete()
+        self.assertRaises(NotInRedisError, getattr, obj.count, 'value')
+
+        obj.name.copy('y')
+        self.assertEqual({'name': 'n'}, self.conn.hgetall('y'))
+
+    def test_load_and_loaded(self):
+        obj = PackedObj.create(connection=self.conn, key="x", name="n",
+                count=3)
+        obj.load()
+        self.conn.flushall()
+        self.assertEqual(3, obj.count.value)
+
+        obj = PackedObj(connection=self.conn, key="x").loaded(count=9)
+        self.assertEqual(9, obj.count.value)
+
+    def test_delete(self):
+        obj = PackedObj.create(connection=self.conn, key="x", name="n",
+                ahash={'a': 'b'})
+        obj.delete()
+        self.assertEqual([], self.conn.keys())
+
+
+class TestShardedConnection(FakeRedisTest):
+    def setUp(self):
+        FakeRedisTest.setUp(self)
+        self.shards = [FakeRedisAdapter(singleton=False) for i in xrange(4)]
+        self.conn = rom.ShardedConnection(self.shards)
+
+    def tearDown(self):
+        for shard in self.shards:
+            shard.flushall()
+
+    def test_connection_for(self):
+        shard = self.conn.connection_for('net')
+        self.assertIn(shard, self.shards)
+        self.assertIs(shard, self.conn.connection_for('net|t|0'))
+        self.assertIs(shard, rom.connection_for(self.conn, 'net|t|0|data'))
+
+        used = set(id(self.conn.connection_for(str(i))) for i in xrange(50))
+        self.assertEqual(4, len(used))
+
+        self.assertIs(self.shards[0], rom.connection_for(self.shards[0], 'x'))
+        self.assertRaises(TypeError, rom.ShardedConnection, [])
+
+    def test_objects(self):
+        for i in xrange(10):
+            SimpleObj.create(connection=self.conn, key=str(i), ascalar=i)
+            SimpleObj.create(connection=self.conn, key='%d|child' % i)
+
+        for i in xrange(10):
+            shard = self.conn.connection_for(str(i))
+            obj = rom.get_object(self.conn, str(i))
+            self.assertIs(shard, obj.connection)
+            self.assertEqual(str(i), obj.ascalar.value)
+            self.assertTrue(shard.exists('%d|child' % i))
+
+            objs = rom.get_objects(self.conn, [str(i), '%d|child' % i])
+            self.assertEqual([shard, shard], [o.connection for o in objs])
+
+        self.assertEqual([], rom.get_objects(self.conn, []))
+
+    def test_bulk_get(self):
+        objs = [SimpleObj.create(connection=self.conn, key=str(i), ascalar=i)
+                for i in xrange(10)]
+        self.assertGreater(len(set(id(o.connection) for o in objs)), 1)
+
+        rom.bulk_get(objs, ['ascalar'])
+        for shard in self.shards:
+            shard.flushall()
+        self.assertEqual([str(i) for i in xrange(10)],
+                [o.ascalar.value for o in objs])
+
+    def test_hash_tagged_keys(self):
+        key = '{net}|t|0'
+        self.assertIs(self.conn.connection_for('{net}'),
+                self.conn.connection_for(key))
+        self.assertIs(self.conn.connection_for('net'),
+                self.conn.connection_for(key))
+
+    def test_load_scripts(self):
+        shards = [mock.Mock(), mock.Mock()]
+        for shard in shards:
+            pipe = shard.pipeline.return_value
+            pipe.execute.side_effect = lambda raise_on_error, pipe=pipe: [
+                    'sha'] * len(pipe.script_load.call_args_list)
+
+        num_loaded = rom.load_scripts(rom.ShardedConnection(shards))
+
+        bodies = set(s.script_body for s in rom._SCRIPTS)
+        self.assertEqual(len(bodies) * len(shards), num_loaded)
+        for shard in shards:
+            pipe = shard.pipeline.return_value
+            self.assertEqual(bodies, set(c[0][0]
+                for c in pipe.script_load.call_args_list))
+
+
+class TestHashTags(unittest.TestCase):
+    def test_hash_tag(self):
+        self.assertEqual('net', rom.hash_tag('net'))
+
+        rom.use_hash_tags()
+        self.addCleanup(rom.use_hash_tags, False)
+        self.assertEqual('{net}', rom.hash_tag('net'))
+
+    def test_key_tag(self):
+        self.assertEqual('net', rom.key_tag('{net}|t|0'))
+        self.assertEqual('net', rom.key_tag('a{net}b|c'))
+        self.assertEqual('net', rom.key_tag('net|t|0'))
+        self.assertEqual('{}', rom.key_tag('{}|x|y'))
+        self.assertEqual('|x|y', rom.key_tag('|x|y'))
+
+
+class TestDeferredWriteSession(FakeRedisTest):
+    def test_create_deferred(self):
+        session = rom.DeferredWriteSession(self.conn)
+        obj = SimpleObj.create(connection=session, key="x", ascalar="hi",
+                ahash={'a': 'b'}, alist=['1', '2'], aset=['3'])
+        obj.ahash.setnx('c', 'd')
+        self.assertEqual([], self.conn.keys())
+
+        session.flush()
+
+        obj = SimpleObj(connection=self.conn, key="x")
+        self.assertTrue(obj.exists())
+        self.assertEqual("hi", obj.ascalar.value)
+        self.assertEqual({'a': 'b', 'c': 'd'}, obj.ahash.value)
+        self.assertEqual(['1', '2'], obj.alist.value)
+        self.assertEqual(set(['3']), obj.aset.value)
+
+    def test_reads_refused(self):
+        session = rom.DeferredWriteSession(self.conn)
+        obj = SimpleObj(connection=session, key="x")
+        self.assertRaises(TypeError, getattr, obj.ascalar, 'value')
+        self.assertRaises(TypeError, len, obj.ahash)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,27 @@
+from flow.util.defer import gather
+from twisted.internet import defer
+
+import unittest
+
+
+class GatherTest(unittest.TestCase):
+    def test_results(self):
+        results = []
+        gather([defer.succeed(1), defer.succeed(2)]).addCallback(
+                results.append)
+        self.assertEqual([[(True, 1), (True, 2)]], results)
+
+    def test_first_failure(self):
+        pending = defer.Deferred()
+        errors = []
+        gather([pending, defer.fail(RuntimeError('first'))]).addErrback(
+                errors.append)
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0].value, RuntimeError)
+
+        # later failures are consumed
+        pending.errback(ValueError())
+
+
+if __name__ == "__main__":
+    unittest.main()